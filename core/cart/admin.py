@@ -1,29 +1,96 @@
+from datetime import timedelta
+
 from django.contrib import admin
+from django.db.models import DecimalField, F, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
 from .models import Cart, CartItem
 
 
 class CartItemInline(admin.TabularInline):
     model = CartItem
     extra = 1
+    raw_id_fields = ("product",)
+
+
+class CartValueFilter(admin.SimpleListFilter):
+    title = "total price"
+    parameter_name = "value_over"
+
+    def lookups(self, request, model_admin):
+        return [
+            ("50", "Over $50"),
+            ("100", "Over $100"),
+            ("500", "Over $500"),
+            ("1000", "Over $1000"),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(_total_price__gt=self.value())
+        return queryset
+
+
+class StaleCartFilter(admin.SimpleListFilter):
+    title = "last updated"
+    parameter_name = "stale_for"
+
+    def lookups(self, request, model_admin):
+        return [
+            ("7", "Untouched for 7+ days"),
+            ("30", "Untouched for 30+ days"),
+            ("90", "Untouched for 90+ days"),
+        ]
+
+    def queryset(self, request, queryset):
+        if self.value():
+            cutoff = timezone.now() - timedelta(days=int(self.value()))
+            return queryset.filter(updated_at__lt=cutoff)
+        return queryset
 
 
 class CartAdmin(admin.ModelAdmin):
     list_display = ("user", "created_at", "updated_at", "total_items", "total_price")
+    list_select_related = ("user",)
+    list_filter = (CartValueFilter, StaleCartFilter)
+    search_fields = ("user__email",)
     inlines = [CartItemInline]
 
+    def get_queryset(self, request):
+        # Totals are computed by the database, not per row in Python.
+        return (
+            super()
+            .get_queryset(request)
+            .annotate(
+                _total_items=Coalesce(Sum("items__quantity"), 0),
+                _total_price=Coalesce(
+                    Sum(
+                        F("items__product__price") * F("items__quantity"),
+                        output_field=DecimalField(max_digits=12, decimal_places=2),
+                    ),
+                    0,
+                    output_field=DecimalField(max_digits=12, decimal_places=2),
+                ),
+            )
+        )
+
     def total_items(self, obj):
-        return obj.total_items()
+        return obj._total_items
 
     total_items.short_description = "Total Items"
+    total_items.admin_order_field = "_total_items"
 
     def total_price(self, obj):
-        return obj.total_price()
+        return obj._total_price
 
     total_price.short_description = "Total Price"
+    total_price.admin_order_field = "_total_price"
 
 
 class CartItemAdmin(admin.ModelAdmin):
     list_display = ("cart", "product", "quantity", "subtotal")
+    list_select_related = ("cart__user", "product")
+    raw_id_fields = ("cart", "product")
 
     def subtotal(self, obj):
         return obj.subtotal()
@@ -1,84 +1,290 @@
+from decimal import Decimal
+from uuid import uuid4
+
+from django.db import transaction
+from django.utils import timezone
+
+from shop import pricing
 from shop.models import Product
+from shop.promotions import promotion_engine
 from cart.models import Cart, CartItem
-from django.core.exceptions import ObjectDoesNotExist
+from cart.write_behind import cart_write_behind
+from cart import reservations
+
+BATCH_OPERATIONS = ("add", "update", "remove")
+
+# Most units of one product a cart can hold.
+MAX_QUANTITY = 999
+
+
+class InsufficientStockError(Exception):
+    """Raised when a batch of cart operations can't be held in full."""
+
+    def __init__(self, requested, available):
+        # Both {product_id: quantity}, for the products that fell short.
+        self.requested = requested
+        self.available = available
+        super().__init__("Not enough stock.")
 
 
 class CartSession:
     def __init__(self, session):
         self.session = session
-        self._cart = self.session.setdefault("cart", {"items": []})
+        # Don't write an empty cart into the session until it is saved, so
+        # visitors who never use the cart don't get a session row.
+        cart = self.session.get("cart")
+        if cart is None:
+            cart = {"items": [], "total_quantity": 0, "total_price": "0.00"}
+        self._cart = cart
+        self._products = {}
+        self._cart_items = None
+        self._promotions = None
 
-    def add_product(self, product_id, quantity=1):
+    def add_product(self, product_id, quantity=1, commit=True):
         product_id = int(product_id)
         quantity = int(quantity)
-        try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
-            return
+        product = self._products.get(product_id)
+        if product is None:
+            try:
+                product = Product.objects.get(id=product_id)
+            except Product.DoesNotExist:
+                return
+            self._products[product_id] = product
 
         quantity = max(1, min(quantity, product.stock))
+        price = str(product.get_price())
 
         for item in self._cart["items"]:
             if item["product_id"] == product_id:
-                item["quantity"] = min(item["quantity"] + quantity, product.stock)
+                target = min(item["quantity"] + quantity, product.stock)
+                item["quantity"] = self._reserve(product_id, target) or item["quantity"]
+                item["price"] = price
                 break
         else:
-            self._cart["items"].append({"product_id": product_id, "quantity": quantity})
+            quantity = self._reserve(product_id, quantity)
+            if not quantity:
+                return
+            self._cart["items"].append(
+                {"product_id": product_id, "quantity": quantity, "price": price}
+            )
 
-        self.save()
+        if commit:
+            self.save()
 
-    def update_product_quantity(self, product_id, quantity):
+    def update_product_quantity(self, product_id, quantity, commit=True):
         product_id = int(product_id)
-        quantity = int(quantity)
+        quantity = min(int(quantity), MAX_QUANTITY)
         for item in self._cart["items"]:
             if item["product_id"] == product_id:
                 if quantity > 0:
-                    item["quantity"] = quantity
+                    item["quantity"] = (
+                        self._reserve(product_id, quantity) or item["quantity"]
+                    )
                 else:
                     self._cart["items"].remove(item)
+                    self._release([product_id])
                 break
-        self.save()
+        if commit:
+            self.save()
 
-    def remove_product(self, product_id):
+    def remove_product(self, product_id, commit=True):
         product_id = int(product_id)
         self._cart["items"] = [
             item for item in self._cart["items"] if item["product_id"] != product_id
         ]
+        self._release([product_id])
+        if commit:
+            self.save()
+
+    def apply_operations(self, operations, products):
+        """
+        Apply a batch of validated operations, all or nothing, and save the
+        cart once. The resulting quantities are computed first and every
+        changed hold is set with one ``reserve_many`` call; if any product
+        can't be held in full, the holds are rolled back, the cart is left
+        unchanged and InsufficientStockError is raised. Quantities are
+        capped at MAX_QUANTITY.
+        :param operations: list of {"op", "product_id", "quantity"} dicts,
+            where op is one of BATCH_OPERATIONS.
+        :param products: {product_id: Product} map covering every add and
+            update operation.
+        """
+        self._products.update(products)
+        current = self.get_session_quantities()
+        quantities = dict(current)
+        for operation in operations:
+            op = operation["op"]
+            product_id = operation["product_id"]
+            if op == "add":
+                quantities[product_id] = quantities.get(product_id, 0) + max(
+                    operation["quantity"], 1
+                )
+            elif op == "update" and product_id in quantities:
+                quantities[product_id] = max(operation["quantity"], 0)
+            elif op == "remove" and product_id in quantities:
+                quantities[product_id] = 0
+            if product_id in quantities:
+                quantities[product_id] = min(quantities[product_id], MAX_QUANTITY)
+        changes = {
+            product_id: quantity
+            for product_id, quantity in quantities.items()
+            if quantity != current.get(product_id)
+        }
+
+        with transaction.atomic():
+            held = self._reserve_many(changes)
+            shortages = {
+                product_id: held[product_id]
+                for product_id, quantity in changes.items()
+                if held[product_id] < quantity
+            }
+            if shortages:
+                raise InsufficientStockError(
+                    {product_id: changes[product_id] for product_id in shortages},
+                    shortages,
+                )
+
+        items = {item["product_id"]: item for item in self._cart["items"]}
+        for product_id, quantity in changes.items():
+            item = items.get(product_id)
+            if item is None:
+                item = items[product_id] = {"product_id": product_id}
+            item["quantity"] = quantity
+            if quantity:
+                item["price"] = str(self._products[product_id].get_price())
+        self._cart["items"] = [item for item in items.values() if item["quantity"]]
         self.save()
 
     def clear(self):
+        self._release()
         self._cart = self.session["cart"] = {"items": []}
         self.save()
 
+    def _reserve(self, product_id, quantity):
+        """Hold ``quantity`` units for this cart; returns the quantity held."""
+        token = self._cart.setdefault("token", uuid4().hex)
+        return reservations.reserve(token, product_id, quantity)
+
+    def _reserve_many(self, quantities):
+        """Hold {product_id: quantity} for this cart; returns the quantities held."""
+        if not quantities:
+            return {}
+        token = self._cart.setdefault("token", uuid4().hex)
+        return reservations.reserve_many(token, quantities)
+
+    def _release(self, product_ids=None):
+        token = self._cart.get("token")
+        if token:
+            reservations.release(token, product_ids)
+
     def save(self):
+        self._update_summary()
+        self.session["cart"] = self._cart
         self.session.modified = True
+        self._cart_items = None
+        self._promotions = None
+
+    def _update_summary(self):
+        """
+        Keep a running quantity/price summary in the session cart so the
+        header badge can be rendered without touching the database.
+        """
+        items = self._cart["items"]
+        self._cart["total_quantity"] = sum(item["quantity"] for item in items)
+        self._cart["total_price"] = str(
+            sum(
+                (Decimal(item.get("price", 0)) * item["quantity"] for item in items),
+                Decimal("0.00"),
+            )
+        )
+
+    def get_session_total_quantity(self):
+        """Total quantity from the session summary (no database queries)."""
+        if "total_quantity" not in self._cart:
+            self._update_summary()
+        return self._cart["total_quantity"]
+
+    def get_session_total_price(self):
+        """Total price from the session summary (no database queries)."""
+        if "total_price" not in self._cart:
+            self._update_summary()
+        return Decimal(self._cart["total_price"])
+
+    def get_product_quantity(self, product_id):
+        """Quantity of ``product_id`` in the cart (no database queries)."""
+        for item in self._cart["items"]:
+            if item["product_id"] == product_id:
+                return item["quantity"]
+        return 0
+
+    def get_products(self):
+        """
+        Return a {product_id: Product} map for the items in the cart.
+        Products not loaded yet are fetched together with one query and
+        kept for the rest of the request.
+        """
+        missing_ids = [
+            item["product_id"]
+            for item in self._cart["items"]
+            if item["product_id"] not in self._products
+        ]
+        if missing_ids:
+            self._products.update(Product.objects.in_bulk(missing_ids))
+        return self._products
 
     def get_cart_dict(self):
         """Raw session cart dict (without product objects)."""
         return self._cart
 
     def get_cart_items(self):
-        """Return enriched cart items (with product object + total_price)."""
-        items = []
-        for item in self._cart["items"]:
-            try:
-                product_obj = Product.objects.get(
-                    id=item["product_id"],
-                )
-                items.append(
-                    {
-                        "product_id": item["product_id"],
-                        "quantity": item["quantity"],
-                        "product_obj": product_obj,
-                        "total_price": item["quantity"] * product_obj.get_price(),
-                    }
+        """
+        Return enriched cart items (with product object, unit_price,
+        discount and total_price). Prices are computed for the whole cart in
+        one batch and the active promotions applied in one pass.
+        """
+        if self._cart_items is None:
+            products = self.get_products()
+            lines = [
+                (item, products[item["product_id"]])
+                for item in self._cart["items"]
+                if item["product_id"] in products
+            ]
+            prices = pricing.price_products(
+                (product for _, product in lines), pricing.configured_rules()
+            )
+            self._promotions = promotion_engine.apply(
+                (product_obj.pk, product_obj.brand_id, unit_price, item["quantity"])
+                for (item, product_obj), unit_price in zip(lines, prices)
+            )
+            self._cart_items = [
+                {
+                    "product_id": item["product_id"],
+                    "quantity": item["quantity"],
+                    "product_obj": product_obj,
+                    "unit_price": unit_price,
+                    "discount": discount,
+                    "total_price": item["quantity"] * unit_price - discount,
+                }
+                for (item, product_obj), unit_price, discount in zip(
+                    lines, prices, self._promotions.line_discounts
                 )
-            except ObjectDoesNotExist:
-                continue
-        return items
+            ]
+        return self._cart_items
+
+    def get_promotions(self):
+        """The PromotionResult of the cart (discounts and applied names)."""
+        self.get_cart_items()
+        return self._promotions
+
+    def get_cart_discount(self):
+        """Discount taken off the whole cart by threshold promotions."""
+        return self.get_promotions().cart_discount
 
     def get_total_payment_amount(self):
-        return sum(item["total_price"] for item in self.get_cart_items())
+        return (
+            sum(item["total_price"] for item in self.get_cart_items())
+            - self.get_cart_discount()
+        )
 
     def get_total_quantity(self):
         return sum(item["quantity"] for item in self.get_cart_items())
@@ -88,39 +294,102 @@ class CartSession:
         Load DB cart into session, but keep session priority.
         """
         cart, _ = Cart.objects.get_or_create(user=user)
-        db_items = CartItem.objects.filter(cart=cart)
+        db_items = CartItem.objects.filter(cart=cart).select_related("product")
 
         session_product_ids = {item["product_id"] for item in self._cart["items"]}
 
+        new_items = []
         for db_item in db_items:
-            if db_item.product.id not in session_product_ids:
-                self._cart["items"].append(
-                    {"product_id": db_item.product.id, "quantity": db_item.quantity}
-                )
+            self._products.setdefault(db_item.product_id, db_item.product)
+            if db_item.product_id not in session_product_ids:
+                new_items.append(db_item)
+
+        # Restored items need holds like added ones; keep only what is
+        # still available.
+        held = self._reserve_many(
+            {db_item.product_id: db_item.quantity for db_item in new_items}
+        )
+        new_items = [db_item for db_item in new_items if held[db_item.product_id]]
+        prices = pricing.price_products(
+            (db_item.product for db_item in new_items), pricing.configured_rules()
+        )
+        for db_item, price in zip(new_items, prices):
+            self._cart["items"].append(
+                {
+                    "product_id": db_item.product_id,
+                    "quantity": held[db_item.product_id],
+                    "price": str(price),
+                }
+            )
 
         self.merge_session_cart_in_db(user)
         self.save()
 
+    def get_session_quantities(self):
+        """Return the session cart as a {product_id: quantity} map."""
+        return {item["product_id"]: item["quantity"] for item in self._cart["items"]}
+
     def merge_session_cart_in_db(self, user):
         """
         Save session cart into DB (override DB quantities).
         """
-        cart, _ = Cart.objects.get_or_create(user=user)
+        save_cart_items_in_db(user.pk, self.get_session_quantities())
 
-        session_product_ids = []
-        for item in self._cart["items"]:
-            try:
-                product_obj = Product.objects.get(id=item["product_id"])
-            except ObjectDoesNotExist:
-                continue
+    def schedule_db_sync(self, user):
+        """
+        Persist the session cart for ``user``; queued for the background
+        writer when CART_WRITE_BEHIND is enabled, written right away otherwise.
+        """
+        if cart_write_behind.enabled:
+            cart_write_behind.enqueue(user.pk, self.get_session_quantities())
+        else:
+            self.merge_session_cart_in_db(user)
 
-            cart_item, _ = CartItem.objects.get_or_create(
-                cart=cart, product=product_obj
-            )
-            cart_item.quantity = item["quantity"]
-            cart_item.save()
-            session_product_ids.append(product_obj.id)
 
-        CartItem.objects.filter(cart=cart).exclude(
-            product__id__in=session_product_ids
-        ).delete()
+def save_cart_items_in_db(user_id, quantities):
+    """
+    Make the DB cart of ``user_id`` match ``quantities`` ({product_id: quantity}).
+    Only the differences with the stored rows are written, using bulk
+    operations inside a single transaction. Unknown products are skipped.
+    """
+    existing_ids = set(
+        Product.objects.filter(id__in=quantities).values_list("id", flat=True)
+    )
+    quantities = {
+        product_id: quantity
+        for product_id, quantity in quantities.items()
+        if product_id in existing_ids
+    }
+
+    with transaction.atomic():
+        cart, _ = Cart.objects.get_or_create(user_id=user_id)
+        db_items = {
+            cart_item.product_id: cart_item
+            for cart_item in CartItem.objects.filter(cart=cart)
+        }
+
+        to_create = []
+        to_update = []
+        for product_id, quantity in quantities.items():
+            cart_item = db_items.get(product_id)
+            if cart_item is None:
+                to_create.append(
+                    CartItem(cart=cart, product_id=product_id, quantity=quantity)
+                )
+            elif cart_item.quantity != quantity:
+                cart_item.quantity = quantity
+                to_update.append(cart_item)
+        to_delete = [
+            cart_item.pk
+            for product_id, cart_item in db_items.items()
+            if product_id not in quantities
+        ]
+
+        if to_create:
+            CartItem.objects.bulk_create(to_create)
+        if to_update:
+            CartItem.objects.bulk_update(to_update, ["quantity"])
+        if to_delete:
+            CartItem.objects.filter(pk__in=to_delete).delete()
+        if to_create or to_update or to_delete:
+            Cart.objects.filter(pk=cart.pk).update(updated_at=timezone.now())
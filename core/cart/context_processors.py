@@ -1,6 +1,9 @@
+from django.utils.functional import SimpleLazyObject
+
 from .cart import CartSession
 
 
 def cart_processor(request):
-    cart = CartSession(request.session)
+    # The session is only read when a template actually uses the cart.
+    cart = SimpleLazyObject(lambda: CartSession(request.session))
     return {"cart": cart}
@@ -0,0 +1,95 @@
+import time
+from datetime import timedelta
+
+from django.contrib.sessions.models import Session
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+
+from cart.models import Cart, CartItem
+
+
+class Command(BaseCommand):
+    help = "🧹 Delete expired sessions and carts untouched for N days, in small chunks"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=30,
+            help="Delete carts not updated for this many days.",
+        )
+        parser.add_argument(
+            "--chunk-size",
+            type=int,
+            default=1000,
+            help="Rows deleted per transaction.",
+        )
+        parser.add_argument(
+            "--sleep",
+            type=float,
+            default=0,
+            help="Seconds to pause between chunks to leave room for live traffic.",
+        )
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report how many rows would be deleted.",
+        )
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        cutoff = now - timedelta(days=options["days"])
+        self.chunk_size = options["chunk_size"]
+        self.pause = options["sleep"]
+
+        sessions = Session.objects.filter(expire_date__lt=now)
+        carts = Cart.objects.filter(updated_at__lt=cutoff)
+
+        if options["dry_run"]:
+            self.stdout.write(f"🔎 Expired sessions: {sessions.count()}")
+            self.stdout.write(f"🔎 Stale carts: {carts.count()}")
+            self.stdout.write(
+                f"🔎 Stale cart items: {CartItem.objects.filter(cart__in=carts).count()}"
+            )
+            return
+
+        self.purge("sessions", sessions, self.delete_sessions)
+        self.purge("carts", carts, self.delete_carts)
+
+    def purge(self, label, queryset, delete_chunk):
+        """Delete ``queryset`` in primary-key ordered chunks, one transaction each."""
+        started = time.monotonic()
+        deleted = 0
+        last_pk = None
+        while True:
+            chunk = queryset.order_by("pk")
+            if last_pk is not None:
+                chunk = chunk.filter(pk__gt=last_pk)
+            pks = list(chunk.values_list("pk", flat=True)[: self.chunk_size])
+            if not pks:
+                break
+            with transaction.atomic():
+                deleted += delete_chunk(queryset, pks)
+            last_pk = pks[-1]
+            if self.pause:
+                time.sleep(self.pause)
+
+        elapsed = time.monotonic() - started
+        rate = deleted / elapsed if elapsed else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Deleted {deleted} {label} rows in {elapsed:.2f}s ({rate:.0f} rows/sec)"
+            )
+        )
+
+    def delete_sessions(self, queryset, pks):
+        # Re-apply the filter so rows refreshed since the scan are kept.
+        count, _ = queryset.filter(pk__in=pks).delete()
+        return count
+
+    def delete_carts(self, queryset, pks):
+        pks = list(queryset.filter(pk__in=pks).values_list("pk", flat=True))
+        items, _ = CartItem.objects.filter(cart_id__in=pks).delete()
+        carts, _ = Cart.objects.filter(pk__in=pks).delete()
+        return items + carts
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cart.reservations import release_expired
+
+
+class Command(BaseCommand):
+    help = "⏳ Release expired cart stock reservations back to available stock"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=1000,
+            help="Number of holds released per transaction.",
+        )
+        parser.add_argument(
+            "--loop",
+            type=float,
+            default=0,
+            help="Keep running as a sweeper, sleeping this many seconds between runs.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        interval = options["loop"]
+
+        while True:
+            released = 0
+            while True:
+                count = release_expired(batch_size=batch_size)
+                released += count
+                if count < batch_size:
+                    break
+
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ Released {released} expired reservations.")
+            )
+            if not interval:
+                return
+            time.sleep(interval)
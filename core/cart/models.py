@@ -46,3 +46,26 @@ class CartItem(models.Model):
 
     def __str__(self):
         return f"{self.product.name} x {self.quantity}"
+
+
+class Reservation(models.Model):
+    """
+    A temporary hold on product stock for one cart, released once it expires.
+    ``token`` identifies the session cart that owns the hold.
+    """
+
+    token = models.CharField(max_length=32)
+    product = models.ForeignKey(
+        Product, on_delete=models.CASCADE, related_name="reservations"
+    )
+    quantity = models.PositiveIntegerField(default=0)
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("token", "product")
+        indexes = [
+            models.Index(fields=["expires_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.product.name} x {self.quantity} ({self.token})"
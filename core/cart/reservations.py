@@ -0,0 +1,153 @@
+"""
+Inventory reservations for cart items.
+
+Adding a product to a cart places an expiring hold on its stock. Holds are
+claimed with a conditional UPDATE on ``Product.reserved`` (no SELECT ... FOR
+UPDATE on the product row), so many carts can reserve the same hot product
+concurrently without lost updates or overselling. Expired holds are returned
+to stock in bulk by the ``release_expired_reservations`` command.
+"""
+
+from collections import defaultdict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from shop.models import Product
+from cart.models import Reservation
+
+CLAIM_ATTEMPTS = 3
+
+
+def get_reservation_ttl():
+    return timedelta(seconds=getattr(settings, "CART_RESERVATION_TTL", 15 * 60))
+
+
+def claim_stock(product_id, quantity):
+    """
+    Atomically move up to ``quantity`` units of a product from available
+    stock to reserved stock. Returns the number of units claimed.
+    """
+    for _ in range(CLAIM_ATTEMPTS):
+        if quantity <= 0:
+            return 0
+        claimed = Product.objects.filter(
+            pk=product_id, stock__gte=F("reserved") + quantity
+        ).update(reserved=F("reserved") + quantity)
+        if claimed:
+            return quantity
+        # Not enough stock for the full quantity: retry with what is left.
+        available = (
+            Product.objects.filter(pk=product_id)
+            .values_list("stock", "reserved")
+            .first()
+        )
+        if available is None:
+            return 0
+        stock, reserved = available
+        quantity = min(quantity, stock - reserved)
+    return 0
+
+
+def reserve(token, product_id, quantity):
+    """
+    Set the hold of cart ``token`` on ``product_id`` to ``quantity`` units
+    (or as many as are available) and refresh its expiry.
+    Returns the quantity actually held.
+    """
+    return reserve_many(token, {product_id: quantity})[product_id]
+
+
+def reserve_many(token, quantities):
+    """
+    Set the holds of cart ``token`` to ``quantities`` ({product_id: quantity},
+    as many units as are available) in one transaction, refreshing their
+    expiry. Returns {product_id: quantity held}.
+    """
+    if not quantities:
+        return {}
+    expires_at = timezone.now() + get_reservation_ttl()
+    new_ids = Product.objects.filter(
+        pk__in=[
+            product_id for product_id, quantity in quantities.items() if quantity > 0
+        ]
+    ).values_list("pk", flat=True)
+    with transaction.atomic():
+        # Insert the missing holds empty before locking them, so concurrent
+        # first holds of the same cart and product wait for each other
+        # instead of both inserting (and one failing on the unique key).
+        Reservation.objects.bulk_create(
+            [
+                Reservation(token=token, product_id=product_id, expires_at=expires_at)
+                for product_id in new_ids
+            ],
+            ignore_conflicts=True,
+        )
+        holds = Reservation.objects.select_for_update().filter(
+            token=token, product_id__in=quantities
+        )
+        held = {}
+        to_update = []
+        to_delete = []
+        for hold in holds:
+            delta = quantities[hold.product_id] - hold.quantity
+            if delta > 0:
+                delta = claim_stock(hold.product_id, delta)
+            elif delta < 0:
+                Product.objects.filter(pk=hold.product_id).update(
+                    reserved=F("reserved") + delta
+                )
+            hold.quantity += delta
+            hold.expires_at = expires_at
+            held[hold.product_id] = hold.quantity
+            if hold.quantity > 0:
+                to_update.append(hold)
+            else:
+                to_delete.append(hold.pk)
+
+        if to_update:
+            Reservation.objects.bulk_update(to_update, ["quantity", "expires_at"])
+        if to_delete:
+            Reservation.objects.filter(pk__in=to_delete).delete()
+    # Products deleted in the meantime have no hold.
+    return {product_id: held.get(product_id, 0) for product_id in quantities}
+
+
+def release(token, product_ids=None):
+    """Release the holds of cart ``token`` (optionally only for some products)."""
+    with transaction.atomic():
+        holds = Reservation.objects.select_for_update().filter(token=token)
+        if product_ids is not None:
+            holds = holds.filter(product_id__in=product_ids)
+        return _release_holds(list(holds))
+
+
+def release_expired(batch_size=1000, now=None):
+    """
+    Release one batch of expired holds. Returns the number of holds released;
+    call repeatedly until it returns 0.
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        holds = list(
+            Reservation.objects.select_for_update(skip_locked=True)
+            .filter(expires_at__lt=now)
+            .order_by("expires_at")[:batch_size]
+        )
+        return _release_holds(holds)
+
+
+def _release_holds(holds):
+    """Return the held units to stock (one UPDATE per product) and delete the holds."""
+    if not holds:
+        return 0
+    quantities = defaultdict(int)
+    for hold in holds:
+        quantities[hold.product_id] += hold.quantity
+    for product_id, quantity in quantities.items():
+        Product.objects.filter(pk=product_id).update(reserved=F("reserved") - quantity)
+    Reservation.objects.filter(pk__in=[hold.pk for hold in holds]).delete()
+    return len(holds)
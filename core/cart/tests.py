@@ -1,3 +1,203 @@
-from django.test import TestCase
+import io
+import json
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from shop.models import Category, Product
+from . import reservations
+from .cart import MAX_QUANTITY
+from .models import Cart, CartItem, Reservation
+from .write_behind import CartWriteBehind
+
+
+class SessionBatchUpdateTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Shoes")
+        self.boot = Product.objects.create(
+            name="Boot", category=category, price="10.00", stock=5
+        )
+        self.sandal = Product.objects.create(
+            name="Sandal", category=category, price="20.00", stock=1
+        )
+
+    def batch(self, operations):
+        return self.client.post(
+            reverse("cart:session-batch"),
+            json.dumps({"operations": operations}),
+            content_type="application/json",
+        )
+
+    def cart_quantities(self):
+        cart = self.client.session.get("cart", {"items": []})
+        return {item["product_id"]: item["quantity"] for item in cart["items"]}
+
+    def test_bad_payloads_are_rejected(self):
+        for operations in (
+            [],
+            [{"op": "buy", "product_id": self.boot.pk}],
+            [{"op": "add", "product_id": "boot"}],
+            [{"op": "add", "product_id": self.boot.pk, "quantity": 0}],
+            [{"op": "add", "product_id": self.boot.pk, "quantity": 10**30}],
+            [{"op": "update", "product_id": self.boot.pk, "quantity": -1}],
+            [{"op": "add", "product_id": self.boot.pk, "quantity": MAX_QUANTITY + 1}],
+        ):
+            with self.subTest(operations=operations):
+                self.assertEqual(self.batch(operations).status_code, 400)
+        response = self.client.post(
+            reverse("cart:session-batch"), "{", content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(self.cart_quantities(), {})
+
+    def test_adding_more_than_the_stock_is_a_conflict(self):
+        response = self.batch(
+            [{"op": "add", "product_id": self.boot.pk, "quantity": 6}]
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(
+            response.json()["products"],
+            [{"product_id": self.boot.pk, "requested": 6, "available": 5}],
+        )
+        self.assertEqual(self.cart_quantities(), {})
+        self.boot.refresh_from_db()
+        self.assertEqual(self.boot.reserved, 0)
+
+    def test_batch_is_all_or_nothing(self):
+        self.batch([{"op": "add", "product_id": self.boot.pk, "quantity": 2}])
+        response = self.batch(
+            [
+                {"op": "update", "product_id": self.boot.pk, "quantity": 4},
+                {"op": "add", "product_id": self.sandal.pk, "quantity": 2},
+            ]
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.cart_quantities(), {self.boot.pk: 2})
+        self.assertEqual(
+            list(Reservation.objects.values_list("product_id", "quantity")),
+            [(self.boot.pk, 2)],
+        )
+
+        response = self.batch(
+            [
+                {"op": "update", "product_id": self.boot.pk, "quantity": 4},
+                {"op": "add", "product_id": self.sandal.pk},
+            ]
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.cart_quantities(), {self.boot.pk: 4, self.sandal.pk: 1})
+        self.assertEqual(response.json()["total_price"], "60.00")
+
+
+@override_settings(CART_WRITE_BEHIND_INTERVAL=3600)
+class CartWriteBehindTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Shoes")
+        self.boot = Product.objects.create(
+            name="Boot", category=category, price="10.00"
+        )
+        self.user = get_user_model().objects.create_user(email="jane@example.com")
+        self.queue = CartWriteBehind()
+        self.addCleanup(self.queue.stop)
+
+    def db_quantities(self):
+        return dict(
+            CartItem.objects.filter(cart__user=self.user).values_list(
+                "product_id", "quantity"
+            )
+        )
+
+    def test_queued_carts_are_coalesced_until_flushed(self):
+        self.queue.enqueue(self.user.pk, {self.boot.pk: 1})
+        self.queue.enqueue(self.user.pk, {self.boot.pk: 3})
+        self.assertEqual(self.db_quantities(), {})
+
+        with CaptureQueriesContext(connection) as queries:
+            self.queue.flush()
+        writes = [q["sql"] for q in queries if 'INTO "cart_cartitem"' in q["sql"]]
+        self.assertEqual(len(writes), 1)
+        self.assertEqual(self.db_quantities(), {self.boot.pk: 3})
+
+    def test_discarded_carts_are_not_written(self):
+        self.queue.enqueue(self.user.pk, {self.boot.pk: 2})
+        self.queue.discard(self.user.pk)
+        self.queue.flush()
+        self.assertEqual(self.db_quantities(), {})
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Shoes")
+        self.boot = Product.objects.create(
+            name="Boot", category=category, price="10.00", stock=5
+        )
+        self.sandal = Product.objects.create(
+            name="Sandal", category=category, price="20.00", stock=3
+        )
+
+    def reserved(self, product):
+        product.refresh_from_db()
+        return product.reserved
+
+    def test_reserving_more_than_available_holds_what_is_left(self):
+        self.assertEqual(reservations.reserve("other", self.boot.pk, 2), 2)
+        self.assertEqual(reservations.reserve("cart", self.boot.pk, 10), 3)
+        self.assertEqual(self.reserved(self.boot), 5)
+        self.assertEqual(reservations.reserve("late", self.boot.pk, 1), 0)
+        self.assertFalse(Reservation.objects.filter(token="late").exists())
+
+    def test_reserving_again_sets_the_hold(self):
+        reservations.reserve("cart", self.boot.pk, 2)
+        self.assertEqual(reservations.reserve("cart", self.boot.pk, 4), 4)
+        self.assertEqual(self.reserved(self.boot), 4)
+        self.assertEqual(reservations.reserve("cart", self.boot.pk, 1), 1)
+        self.assertEqual(self.reserved(self.boot), 1)
+        self.assertEqual(Reservation.objects.get(token="cart").quantity, 1)
+
+    def test_reserve_many_holds_each_product_as_far_as_possible(self):
+        held = reservations.reserve_many("cart", {self.boot.pk: 2, self.sandal.pk: 10})
+        self.assertEqual(held, {self.boot.pk: 2, self.sandal.pk: 3})
+        self.assertEqual((self.reserved(self.boot), self.reserved(self.sandal)), (2, 3))
+
+    def test_release_returns_the_holds_to_stock(self):
+        reservations.reserve_many("cart", {self.boot.pk: 2, self.sandal.pk: 1})
+        reservations.release("cart", [self.boot.pk])
+        self.assertEqual((self.reserved(self.boot), self.reserved(self.sandal)), (0, 1))
+        reservations.release("cart")
+        self.assertEqual(self.reserved(self.sandal), 0)
+        self.assertFalse(Reservation.objects.exists())
+
+    def test_expired_holds_are_released(self):
+        reservations.reserve("old", self.boot.pk, 2)
+        Reservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        reservations.reserve("new", self.boot.pk, 1)
+
+        call_command("release_expired_reservations", stdout=io.StringIO())
+
+        self.assertEqual(
+            list(Reservation.objects.values_list("token", flat=True)), ["new"]
+        )
+        self.assertEqual(self.reserved(self.boot), 1)
+
+    def test_stale_carts_are_purged(self):
+        users = get_user_model().objects
+        stale = Cart.objects.create(user=users.create_user(email="old@example.com"))
+        fresh = Cart.objects.create(user=users.create_user(email="new@example.com"))
+        for cart in (stale, fresh):
+            CartItem.objects.create(cart=cart, product=self.boot, quantity=1)
+        Cart.objects.filter(pk=stale.pk).update(
+            updated_at=timezone.now() - timedelta(days=31)
+        )
+
+        call_command("purge_stale_carts", days=30, stdout=io.StringIO())
+
+        self.assertEqual(list(Cart.objects.all()), [fresh])
+        self.assertEqual(
+            list(CartItem.objects.values_list("cart", flat=True)), [fresh.pk]
+        )
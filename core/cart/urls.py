@@ -19,5 +19,10 @@ urlpatterns = [
         views.SessionUpdateProductQuantityView.as_view(),
         name="session-update-product-quantity",
     ),
+    path(
+        "session/batch/",
+        views.SessionBatchUpdateView.as_view(),
+        name="session-batch",
+    ),
     path("summary/", views.CartSummaryView.as_view(), name="cart"),
 ]
@@ -1,8 +1,9 @@
+import json
 from typing import Any
 from django.views.generic import View, TemplateView
 from django.http import JsonResponse
 from shop.models import Product
-from .cart import CartSession
+from .cart import CartSession, BATCH_OPERATIONS, MAX_QUANTITY, InsufficientStockError
 
 
 class SessionAddProductView(View):
@@ -12,14 +13,17 @@ class SessionAddProductView(View):
         product_id = request.POST.get("product_id")
         quantity = request.POST.get("quantity", 1)
 
-        if product_id and Product.objects.filter(id=product_id).exists():
+        if product_id:
             cart.add_product(product_id, quantity)
 
         if request.user.is_authenticated:
-            cart.merge_session_cart_in_db(request.user)
+            cart.schedule_db_sync(request.user)
 
         return JsonResponse(
-            {"cart": cart.get_cart_dict(), "total_quantity": cart.get_total_quantity()}
+            {
+                "cart": cart.get_cart_dict(),
+                "total_quantity": cart.get_session_total_quantity(),
+            }
         )
 
 
@@ -31,9 +35,12 @@ class SessionRemoveProductView(View):
         if product_id:
             cart.remove_product(product_id)
         if request.user.is_authenticated:
-            cart.merge_session_cart_in_db(request.user)
+            cart.schedule_db_sync(request.user)
         return JsonResponse(
-            {"cart": cart.get_cart_dict(), "total_quantity": cart.get_total_quantity()}
+            {
+                "cart": cart.get_cart_dict(),
+                "total_quantity": cart.get_session_total_quantity(),
+            }
         )
 
 
@@ -46,11 +53,110 @@ class SessionUpdateProductQuantityView(View):
         if product_id and quantity:
             cart.update_product_quantity(product_id, quantity)
         if request.user.is_authenticated:
-            cart.merge_session_cart_in_db(request.user)
+            cart.schedule_db_sync(request.user)
+        return JsonResponse(
+            {
+                "cart": cart.get_cart_dict(),
+                "total_quantity": cart.get_session_total_quantity(),
+            }
+        )
+
+
+class SessionBatchUpdateView(View):
+    """
+    Apply several cart operations in one request.
+
+    Expects a JSON body (or an ``operations`` form field holding JSON) like
+    ``{"operations": [{"op": "add", "product_id": 1, "quantity": 2}, ...]}``
+    with op one of add/update/remove; quantities go up to MAX_QUANTITY and
+    an update to 0 removes the product. The batch is all or nothing: the
+    products to add or update are validated with one query, their stock is
+    held in one transaction, and if anything fails the cart is unchanged.
+    Removing a product that no longer exists succeeds.
+    """
+
+    def post(self, request, *args, **kwargs):
+        try:
+            operations = self.parse_operations(request)
+        except ValueError as error:
+            return JsonResponse({"error": str(error)}, status=400)
+
+        product_ids = {
+            operation["product_id"]
+            for operation in operations
+            if operation["op"] != "remove"
+        }
+        products = Product.objects.in_bulk(product_ids)
+        missing_ids = sorted(product_ids - products.keys())
+        if missing_ids:
+            return JsonResponse(
+                {"error": "Unknown products.", "product_ids": missing_ids},
+                status=400,
+            )
+
+        cart = CartSession(request.session)
+        try:
+            cart.apply_operations(operations, products)
+        except InsufficientStockError as error:
+            return JsonResponse(
+                {
+                    "error": str(error),
+                    "products": [
+                        {
+                            "product_id": product_id,
+                            "requested": quantity,
+                            "available": error.available[product_id],
+                        }
+                        for product_id, quantity in error.requested.items()
+                    ],
+                },
+                status=409,
+            )
+        if request.user.is_authenticated:
+            cart.schedule_db_sync(request.user)
+
         return JsonResponse(
-            {"cart": cart.get_cart_dict(), "total_quantity": cart.get_total_quantity()}
+            {
+                "cart": cart.get_cart_dict(),
+                "total_quantity": cart.get_session_total_quantity(),
+                "total_price": str(cart.get_session_total_price()),
+            }
         )
 
+    def parse_operations(self, request):
+        """Return the cleaned operations list, raising ValueError if invalid."""
+        try:
+            if request.content_type == "application/json":
+                payload = json.loads(request.body)
+            else:
+                payload = {"operations": json.loads(request.POST.get("operations", ""))}
+        except json.JSONDecodeError:
+            raise ValueError("Invalid JSON.")
+
+        operations = payload.get("operations") if isinstance(payload, dict) else payload
+        if not isinstance(operations, list) or not operations:
+            raise ValueError("A non-empty list of operations is required.")
+
+        cleaned = []
+        for operation in operations:
+            if not isinstance(operation, dict):
+                raise ValueError("Each operation must be an object.")
+            op = operation.get("op")
+            if op not in BATCH_OPERATIONS:
+                raise ValueError(f"Unknown operation: {op!r}.")
+            try:
+                product_id = int(operation.get("product_id"))
+                quantity = int(operation.get("quantity", 1))
+            except (TypeError, ValueError):
+                raise ValueError("product_id and quantity must be integers.")
+            lowest = 0 if op == "update" else 1
+            if op != "remove" and not lowest <= quantity <= MAX_QUANTITY:
+                raise ValueError(
+                    f"quantity must be between {lowest} and {MAX_QUANTITY}."
+                )
+            cleaned.append({"op": op, "product_id": product_id, "quantity": quantity})
+        return cleaned
+
 
 class CartSummaryView(TemplateView):
     template_name = "cart/cart.html"
@@ -62,4 +168,5 @@ class CartSummaryView(TemplateView):
         context["cart_items"] = cart_items
         context["total_quantity"] = cart.get_total_quantity()
         context["total_payment_price"] = cart.get_total_payment_amount()
+        context["promotions"] = cart.get_promotions()
         return context
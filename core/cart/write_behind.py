@@ -0,0 +1,95 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class CartWriteBehind:
+    """
+    In-process write-behind queue for logged-in users' carts.
+
+    Cart views enqueue the latest session cart per user; repeated mutations
+    for the same user overwrite each other, so a burst of quantity clicks
+    results in a single DB write. A daemon thread flushes the queue every
+    ``interval`` seconds, and ``flush()`` forces it (at logout and at
+    process shutdown).
+    """
+
+    def __init__(self, interval=2.0):
+        self.interval = interval
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def enabled(self):
+        return getattr(settings, "CART_WRITE_BEHIND", False)
+
+    def enqueue(self, user_id, quantities):
+        with self._lock:
+            self._pending[user_id] = dict(quantities)
+            if self._thread is None:
+                self._start()
+
+    def discard(self, user_id):
+        """
+        Drop the pending cart of ``user_id``. A flush already writing it is
+        waited for, so no stale snapshot lands after the caller's own write.
+        """
+        with self._write_lock:
+            with self._lock:
+                self._pending.pop(user_id, None)
+
+    def flush(self, user_id=None):
+        """Write pending carts to the DB (all users, or only ``user_id``)."""
+        from cart.cart import save_cart_items_in_db
+
+        # Popping and writing happen under one lock, so a batch popped by one
+        # flush is written before another flush can pop a newer snapshot of
+        # the same cart; otherwise the older write could land last.
+        # Enqueueing only takes ``_lock`` and is never blocked by the writes.
+        with self._write_lock:
+            with self._lock:
+                if user_id is None:
+                    batch, self._pending = self._pending, {}
+                elif user_id in self._pending:
+                    batch = {user_id: self._pending.pop(user_id)}
+                else:
+                    return
+            for pending_user_id, quantities in batch.items():
+                try:
+                    save_cart_items_in_db(pending_user_id, quantities)
+                except Exception:
+                    logger.exception(
+                        "Failed to persist cart for user %s", pending_user_id
+                    )
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.interval * 2)
+        self.flush()
+
+    def _start(self):
+        self.interval = getattr(settings, "CART_WRITE_BEHIND_INTERVAL", self.interval)
+        self._thread = threading.Thread(
+            target=self._run, name="cart-write-behind", daemon=True
+        )
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.flush()
+            finally:
+                close_old_connections()
+
+
+cart_write_behind = CartWriteBehind()
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/4.2/ref/settings/
 """
 
 from pathlib import Path
+import json
 import os
 from dotenv import load_dotenv
 
@@ -46,6 +47,7 @@ INSTALLED_APPS = [
     "accounts.apps.AccountsConfig",
     "blog.apps.BlogConfig",
     "cart.apps.CartConfig",
+    "orders.apps.OrdersConfig",
     "shop.apps.ShopConfig",
     "website.apps.WebsiteConfig",
     "taggit",
@@ -95,6 +97,27 @@ DATABASES = {
 }
 
 
+# Cache
+# Shared by every process: the product grid/page caches, their catalog
+# version and the promotion version are only invalidated everywhere when all
+# workers (and management commands) use the same backend. Redis when
+# REDIS_URL is set, otherwise a database table (created by ``migrate``).
+if os.getenv("REDIS_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_URL"),
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.db.DatabaseCache",
+            "LOCATION": "django_cache",
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -138,6 +161,38 @@ STATICFILES_DIRS = [BASE_DIR / "assets"]
 MEDIA_URL = "media/"
 MEDIA_ROOT = "media/"
 
+# Cart persistence
+# When enabled, logged-in users' carts are written to the DB by a background
+# thread every CART_WRITE_BEHIND_INTERVAL seconds instead of on each request.
+CART_WRITE_BEHIND = os.getenv("CART_WRITE_BEHIND", "False") == "True"
+CART_WRITE_BEHIND_INTERVAL = float(os.getenv("CART_WRITE_BEHIND_INTERVAL", "2"))
+
+# Seconds a cart keeps its hold on product stock after the last change
+CART_RESERVATION_TTL = int(os.getenv("CART_RESERVATION_TTL", "900"))
+
+# Seconds before each process fully reloads its in-memory product facet index
+SHOP_FACET_INDEX_TTL = int(os.getenv("SHOP_FACET_INDEX_TTL", "300"))
+
+# Seconds a rendered product grid fragment stays in the cache
+SHOP_GRID_CACHE_TIMEOUT = int(os.getenv("SHOP_GRID_CACHE_TIMEOUT", "600"))
+
+# Seconds a rendered product page body stays in the cache
+SHOP_DETAIL_CACHE_TIMEOUT = int(os.getenv("SHOP_DETAIL_CACHE_TIMEOUT", "600"))
+
+# Seconds before each process fully reloads its in-memory typeahead index
+SHOP_TYPEAHEAD_INDEX_TTL = int(os.getenv("SHOP_TYPEAHEAD_INDEX_TTL", "600"))
+
+# Tax rate added to prices that include tax, unless a category has its own
+SHOP_TAX_RATE = os.getenv("SHOP_TAX_RATE", "0.10")
+
+# Per-category tax rates, as JSON: {"<category id>": "0.05"}
+SHOP_CATEGORY_TAX_RATES = json.loads(os.getenv("SHOP_CATEGORY_TAX_RATES", "{}"))
+
+# Standing brand discounts in every price, as JSON: {"<brand id>": "0.1"}
+# (below 1 a percentage, otherwise an amount off). Run rebuild_product_cards
+# after changing them.
+SHOP_BRAND_DISCOUNTS = json.loads(os.getenv("SHOP_BRAND_DISCOUNTS", "{}"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
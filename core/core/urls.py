@@ -26,6 +26,7 @@ urlpatterns = [
     path("accounts/", include("accounts.urls")),
     path("blog/", include("blog.urls")),
     path("cart/", include("cart.urls")),
+    path("orders/", include("orders.urls")),
     path("shop/", include("shop.urls")),
 ]
 
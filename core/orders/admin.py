@@ -0,0 +1,29 @@
+from django.contrib import admin
+from .models import Order, OrderItem
+
+
+class OrderItemInline(admin.TabularInline):
+    model = OrderItem
+    extra = 0
+    readonly_fields = ("product", "product_name", "unit_price", "quantity", "discount")
+
+
+class OrderAdmin(admin.ModelAdmin):
+    date_hierarchy = "created_at"
+    list_display = (
+        "id",
+        "email",
+        "user",
+        "total_quantity",
+        "total_price",
+        "discount",
+        "created_at",
+    )
+    list_select_related = ("user",)
+    search_fields = ("email", "first_name", "last_name", "idempotency_key")
+    list_filter = ("created_at",)
+    readonly_fields = ("idempotency_key", "created_at", "updated_at")
+    inlines = [OrderItemInline]
+
+
+admin.site.register(Order, OrderAdmin)
@@ -0,0 +1,142 @@
+"""
+Checkout pipeline: turns a CartSession into an Order.
+
+Stock for every line is decremented with a conditional ``F()`` UPDATE inside
+one transaction, so concurrent checkouts can never oversell. Lines are
+processed in product id order so concurrent transactions touching the same
+products always lock them in the same order and cannot deadlock.
+"""
+
+from uuid import uuid4
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from shop import catalog_sync, counters
+from shop.models import Product
+from cart.models import Reservation
+from .models import Order, OrderItem
+
+
+class CheckoutError(Exception):
+    """Raised when a cart cannot be turned into an order."""
+
+
+class OutOfStockError(CheckoutError):
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f"Not enough stock for {product.name}.")
+
+
+CHECKOUT_TOKEN_SESSION_KEY = "checkout_token"
+
+
+def get_checkout_token(session):
+    """The token identifying the orders placed from ``session``."""
+    token = session.get(CHECKOUT_TOKEN_SESSION_KEY)
+    if token is None:
+        token = session[CHECKOUT_TOKEN_SESSION_KEY] = uuid4().hex
+    return token
+
+
+def get_existing_order(idempotency_key, user=None, checkout_token=""):
+    """
+    The order already placed with ``idempotency_key``, or None. The key
+    comes from the client, so an order placed by another user or session
+    raises CheckoutError instead of being handed back.
+    """
+    order = Order.objects.filter(idempotency_key=idempotency_key).first()
+    if order is None:
+        return None
+    if user is not None and order.user_id == user.pk:
+        return order
+    if order.user_id is None and order.checkout_token == checkout_token:
+        return order
+    raise CheckoutError("This checkout form has expired, please try again.")
+
+
+def place_order(cart, idempotency_key, user=None, checkout_token="", **details):
+    """
+    Create an Order from ``cart`` for ``user`` (None for guests) and the
+    session identified by ``checkout_token``.
+    Returns (order, created); ``created`` is False when this customer
+    already placed an order with the same idempotency key, in which case
+    nothing is changed.
+    """
+    existing = get_existing_order(idempotency_key, user, checkout_token)
+    if existing:
+        return existing, False
+
+    lines = sorted(cart.get_cart_items(), key=lambda item: item["product_id"])
+    if not lines:
+        raise CheckoutError("Your cart is empty.")
+
+    token = cart.get_cart_dict().get("token")
+    try:
+        with transaction.atomic():
+            # Insert the order first: a concurrent retry with the same key
+            # fails here before touching any stock.
+            order = Order.objects.create(
+                user=user,
+                idempotency_key=idempotency_key,
+                checkout_token=checkout_token,
+                total_quantity=sum(line["quantity"] for line in lines),
+                total_price=cart.get_total_payment_amount(),
+                discount=cart.get_promotions().total_discount,
+                **details,
+            )
+            held = {}
+            if token:
+                held = dict(
+                    Reservation.objects.select_for_update()
+                    .filter(token=token)
+                    .values_list("product_id", "quantity")
+                )
+
+            for line in lines:
+                product = line["product_obj"]
+                quantity = line["quantity"]
+                own_hold = held.get(product.pk, 0)
+                # Units held by this cart count as available for it.
+                updated = Product.objects.filter(
+                    pk=product.pk,
+                    stock__gte=F("reserved") - own_hold + quantity,
+                ).update(
+                    stock=F("stock") - quantity,
+                    reserved=F("reserved") - own_hold,
+                    # Versions the cached product page (shown stock).
+                    updated_at=timezone.now(),
+                )
+                if not updated:
+                    raise OutOfStockError(product)
+
+            if held:
+                Reservation.objects.filter(token=token).delete()
+
+            sold_out_ids = counters.sold_out([line["product_id"] for line in lines])
+            # Queryset updates send no signals: refresh the cards, stock
+            # facets and cached grids of sold-out products on commit.
+            for product_id in sold_out_ids:
+                catalog_sync.product_saved(product_id, text_changed=False)
+
+            OrderItem.objects.bulk_create(
+                [
+                    OrderItem(
+                        order=order,
+                        product=line["product_obj"],
+                        product_name=line["product_obj"].name,
+                        unit_price=line["unit_price"],
+                        discount=line["discount"],
+                        quantity=line["quantity"],
+                    )
+                    for line in lines
+                ]
+            )
+    except IntegrityError:
+        existing = get_existing_order(idempotency_key, user, checkout_token)
+        if existing is None:
+            raise
+        return existing, False
+
+    return order, True
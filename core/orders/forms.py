@@ -0,0 +1,24 @@
+from django import forms
+from orders.models import Order
+
+
+class CheckoutForm(forms.ModelForm):
+    """
+    Billing details for checkout, plus the idempotency key generated when
+    the checkout page was rendered.
+    """
+
+    idempotency_key = forms.CharField(max_length=64, widget=forms.HiddenInput)
+
+    class Meta:
+        model = Order
+        fields = [
+            "first_name",
+            "last_name",
+            "email",
+            "phone",
+            "address",
+            "city",
+            "zip_code",
+            "notes",
+        ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0001_initial"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="discount",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name="orderitem",
+            name="discount",
+            field=models.DecimalField(decimal_places=2, default=0, max_digits=10),
+        ),
+    ]
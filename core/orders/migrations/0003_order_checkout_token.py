@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("orders", "0002_order_discount"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="order",
+            name="checkout_token",
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
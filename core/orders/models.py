@@ -0,0 +1,73 @@
+from django.db import models
+from django.conf import settings
+from django.urls import reverse
+from shop.models import Product
+
+
+class Order(models.Model):
+    """
+    An order placed from a session cart.
+    ``idempotency_key`` is sent with the checkout form so a retried
+    submission returns the existing order instead of creating another one.
+    ``checkout_token`` identifies the session that placed it, so guests can
+    see their own orders and nobody else's.
+    """
+
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.SET_NULL,
+        related_name="orders",
+        blank=True,
+        null=True,
+    )
+    idempotency_key = models.CharField(max_length=64, unique=True)
+    checkout_token = models.CharField(max_length=32, blank=True, editable=False)
+    first_name = models.CharField(max_length=100)
+    last_name = models.CharField(max_length=100)
+    email = models.EmailField()
+    phone = models.CharField(max_length=20, blank=True)
+    address = models.CharField(max_length=255)
+    city = models.CharField(max_length=100)
+    zip_code = models.CharField(max_length=20, blank=True)
+    notes = models.TextField(blank=True)
+    total_quantity = models.PositiveIntegerField(default=0)
+    total_price = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    # Taken off by promotions; already deducted from total_price.
+    discount = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+
+    def __str__(self):
+        return f"Order #{self.pk} ({self.email})"
+
+    def get_absolute_url(self):
+        return reverse("orders:order-detail", args=[self.idempotency_key])
+
+
+class OrderItem(models.Model):
+    """
+    A line of an order. Name and unit price are snapshotted at checkout.
+    """
+
+    order = models.ForeignKey(Order, on_delete=models.CASCADE, related_name="items")
+    product = models.ForeignKey(
+        Product,
+        on_delete=models.SET_NULL,
+        related_name="order_items",
+        blank=True,
+        null=True,
+    )
+    product_name = models.CharField(max_length=255)
+    unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    quantity = models.PositiveIntegerField()
+    discount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+
+    def subtotal(self):
+        """Return unit_price * quantity less the promotion discount."""
+        return self.unit_price * self.quantity - self.discount
+
+    def __str__(self):
+        return f"{self.product_name} x {self.quantity}"
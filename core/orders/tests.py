@@ -0,0 +1,260 @@
+import threading
+import time
+from uuid import uuid4
+
+from django.contrib.auth import get_user_model
+from django.contrib.sessions.backends.db import SessionStore
+from django.db import OperationalError, connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+
+from cart.cart import CartSession
+from cart.models import CartItem
+from cart.write_behind import cart_write_behind
+from shop.facets import facet_index
+from shop.models import Category, Product
+from .checkout import (
+    CHECKOUT_TOKEN_SESSION_KEY,
+    CheckoutError,
+    OutOfStockError,
+    place_order,
+)
+from .models import Order, OrderItem
+
+ORDER_DETAILS = {
+    "first_name": "Jane",
+    "last_name": "Doe",
+    "email": "jane@example.com",
+    "address": "1 Main St",
+    "city": "Springfield",
+}
+
+
+def make_cart(*lines):
+    """Build a session cart holding (product, quantity) lines, without holds."""
+    session = SessionStore()
+    session["cart"] = {
+        "items": [
+            {"product_id": product.pk, "quantity": quantity}
+            for product, quantity in lines
+        ]
+    }
+    return CartSession(session)
+
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Shoes")
+        self.product = Product.objects.create(
+            name="Runner", category=category, price="20.00", stock=5
+        )
+        self.other = Product.objects.create(
+            name="Walker", category=category, price="10.00", stock=1
+        )
+
+    def test_creates_order_and_decrements_stock(self):
+        cart = make_cart((self.product, 2), (self.other, 1))
+        order, created = place_order(cart, "key-1", **ORDER_DETAILS)
+
+        self.assertTrue(created)
+        self.assertEqual(order.total_quantity, 3)
+        self.assertEqual(str(order.total_price), "50.00")
+        self.assertEqual(order.items.count(), 2)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+    def test_selling_out_updates_the_stock_facet(self):
+        facet_index.rebuild()
+        self.addCleanup(facet_index.invalidate)
+        self.assertEqual(facet_index.query({}).counts["stock"], {"in_stock": 2})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            place_order(make_cart((self.other, 1)), "key-1", **ORDER_DETAILS)
+
+        self.assertEqual(
+            facet_index.query({}).counts["stock"],
+            {"in_stock": 1, "out_of_stock": 1},
+        )
+
+    def test_same_idempotency_key_returns_existing_order(self):
+        cart = make_cart((self.product, 1))
+        first, _ = place_order(cart, "key-1", **ORDER_DETAILS)
+        second, created = place_order(cart, "key-1", **ORDER_DETAILS)
+
+        self.assertFalse(created)
+        self.assertEqual(first.pk, second.pk)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 4)
+
+    def test_same_idempotency_key_of_another_customer_is_refused(self):
+        cart = make_cart((self.product, 1))
+        place_order(cart, "key-1", checkout_token="mine", **ORDER_DETAILS)
+
+        with self.assertRaises(CheckoutError):
+            place_order(cart, "key-1", checkout_token="theirs", **ORDER_DETAILS)
+        user = get_user_model().objects.create_user(email="x@example.com")
+        with self.assertRaises(CheckoutError):
+            place_order(cart, "key-1", user=user, **ORDER_DETAILS)
+        self.assertEqual(Order.objects.count(), 1)
+
+    def test_out_of_stock_rolls_back_every_line(self):
+        cart = make_cart((self.product, 2), (self.other, 2))
+        with self.assertRaises(OutOfStockError):
+            place_order(cart, "key-1", **ORDER_DETAILS)
+
+        self.assertFalse(Order.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 5)
+
+    def test_uses_own_reservation(self):
+        cart = CartSession(SessionStore())
+        cart.add_product(self.other.pk, 1)
+        self.other.refresh_from_db()
+        self.assertEqual(self.other.reserved, 1)
+
+        place_order(cart, "key-1", **ORDER_DETAILS)
+        self.other.refresh_from_db()
+        self.assertEqual((self.other.stock, self.other.reserved), (0, 0))
+
+
+class OrderDetailTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Shoes")
+        product = Product.objects.create(
+            name="Runner", category=category, price="20.00", stock=5
+        )
+        self.user = get_user_model().objects.create_user(
+            email="owner@example.com", password="secret"
+        )
+        self.guest_order, _ = place_order(
+            make_cart((product, 1)),
+            "guest-key",
+            checkout_token="guest",
+            **ORDER_DETAILS
+        )
+        self.user_order, _ = place_order(
+            make_cart((product, 1)), "user-key", user=self.user, **ORDER_DETAILS
+        )
+
+    def set_checkout_token(self, token):
+        session = self.client.session
+        session[CHECKOUT_TOKEN_SESSION_KEY] = token
+        session.save()
+
+    def test_guest_sees_own_order_only(self):
+        self.set_checkout_token("guest")
+        response = self.client.get(self.guest_order.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.user_order.get_absolute_url())
+        self.assertEqual(response.status_code, 404)
+
+    def test_other_session_cannot_open_order(self):
+        self.set_checkout_token("someone-else")
+        response = self.client.get(self.guest_order.get_absolute_url())
+        self.assertEqual(response.status_code, 404)
+        response = self.client_class().get(self.guest_order.get_absolute_url())
+        self.assertEqual(response.status_code, 404)
+
+    def test_user_sees_own_order_only(self):
+        self.client.force_login(self.user)
+        response = self.client.get(self.user_order.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(self.guest_order.get_absolute_url())
+        self.assertEqual(response.status_code, 404)
+
+        other = get_user_model().objects.create_user(email="other@example.com")
+        self.client.force_login(other)
+        response = self.client.get(self.user_order.get_absolute_url())
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(CART_WRITE_BEHIND=True, CART_WRITE_BEHIND_INTERVAL=3600)
+class CheckoutViewTests(TestCase):
+    def test_placing_an_order_drops_the_queued_cart(self):
+        product = Product.objects.create(
+            name="Runner",
+            category=Category.objects.create(name="Shoes"),
+            price="20.00",
+            stock=5,
+        )
+        user = get_user_model().objects.create_user(email="jane@example.com")
+        self.client.force_login(user)
+        session = self.client.session
+        session["cart"] = {"items": [{"product_id": product.pk, "quantity": 1}]}
+        session.save()
+        cart_write_behind.enqueue(user.pk, {product.pk: 1})
+        self.addCleanup(cart_write_behind.discard, user.pk)
+
+        response = self.client.post(
+            reverse("orders:checkout"), {**ORDER_DETAILS, "idempotency_key": "key-1"}
+        )
+        self.assertRedirects(
+            response,
+            Order.objects.get().get_absolute_url(),
+            fetch_redirect_response=False,
+        )
+        cart_write_behind.flush(user.pk)
+        self.assertFalse(CartItem.objects.filter(cart__user=user).exists())
+
+
+class ConcurrentCheckoutTests(TransactionTestCase):
+    threads = 16
+    stock = 5
+
+    def setUp(self):
+        category = Category.objects.create(name="Shoes")
+        self.hot = Product.objects.create(
+            name="Hot", category=category, price="20.00", stock=self.stock
+        )
+        self.side = Product.objects.create(
+            name="Side", category=category, price="5.00", stock=1000
+        )
+
+    # How long a client keeps retrying a checkout that hit a database lock.
+    retry_seconds = 30
+
+    def checkout(self, key, results, barrier):
+        cart = make_cart((self.side, 1), (self.hot, 1))
+        barrier.wait()
+        deadline = time.monotonic() + self.retry_seconds
+        try:
+            # Clients retry with the same key, e.g. when SQLite reports a lock.
+            while True:
+                try:
+                    results.append(place_order(cart, key, **ORDER_DETAILS))
+                    return
+                except OperationalError:
+                    if time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.01)
+        except OutOfStockError:
+            results.append(None)
+        except Exception as error:
+            results.append(error)
+        finally:
+            connection.close()
+
+    def test_hot_product_is_never_oversold(self):
+        results = []
+        barrier = threading.Barrier(self.threads)
+        keys = [uuid4().hex for _ in range(self.threads)]
+        # Every key is submitted twice to exercise idempotent retries.
+        workers = [
+            threading.Thread(target=self.checkout, args=(key, results, barrier))
+            for key in keys[: self.threads // 2] * 2
+        ]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+
+        self.hot.refresh_from_db()
+        self.side.refresh_from_db()
+        orders = Order.objects.count()
+        errors = [result for result in results if isinstance(result, Exception)]
+        self.assertEqual(errors, [], "checkouts failed instead of completing")
+        self.assertEqual(len(results), self.threads)
+        self.assertEqual(orders, self.stock)
+        self.assertEqual(self.hot.stock, 0)
+        self.assertEqual(self.side.stock, 1000 - orders)
+        self.assertEqual(OrderItem.objects.filter(product=self.hot).count(), orders)
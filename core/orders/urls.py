@@ -0,0 +1,9 @@
+from django.urls import path
+from . import views
+
+app_name = "orders"
+
+urlpatterns = [
+    path("checkout/", views.CheckoutView.as_view(), name="checkout"),
+    path("<str:key>/", views.OrderDetailView.as_view(), name="order-detail"),
+]
@@ -0,0 +1,97 @@
+from uuid import uuid4
+
+from django.contrib import messages
+from django.db.models import Q
+from django.shortcuts import redirect
+from django.views.generic.detail import DetailView
+from django.views.generic.edit import FormView
+
+from cart.cart import CartSession
+from cart.write_behind import cart_write_behind
+from .checkout import (
+    CHECKOUT_TOKEN_SESSION_KEY,
+    CheckoutError,
+    get_checkout_token,
+    place_order,
+)
+from .forms import CheckoutForm
+from .models import Order
+
+
+class CheckoutView(FormView):
+    """
+    Shows the checkout form and places the order for the session cart.
+    """
+
+    template_name = "cart/checkout.html"
+    form_class = CheckoutForm
+
+    def get(self, request, *args, **kwargs):
+        if not CartSession(request.session).get_cart_items():
+            messages.error(request, "Your cart is empty.")
+            return redirect("cart:cart")
+        return super().get(request, *args, **kwargs)
+
+    def get_initial(self):
+        initial = super().get_initial()
+        initial["idempotency_key"] = uuid4().hex
+        if self.request.user.is_authenticated:
+            initial["email"] = self.request.user.email
+        return initial
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        cart = CartSession(self.request.session)
+        context["cart_items"] = cart.get_cart_items()
+        context["total_payment_price"] = cart.get_total_payment_amount()
+        context["promotions"] = cart.get_promotions()
+        return context
+
+    def form_valid(self, form):
+        user = self.request.user if self.request.user.is_authenticated else None
+        details = dict(form.cleaned_data)
+        idempotency_key = details.pop("idempotency_key")
+        cart = CartSession(self.request.session)
+        try:
+            order, created = place_order(
+                cart,
+                idempotency_key,
+                user=user,
+                checkout_token=get_checkout_token(self.request.session),
+                **details,
+            )
+        except CheckoutError as error:
+            messages.error(self.request, str(error))
+            return redirect("cart:cart")
+
+        if created:
+            cart.clear()
+            if user:
+                # A queued snapshot would bring the ordered items back.
+                cart_write_behind.discard(user.pk)
+                cart.merge_session_cart_in_db(user)
+            messages.success(self.request, "Your order has been placed.")
+        return redirect(order.get_absolute_url())
+
+
+class OrderDetailView(DetailView):
+    """
+    Order confirmation page, looked up by the order's idempotency key.
+    Only the user who placed the order, or for guest orders the session
+    that placed it, can see it; anyone else gets a 404.
+    """
+
+    model = Order
+    template_name = "orders/order_detail.html"
+    context_object_name = "order"
+    slug_field = "idempotency_key"
+    slug_url_kwarg = "key"
+
+    def get_queryset(self):
+        owner = Q(pk__in=[])
+        if self.request.user.is_authenticated:
+            owner |= Q(user=self.request.user)
+        checkout_token = self.request.session.get(CHECKOUT_TOKEN_SESSION_KEY)
+        if checkout_token:
+            owner |= Q(user=None, checkout_token=checkout_token)
+        return Order.objects.filter(owner).prefetch_related("items")
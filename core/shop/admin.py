@@ -1,10 +1,17 @@
 from django.contrib import admin
 from django.utils.html import format_html
-from .models import Brand, Category, Product, ProductImage
+from .models import Brand, Category, Product, ProductImage, Promotion
 
 
 class BrandAdmin(admin.ModelAdmin):
-    list_display = ("name", "slug", "is_active", "created_at")
+    list_display = (
+        "name",
+        "slug",
+        "is_active",
+        "active_product_count",
+        "in_stock_product_count",
+        "created_at",
+    )
     list_filter = ("is_active", "created_at")
     search_fields = ("name", "slug")
     prepopulated_fields = {"slug": ("name",)}
@@ -12,11 +19,20 @@ class BrandAdmin(admin.ModelAdmin):
 
 
 class CategoryAdmin(admin.ModelAdmin):
-    list_display = ("name", "slug", "parent", "is_active", "created_at")
+    list_display = (
+        "full_name",
+        "slug",
+        "parent",
+        "is_active",
+        "active_product_count",
+        "in_stock_product_count",
+        "created_at",
+    )
     list_filter = ("is_active", "created_at", "parent")
+    list_select_related = ("parent",)
     search_fields = ("name", "slug")
     prepopulated_fields = {"slug": ("name",)}
-    ordering = ("name",)
+    ordering = ("full_name",)
 
 
 class ProductImageInline(admin.TabularInline):
@@ -69,7 +85,28 @@ class ProductImageAdmin(admin.ModelAdmin):
     image_preview.short_description = "Preview"
 
 
+class PromotionAdmin(admin.ModelAdmin):
+    list_display = (
+        "name",
+        "kind",
+        "is_active",
+        "brand",
+        "product",
+        "percent",
+        "amount",
+        "min_subtotal",
+        "starts_at",
+        "ends_at",
+    )
+    list_filter = ("kind", "is_active", "starts_at", "ends_at")
+    list_select_related = ("brand", "product")
+    search_fields = ("name",)
+    autocomplete_fields = ("brand", "product")
+    ordering = ("name",)
+
+
 admin.site.register(Brand, BrandAdmin)
 admin.site.register(Category, CategoryAdmin)
 admin.site.register(Product, ProductAdmin)
 admin.site.register(ProductImage, ProductImageAdmin)
+admin.site.register(Promotion, PromotionAdmin)
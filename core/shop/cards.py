@@ -0,0 +1,96 @@
+"""
+Product card read model.
+
+Listing pages (catalog grid, latest products, related products) render
+``ProductCard`` rows instead of full ``Product`` rows, so they never load
+descriptions or resolve URLs per row. Cards exist only for active products.
+"""
+
+from . import pricing
+from .models import Product, ProductCard
+
+CARD_FIELDS = (
+    "name",
+    "url",
+    "thumbnail_url",
+    "display_price",
+    "brand_name",
+    "category_slug",
+    "in_stock",
+    "created_at",
+)
+
+
+def build_card(product, display_price=None):
+    """
+    Build the (unsaved) card for a product with brand/category loaded;
+    ``display_price`` defaults to ``product.get_price()``.
+    """
+    return ProductCard(
+        product_id=product.pk,
+        name=product.name,
+        url=product.get_absolute_url(),
+        thumbnail_url=product.image.url if product.image else "",
+        display_price=(product.get_price() if display_price is None else display_price),
+        brand_name=product.brand.name if product.brand_id else "",
+        category_slug=product.category.slug,
+        in_stock=product.in_stock,
+        created_at=product.created_at,
+    )
+
+
+def refresh_cards(product_ids, batch_size=1000):
+    """Rebuild the cards of ``product_ids``; returns the number written."""
+    product_ids = list(product_ids)
+    count = 0
+    for start in range(0, len(product_ids), batch_size):
+        count += _refresh_batch(product_ids[start : start + batch_size])
+    return count
+
+
+def _refresh_batch(product_ids):
+    products = (
+        Product.objects.filter(pk__in=product_ids, is_active=True)
+        .select_related("brand", "category")
+        .defer("description")
+    )
+    products = list(products)
+    prices = pricing.price_products(products, pricing.configured_rules())
+    cards = [build_card(product, price) for product, price in zip(products, prices)]
+    active_ids = {card.product_id for card in cards}
+    stale_ids = [pk for pk in product_ids if pk not in active_ids]
+    if stale_ids:
+        ProductCard.objects.filter(product_id__in=stale_ids).delete()
+    if cards:
+        ProductCard.objects.bulk_create(
+            cards,
+            update_conflicts=True,
+            unique_fields=["product"],
+            update_fields=CARD_FIELDS,
+        )
+    return len(cards)
+
+
+def rebuild_cards(batch_size=1000):
+    """Regenerate every card from the Product table."""
+    ProductCard.objects.exclude(product__is_active=True).delete()
+    return refresh_cards(
+        Product.objects.filter(is_active=True)
+        .order_by("pk")
+        .values_list("pk", flat=True),
+        batch_size,
+    )
+
+
+def cards_for(products):
+    """
+    Return the cards of ``products`` (instances or ids) in the same order.
+    Cards that are missing, e.g. after a bulk import, are built on the fly.
+    """
+    ids = [getattr(product, "pk", product) for product in products]
+    cards = ProductCard.objects.in_bulk(ids)
+    missing = [pk for pk in ids if pk not in cards]
+    if missing:
+        refresh_cards(missing)
+        cards.update(ProductCard.objects.in_bulk(missing))
+    return [cards[pk] for pk in ids if pk in cards]
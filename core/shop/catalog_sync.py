@@ -0,0 +1,152 @@
+"""
+Deferred upkeep of the catalog's derived data.
+
+The Product signals only record which products changed. When the
+transaction commits (``transaction.on_commit``), the search and trigram
+indexes, product cards, related products, in-memory facet and typeahead
+indexes and the grid cache version are refreshed once for all of them, with
+batched queries: a transaction saving 500 products costs a handful of
+queries instead of 500 rounds. Changes are grouped per savepoint, so a
+rolled-back transaction or savepoint discards its changes along with its
+callback.
+Counters and price histograms stay in the signals: they are ``F()`` deltas
+that must commit or roll back with the product.
+
+Renaming a brand or category changes the search rows and cards of all its
+products, which is too much to do in the request: it is queued as a
+TaxonomyReindex row and done by ``process_reindex_jobs`` (run it from
+cron or with ``--loop``).
+"""
+
+import threading
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Q
+
+from . import cards, fuzzy, grid_cache, related, search
+from .facets import facet_index
+from .models import Product, TaxonomyReindex
+from .typeahead import typeahead_index
+
+_local = threading.local()
+
+
+class PendingChanges:
+    def __init__(self):
+        self.saved_ids = set()
+        # Saved products whose indexed text changed.
+        self.text_ids = set()
+        self.deleted_ids = set()
+        self.category_ids = set()
+        self.taxonomy_changed = False
+        self.callback = partial(flush, self)
+
+
+def _pending():
+    """
+    The changes recorded in the current transaction and savepoint, and
+    whether they are new. Each set has its own ``on_commit`` callback, so
+    rolling back a savepoint or the transaction discards its changes with
+    the callback; a set is reused only while its callback is still queued.
+    """
+    connection = transaction.get_connection()
+    groups = getattr(_local, "groups", None)
+    if groups is None:
+        groups = _local.groups = {}
+    queued = {id(func) for _, func, _ in connection.run_on_commit}
+    for key, changes in list(groups.items()):
+        if id(changes.callback) not in queued:
+            del groups[key]
+    key = tuple(connection.savepoint_ids)
+    changes = groups.get(key)
+    if changes is not None:
+        return changes, False
+    changes = PendingChanges()
+    if connection.in_atomic_block:
+        groups[key] = changes
+    return changes, True
+
+
+def _schedule(changes, new):
+    # Register after recording: outside a transaction this flushes right away.
+    if new:
+        transaction.on_commit(changes.callback)
+
+
+def product_saved(product_id, category_ids=(), text_changed=True):
+    changes, new = _pending()
+    changes.saved_ids.add(product_id)
+    if text_changed:
+        changes.text_ids.add(product_id)
+    changes.category_ids.update(category_ids)
+    _schedule(changes, new)
+
+
+def product_deleted(product_id, category_id):
+    changes, new = _pending()
+    changes.deleted_ids.add(product_id)
+    changes.category_ids.add(category_id)
+    _schedule(changes, new)
+
+
+def taxonomy_changed():
+    changes, new = _pending()
+    changes.taxonomy_changed = True
+    _schedule(changes, new)
+
+
+def queue_reindex(brand=None, category=None):
+    """Queue the reindex of a renamed brand's or category's products."""
+    TaxonomyReindex.objects.create(brand=brand, category=category)
+
+
+def flush(changes):
+    """Apply the committed ``changes`` to the derived data."""
+    deleted_ids = changes.deleted_ids
+    saved_ids = changes.saved_ids - deleted_ids
+    text_ids = changes.text_ids - deleted_ids
+    if deleted_ids:
+        search.remove_products(deleted_ids)
+        fuzzy.remove_products(deleted_ids)
+        for product_id in deleted_ids:
+            facet_index.remove_product(product_id)
+            typeahead_index.remove_product(product_id)
+    if text_ids:
+        products = list(
+            Product.objects.filter(pk__in=text_ids).select_related("brand", "category")
+        )
+        search.index_products(products)
+        fuzzy.index_products(products)
+        typeahead_index.update_products(text_ids)
+    if saved_ids:
+        cards.refresh_cards(saved_ids)
+        facet_index.update_products(saved_ids)
+    related.refresh_categories(changes.category_ids)
+    if changes.taxonomy_changed:
+        facet_index.invalidate()
+        typeahead_index.refresh_taxonomy()
+    grid_cache.bump_version()
+
+
+def process_reindex_jobs(batch_size=100):
+    """
+    Reindex the products of up to ``batch_size`` queued brands and
+    categories. Returns the number of jobs processed; call repeatedly until
+    it returns 0.
+    """
+    jobs = list(TaxonomyReindex.objects.order_by("pk")[:batch_size])
+    if not jobs:
+        return 0
+    brand_ids = {job.brand_id for job in jobs if job.brand_id}
+    category_ids = {job.category_id for job in jobs if job.category_id}
+    products = Product.objects.filter(
+        Q(brand_id__in=brand_ids) | Q(category_id__in=category_ids)
+    )
+    search.reindex_queryset(products)
+    # The trigram index only holds product and brand names.
+    fuzzy.reindex_queryset(products.filter(brand_id__in=brand_ids))
+    cards.refresh_cards(products.filter(is_active=True).values_list("pk", flat=True))
+    TaxonomyReindex.objects.filter(pk__in=[job.pk for job in jobs]).delete()
+    grid_cache.bump_version()
+    return len(jobs)
@@ -0,0 +1,102 @@
+"""
+Denormalized product counters on Category and Brand.
+
+``active_product_count`` and ``in_stock_product_count`` are adjusted with
+``F()`` updates from the Product signals in ``shop.signals``. Writes that
+bypass signals (queryset updates, bulk_create) can make them drift;
+``rebuild_catalog_counters`` recomputes them from scratch.
+"""
+
+from collections import Counter
+
+from django.db.models import Count, F, Q
+from django.db.models.functions import Greatest
+
+from .models import Brand, Category, Product
+
+COUNTER_FIELDS = ("active_product_count", "in_stock_product_count")
+
+
+def contribution(is_active, stock):
+    """How much one product adds to (active, in stock) counters."""
+    return (int(bool(is_active)), int(bool(is_active) and stock > 0))
+
+
+def product_state(product):
+    return (product.category_id, product.brand_id, product.is_active, product.stock)
+
+
+def apply_change(old_state, new_state):
+    """
+    Update the counters for a product going from ``old_state`` to
+    ``new_state`` ((category_id, brand_id, is_active, stock) or None).
+    """
+    deltas = {Category: Counter(), Brand: Counter()}
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is None:
+            continue
+        category_id, brand_id, is_active, stock = state
+        active, in_stock = contribution(is_active, stock)
+        for model, pk in ((Category, category_id), (Brand, brand_id)):
+            if pk is None:
+                continue
+            deltas[model][pk, "active_product_count"] += sign * active
+            deltas[model][pk, "in_stock_product_count"] += sign * in_stock
+
+    for model, counter in deltas.items():
+        updates = {}
+        for (pk, field), delta in counter.items():
+            if delta > 0:
+                updates.setdefault(pk, {})[field] = F(field) + delta
+            elif delta < 0:
+                # Rows written without signals may never have been counted;
+                # let rebuild_catalog_counters fix that instead of failing.
+                updates.setdefault(pk, {})[field] = Greatest(F(field) + delta, 0)
+        for pk, fields in updates.items():
+            model.objects.filter(pk=pk).update(**fields)
+
+
+def sold_out(product_ids):
+    """
+    Decrement in-stock counters for products whose stock just reached 0;
+    returns the ids of those products.
+    """
+    sold_out_ids = []
+    for pk, category_id, brand_id in Product.objects.filter(
+        pk__in=product_ids, stock=0, is_active=True
+    ).values_list("pk", "category_id", "brand_id"):
+        apply_change((category_id, brand_id, True, 1), (category_id, brand_id, True, 0))
+        sold_out_ids.append(pk)
+    return sold_out_ids
+
+
+def actual_counts(model):
+    """{pk: (active, in stock)} computed from the Product table."""
+    active = Q(products__is_active=True)
+    return {
+        pk: (active_count, in_stock_count)
+        for pk, active_count, in_stock_count in model.objects.annotate(
+            actual_active=Count("products", filter=active),
+            actual_in_stock=Count("products", filter=active & Q(products__stock__gt=0)),
+        ).values_list("pk", "actual_active", "actual_in_stock")
+    }
+
+
+def rebuild(model, fix=True):
+    """
+    Recompute ``model``'s counters. Returns a list of
+    (object, stored counts, actual counts) for every row that had drifted.
+    """
+    actual = actual_counts(model)
+    drifted = []
+    for obj in model.objects.only("pk", "name", *COUNTER_FIELDS):
+        stored = (obj.active_product_count, obj.in_stock_product_count)
+        expected = actual.get(obj.pk, (0, 0))
+        if stored != expected:
+            drifted.append((obj, stored, expected))
+            obj.active_product_count, obj.in_stock_product_count = expected
+    if fix and drifted:
+        model.objects.bulk_update(
+            [obj for obj, _, _ in drifted], COUNTER_FIELDS, batch_size=500
+        )
+    return drifted
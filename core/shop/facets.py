@@ -0,0 +1,512 @@
+"""
+In-memory facet engine for the product list.
+
+For every active product the engine records its category (and that
+category's ancestors), brand, price bucket and stock state in per-value
+bitmaps (Python ints with bit ``id`` set for each product id). Filtering
+is then a few bitwise ANDs. Counting a facet takes one AND and
+``int.bit_count()`` per value, or a walk over the matching products when
+there are few; with hundreds of thousands of products and hundreds of
+brands or categories that is tens of milliseconds. Counts are therefore
+cached per selection and adjusted in place as products change, so only the
+first request for a selection pays for them.
+
+Prices are also split into PRICE_BANDS bands of about equal size, each a
+bitmap plus its price-sorted (price, id) pairs, so a ?min_price/?max_price
+range is applied in memory: bands inside the range are OR-ed in whole and
+the two edge bands are bisected.
+
+Values selected within one facet are OR-ed together, different facets are
+AND-ed; each facet's counts ignore that facet's own selection so shoppers
+can see what widening a multi-select would give them.
+
+The index lives in each process. It is updated incrementally from Product
+signals and fully reloaded every SHOP_FACET_INDEX_TTL seconds so changes
+made by other processes are picked up. Reloads run outside the query lock,
+one at a time, and are swapped in when ready; until then queries keep using
+the previous index.
+"""
+
+import re
+import threading
+import time
+from bisect import bisect_left, bisect_right, insort
+from collections import Counter, OrderedDict, defaultdict
+from decimal import Decimal
+from operator import itemgetter
+
+from django.conf import settings
+from django.db.models import Q
+
+FACETS = ("category", "brand", "price", "stock")
+
+# Lower edge of each price bucket; the last one is open-ended. The price
+# facet and the price histogram (``shop.price_histogram``) both use these.
+PRICE_EDGES = tuple(
+    Decimal(edge)
+    for edge in ("0", "25", "50", "75", "100", "150", "250", "500", "1000")
+)
+
+
+def _price_bucket_label(low, high):
+    if high is None:
+        return f"Over ${low:,}"
+    if not low:
+        return f"Under ${high:,}"
+    return f"${low:,} to ${high:,}"
+
+
+# (value, label, lower bound, upper bound)
+PRICE_BUCKETS = tuple(
+    (f"{low}-{'' if high is None else high}", _price_bucket_label(low, high), low, high)
+    for low, high in zip(PRICE_EDGES, (*PRICE_EDGES[1:], None))
+)
+
+STOCK_VALUES = (("in_stock", "In stock"), ("out_of_stock", "Out of stock"))
+
+# Walking candidate products costs roughly 1/TALLY_FACTOR of one bitmap AND
+# per product, so it is used when candidates < TALLY_FACTOR * facet values.
+TALLY_FACTOR = 50
+
+# Number of price bands a price range is assembled from.
+PRICE_BANDS = 128
+
+# Facet counts cached per process for repeated selections (without a
+# search). They are adjusted as products change, unless more than
+# COUNTS_CACHE_ADJUST_LIMIT products change at once: then they are dropped.
+COUNTS_CACHE_SIZE = 256
+COUNTS_CACHE_ADJUST_LIMIT = 100
+
+NONZERO_BYTE_RE = re.compile(rb"[^\x00]")
+
+# The positions of the bits set in each byte value.
+BYTE_BITS = tuple(
+    tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)
+)
+
+
+def price_bucket(price):
+    for value, _, low, high in PRICE_BUCKETS:
+        if price >= low and (high is None or price < high):
+            return value
+    return None
+
+
+def price_band_edges(prices):
+    """Lower edges of about PRICE_BANDS equal-sized bands of ``prices``."""
+    ordered = sorted(prices)
+    step = max(len(ordered) // PRICE_BANDS, 1)
+    return (Decimal("-Infinity"), *sorted(set(ordered[step::step])))
+
+
+def facet_values(category_slugs, brand_slug, price, stock):
+    """
+    Return a product's values for each facet, in FACETS order. A product
+    belongs to its category and all of that category's ancestors.
+    """
+    return (
+        tuple(category_slugs),
+        (brand_slug,) if brand_slug else (),
+        (price_bucket(price),),
+        ("in_stock" if stock > 0 else "out_of_stock",),
+    )
+
+
+def bitmap_from_ids(ids):
+    """Build a bitmap from an iterable of non-negative integer ids."""
+    ids = list(ids)
+    if not ids:
+        return 0
+    bits = bytearray(max(ids) // 8 + 1)
+    for product_id in ids:
+        bits[product_id >> 3] |= 1 << (product_id & 7)
+    return int.from_bytes(bits, "little")
+
+
+def ids_from_bitmap(bitmap):
+    """Yield the ids set in ``bitmap`` in ascending order."""
+    data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    for match in NONZERO_BYTE_RE.finditer(data):
+        offset = match.start() * 8
+        for bit in BYTE_BITS[match.group()[0]]:
+            yield offset + bit
+
+
+def selection_filter(selected):
+    """The ORM filter equivalent to a facet selection, for SQL querysets."""
+    from shop.models import Category
+
+    q = Q()
+    if selected.get("category"):
+        # A category matches the products of its whole subtree.
+        category_q = Q(pk__in=[])
+        paths = Category.objects.filter(slug__in=selected["category"]).values_list(
+            "path", flat=True
+        )
+        for path in paths:
+            category_q |= Category.subtree_filter(path, prefix="category__")
+        q &= category_q
+    if selected.get("brand"):
+        q &= Q(brand__slug__in=selected["brand"])
+    if selected.get("price"):
+        price_q = Q()
+        for value, _, low, high in PRICE_BUCKETS:
+            if value in selected["price"]:
+                bucket_q = Q(price__gte=low)
+                if high is not None:
+                    bucket_q &= Q(price__lt=high)
+                price_q |= bucket_q
+        q &= price_q
+    stock = set(selected.get("stock", ()))
+    if stock == {"in_stock"}:
+        q &= Q(stock__gt=0)
+    elif stock == {"out_of_stock"}:
+        q &= Q(stock=0)
+    return q
+
+
+class FacetResult:
+    def __init__(self, bitmap, counts):
+        self.bitmap = bitmap
+        self.total = bitmap.bit_count()
+        self.counts = counts
+
+    def ids(self):
+        return ids_from_bitmap(self.bitmap)
+
+
+class FacetIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        # Held by the one thread rebuilding the index.
+        self._rebuild_lock = threading.Lock()
+        # Products changed while a rebuild was reading the table.
+        self._changed_during_rebuild = None
+        self._bitmaps = None
+        self._counts = None
+        self._category_slugs = {}
+        self._products = {}
+        self._prices = {}
+        self._band_edges = (Decimal("-Infinity"),)
+        self._bands = [0]
+        self._band_prices = [[]]
+        self._all = 0
+        self._loaded_at = 0.0
+        self._version = 0
+        self._counts_cache = OrderedDict()
+
+    @property
+    def ttl(self):
+        return getattr(settings, "SHOP_FACET_INDEX_TTL", 300)
+
+    def rebuild(self):
+        """
+        Load the facet bitmaps for all active products and swap them in.
+        Products changed while the table was being read are re-applied.
+        """
+        from shop.models import Product
+
+        with self._lock:
+            self._changed_during_rebuild = set()
+        try:
+            category_slugs = self._load_category_slugs()
+            members = defaultdict(list)
+            products = {}
+            prices = {}
+            rows = (
+                Product.objects.filter(is_active=True)
+                .values_list("id", "category_id", "brand__slug", "price", "stock")
+                .iterator(chunk_size=5000)
+            )
+            for product_id, category_id, *fields in rows:
+                values = facet_values(category_slugs.get(category_id, ()), *fields)
+                products[product_id] = values
+                prices[product_id] = fields[1]
+                for facet, facet_value in zip(FACETS, values):
+                    for value in facet_value:
+                        members[facet, value].append(product_id)
+
+            bitmaps = {facet: {} for facet in FACETS}
+            counts = {facet: {} for facet in FACETS}
+            for (facet, value), ids in members.items():
+                bitmaps[facet][value] = bitmap_from_ids(ids)
+                counts[facet][value] = len(ids)
+
+            band_edges = price_band_edges(prices.values())
+            band_prices = [[] for _ in band_edges]
+            for product_id, price in prices.items():
+                band_prices[self._band(band_edges, price)].append((price, product_id))
+            for entries in band_prices:
+                entries.sort()
+            bands = [
+                bitmap_from_ids(product_id for _, product_id in entries)
+                for entries in band_prices
+            ]
+
+            with self._lock:
+                self._category_slugs = category_slugs
+                self._bitmaps = bitmaps
+                self._counts = counts
+                self._products = products
+                self._prices = prices
+                self._band_edges = band_edges
+                self._bands = bands
+                self._band_prices = band_prices
+                self._all = bitmap_from_ids(products)
+                self._loaded_at = time.monotonic()
+                self._counts_cache.clear()
+                self._changed()
+        finally:
+            with self._lock:
+                changed_ids = self._changed_during_rebuild
+                self._changed_during_rebuild = None
+        self.update_products(changed_ids)
+
+    def _load_category_slugs(self):
+        """Map each category id to its own and its ancestors' slugs."""
+        from shop.models import Category
+
+        rows = list(Category.objects.values_list("id", "slug", "path"))
+        slugs = {category_id: slug for category_id, slug, _ in rows}
+        return {
+            category_id: tuple(
+                slugs[int(pk)]
+                for pk in path.split(Category.PATH_SEPARATOR)
+                if pk and int(pk) in slugs
+            )
+            for category_id, _, path in rows
+        }
+
+    @staticmethod
+    def _band(band_edges, price):
+        return bisect_right(band_edges, price) - 1
+
+    def _changed(self):
+        self._version += 1
+
+    def invalidate(self):
+        """Reload the index on the next query, serving this one meanwhile."""
+        with self._lock:
+            self._loaded_at = float("-inf")
+
+    def _is_stale(self):
+        return self._bitmaps is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def _ensure_loaded(self):
+        """
+        Rebuild the index when missing or stale, in one thread at a time.
+        Other threads wait only when there is no index to serve yet.
+        """
+        if not self._is_stale():
+            return
+        if not self._rebuild_lock.acquire(blocking=self._bitmaps is None):
+            return
+        try:
+            if self._is_stale():
+                self.rebuild()
+        finally:
+            self._rebuild_lock.release()
+
+    def update_products(self, product_ids):
+        """Re-read some products and update their bits (no-op until loaded)."""
+        from shop.models import Product
+
+        product_ids = set(product_ids)
+        with self._lock:
+            if self._changed_during_rebuild is not None:
+                self._changed_during_rebuild.update(product_ids)
+            if self._bitmaps is None or not product_ids:
+                return
+        rows = (
+            Product.objects.filter(pk__in=product_ids, is_active=True)
+            .values_list("id", "category_id", "brand__slug", "price", "stock")
+            .order_by()
+        )
+        rows = {product_id: row for product_id, *row in rows}
+        with self._lock:
+            if self._bitmaps is None:
+                return
+            if len(product_ids) > COUNTS_CACHE_ADJUST_LIMIT:
+                self._counts_cache.clear()
+            for product_id in product_ids:
+                self._remove(product_id)
+                if product_id not in rows:
+                    continue
+                category_id, *fields = rows[product_id]
+                bit = 1 << product_id
+                values = facet_values(
+                    self._category_slugs.get(category_id, ()), *fields
+                )
+                self._products[product_id] = values
+                self._prices[product_id] = price = fields[1]
+                band = self._band(self._band_edges, price)
+                self._bands[band] |= bit
+                insort(self._band_prices[band], (price, product_id))
+                self._all |= bit
+                for facet, facet_value in zip(FACETS, values):
+                    for value in facet_value:
+                        bitmaps = self._bitmaps[facet]
+                        bitmaps[value] = bitmaps.get(value, 0) | bit
+                        self._counts[facet][value] = (
+                            self._counts[facet].get(value, 0) + 1
+                        )
+                self._adjust_cached_counts(values, price, 1)
+            self._changed()
+
+    def remove_product(self, product_id):
+        with self._lock:
+            if self._changed_during_rebuild is not None:
+                self._changed_during_rebuild.add(product_id)
+            if self._bitmaps is not None:
+                self._remove(product_id)
+
+    def _remove(self, product_id):
+        values = self._products.pop(product_id, None)
+        if values is None:
+            return
+        bit = 1 << product_id
+        price = self._prices.pop(product_id)
+        band = self._band(self._band_edges, price)
+        self._bands[band] &= ~bit
+        entries = self._band_prices[band]
+        del entries[bisect_left(entries, (price, product_id))]
+        self._all &= ~bit
+        for facet, facet_value in zip(FACETS, values):
+            for value in facet_value:
+                self._bitmaps[facet][value] &= ~bit
+                self._counts[facet][value] -= 1
+        self._adjust_cached_counts(values, price, -1)
+        self._changed()
+
+    def _adjust_cached_counts(self, values, price, delta):
+        """Add ``delta`` for a product's values to the cached counts it is in."""
+        for (facet, others, price_range), counts in self._counts_cache.items():
+            min_price, max_price = price_range
+            if (min_price is not None and price < min_price) or (
+                max_price is not None and price > max_price
+            ):
+                continue
+            if any(
+                selected and not any(value in selected for value in facet_value)
+                for selected, facet_value in zip(others, values)
+            ):
+                continue
+            for value in values[FACETS.index(facet)]:
+                counts[value] = counts.get(value, 0) + delta
+
+    def query(self, selected, restrict=None, price_range=(None, None)):
+        """
+        Return a FacetResult for ``selected`` ({facet: [values]}).
+        ``restrict`` is an optional bitmap (e.g. search matches) to AND in,
+        ``price_range`` an optional inclusive (min_price, max_price).
+        """
+        self._ensure_loaded()
+        with self._lock:
+            selection = tuple(
+                tuple(sorted(set(selected.get(facet, ())))) for facet in FACETS
+            )
+            price_range = tuple(price_range)
+            cached = restrict is None
+            if any(bound is not None for bound in price_range):
+                in_range = self._price_range(*price_range)
+                restrict = in_range if restrict is None else restrict & in_range
+            return self._query(selection, restrict, price_range if cached else None)
+
+    def _query(self, selection, restrict, price_range):
+        """
+        Compute the matches and counts of ``selection`` (value tuples in
+        FACETS order). The counts are cached when ``price_range`` is given,
+        i.e. when ``restrict`` holds nothing but that range.
+        """
+        bitmaps = self._bitmaps
+        base = self._all if restrict is None else self._all & restrict
+
+        unions = {}
+        for facet, values in zip(FACETS, selection):
+            if values:
+                union = 0
+                for value in values:
+                    union |= bitmaps[facet].get(value, 0)
+                unions[facet] = union
+
+        matching = base
+        for union in unions.values():
+            matching &= union
+
+        counts = {}
+        for position, facet in enumerate(FACETS):
+            others = (*selection[:position], (), *selection[position + 1 :])
+            if restrict is None and not any(others):
+                # Unfiltered: the per-value popcounts are kept up to date.
+                counts[facet] = dict(self._counts[facet])
+                continue
+
+            key = None if price_range is None else (facet, others, price_range)
+            if key in self._counts_cache:
+                self._counts_cache.move_to_end(key)
+                counts[facet] = dict(self._counts_cache[key])
+                continue
+
+            facet_base = base
+            for other, union in unions.items():
+                if other != facet:
+                    facet_base &= union
+            if facet_base.bit_count() < TALLY_FACTOR * len(bitmaps[facet]):
+                facet_counts = self._tally(facet, facet_base)
+            else:
+                facet_counts = {
+                    value: (facet_base & bitmap).bit_count()
+                    for value, bitmap in bitmaps[facet].items()
+                }
+            counts[facet] = dict(facet_counts)
+            if key is not None:
+                self._counts_cache[key] = facet_counts
+                if len(self._counts_cache) > COUNTS_CACHE_SIZE:
+                    self._counts_cache.popitem(last=False)
+        return FacetResult(matching, counts)
+
+    def _price_range(self, min_price, max_price):
+        """Bitmap of the products priced from min_price to max_price."""
+        edges = self._band_edges
+        bitmap = 0
+        for band, members in enumerate(self._bands):
+            low = edges[band]
+            high = edges[band + 1] if band + 1 < len(edges) else None
+            if (max_price is not None and low > max_price) or (
+                min_price is not None and high is not None and high <= min_price
+            ):
+                continue
+            if (min_price is None or low >= min_price) and (
+                max_price is None or (high is not None and high <= max_price)
+            ):
+                bitmap |= members
+                continue
+            # An edge band: take the slice of its sorted prices in range.
+            entries = self._band_prices[band]
+            start, stop = 0, len(entries)
+            if min_price is not None:
+                start = bisect_left(entries, min_price, key=itemgetter(0))
+            if max_price is not None:
+                stop = bisect_right(entries, max_price, key=itemgetter(0))
+            bitmap |= bitmap_from_ids(
+                product_id for _, product_id in entries[start:stop]
+            )
+        return bitmap
+
+    def _tally(self, facet, bitmap):
+        """Count the values of ``facet`` by walking the products in ``bitmap``."""
+        # Count each distinct value tuple first, then spread the counts.
+        combinations = Counter(
+            map(
+                itemgetter(FACETS.index(facet)),
+                map(self._products.__getitem__, ids_from_bitmap(bitmap)),
+            )
+        )
+        tally = Counter()
+        for values, count in combinations.items():
+            for value in values:
+                tally[value] += count
+        return tally
+
+
+facet_index = FacetIndex()
@@ -0,0 +1,316 @@
+"""
+Typo-tolerant product search with a trigram index.
+
+Used by the product list when the full-text search finds nothing. Product
+and brand names are split into trigrams the way pg_trgm does it (each word
+lower-cased, padded with two blanks in front and one behind):
+
+* on SQLite a side table maps every trigram to its products. Candidates are
+  the products sharing at least SIMILARITY_THRESHOLD of the query's
+  trigrams, found through the (trigram, product_id) primary key, and are
+  ranked by that share;
+* on PostgreSQL a side table holds the text with a pg_trgm GIN index and
+  candidates come from the ``<%`` word similarity operator.
+
+Every name word also goes into a vocabulary table (with its trigrams on
+SQLite) used to suggest corrections for misspelled query words ("did you
+mean"). The side tables are kept in sync by the signals in ``shop.signals``.
+"""
+
+import math
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Value
+from django.db.models.expressions import RawSQL
+
+TRIGRAM_TABLE = "shop_product_trigram"
+WORD_TABLE = "shop_search_word"
+WORD_TRIGRAM_TABLE = "shop_search_word_trigram"
+PG_TABLE = "shop_product_fuzzy"
+
+# Share of the query's trigrams a product must contain.
+SIMILARITY_THRESHOLD = 0.5
+# Minimum similarity of a suggested correction (pg_trgm's default).
+WORD_SIMILARITY_THRESHOLD = 0.3
+# Candidates ranked per query; enough for the first pages of results.
+MAX_CANDIDATES = 500
+# Shorter words are neither corrected nor suggested.
+MIN_WORD_LENGTH = 3
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def is_supported(conn=None):
+    return (conn or connection).vendor in ("sqlite", "postgresql")
+
+
+def words(text):
+    return WORD_RE.findall(text.lower())
+
+
+def word_trigrams(word):
+    padded = f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def trigrams(text):
+    grams = set()
+    for word in words(text):
+        grams |= word_trigrams(word)
+    return grams
+
+
+def create_index(conn=None):
+    """Create the trigram side tables for the current database backend."""
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {TRIGRAM_TABLE} ("
+                "trigram TEXT NOT NULL, product_id INTEGER NOT NULL, "
+                "PRIMARY KEY (trigram, product_id)) WITHOUT ROWID"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {TRIGRAM_TABLE}_product_idx "
+                f"ON {TRIGRAM_TABLE} (product_id)"
+            )
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {WORD_TABLE} ("
+                "word TEXT PRIMARY KEY) WITHOUT ROWID"
+            )
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {WORD_TRIGRAM_TABLE} ("
+                "trigram TEXT NOT NULL, word TEXT NOT NULL, "
+                "PRIMARY KEY (trigram, word)) WITHOUT ROWID"
+            )
+        elif conn.vendor == "postgresql":
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {PG_TABLE} ("
+                "product_id bigint PRIMARY KEY "
+                "REFERENCES shop_product(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                "document text NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_TABLE}_document_idx "
+                f"ON {PG_TABLE} USING GIN (document gin_trgm_ops)"
+            )
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {WORD_TABLE} (word text PRIMARY KEY)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {WORD_TABLE}_word_trgm_idx "
+                f"ON {WORD_TABLE} USING GIN (word gin_trgm_ops)"
+            )
+
+
+def drop_index(conn=None):
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            for table in (TRIGRAM_TABLE, WORD_TABLE, WORD_TRIGRAM_TABLE):
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+        elif conn.vendor == "postgresql":
+            for table in (PG_TABLE, WORD_TABLE):
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+def product_row(product):
+    """Return the (id, text) row to index: product and brand names."""
+    brand = product.brand.name if product.brand_id else ""
+    return (product.pk, f"{product.name} {brand}".strip())
+
+
+def write_rows(rows, conn=None, replace=True):
+    """
+    Insert or replace index rows built by ``product_row``; ``replace=False``
+    skips deleting previous rows (the index is being rebuilt).
+    """
+    conn = conn or connection
+    rows = list(rows)
+    if not rows or not is_supported(conn):
+        return
+    vocabulary = {
+        word for _, text in rows for word in words(text) if len(word) >= MIN_WORD_LENGTH
+    }
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            if replace:
+                cursor.executemany(
+                    f"DELETE FROM {TRIGRAM_TABLE} WHERE product_id = %s",
+                    [(product_id,) for product_id, _ in rows],
+                )
+            # Inserting in key order keeps the B-tree writes local.
+            cursor.executemany(
+                f"INSERT INTO {TRIGRAM_TABLE} (trigram, product_id) VALUES (%s, %s)",
+                sorted(
+                    (trigram, product_id)
+                    for product_id, text in rows
+                    for trigram in trigrams(text)
+                ),
+            )
+            cursor.executemany(
+                f"INSERT OR IGNORE INTO {WORD_TABLE} (word) VALUES (%s)",
+                [(word,) for word in vocabulary],
+            )
+            cursor.executemany(
+                f"INSERT OR IGNORE INTO {WORD_TRIGRAM_TABLE} (trigram, word) "
+                "VALUES (%s, %s)",
+                sorted(
+                    (trigram, word)
+                    for word in vocabulary
+                    for trigram in word_trigrams(word)
+                ),
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {PG_TABLE} (product_id, document) VALUES (%s, %s) "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+            cursor.executemany(
+                f"INSERT INTO {WORD_TABLE} (word) VALUES (%s) ON CONFLICT DO NOTHING",
+                [(word,) for word in vocabulary],
+            )
+
+
+def index_products(products):
+    """(Re)index the given products; brands should be selected."""
+    write_rows(product_row(product) for product in products)
+
+
+def remove_products(product_ids):
+    product_ids = list(product_ids)
+    if not product_ids or not is_supported():
+        return
+    table = TRIGRAM_TABLE if connection.vendor == "sqlite" else PG_TABLE
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {table} WHERE product_id = %s",
+            [(product_id,) for product_id in product_ids],
+        )
+
+
+def reindex_queryset(queryset, batch_size=2000, conn=None, replace=True):
+    """Index every product of ``queryset`` in batches. Returns the row count."""
+    count = 0
+    batch = []
+    for product in queryset.select_related("brand").iterator(chunk_size=batch_size):
+        batch.append(product_row(product))
+        if len(batch) >= batch_size:
+            write_rows(batch, conn, replace)
+            count += len(batch)
+            batch = []
+    write_rows(batch, conn, replace)
+    return count + len(batch)
+
+
+def rebuild_index(queryset, batch_size=2000, conn=None):
+    """Rebuild the whole index from ``queryset``. Returns the row count."""
+    conn = conn or connection
+    if not is_supported(conn):
+        return 0
+    tables = (
+        (TRIGRAM_TABLE, WORD_TABLE, WORD_TRIGRAM_TABLE)
+        if conn.vendor == "sqlite"
+        else (PG_TABLE, WORD_TABLE)
+    )
+    with conn.cursor() as cursor:
+        for table in tables:
+            cursor.execute(f"DELETE FROM {table}")
+    return reindex_queryset(queryset, batch_size, conn, replace=False)
+
+
+def search(queryset, query):
+    """
+    Filter ``queryset`` to products similar to ``query`` and annotate a
+    ``search_rank`` (higher is more similar).
+    """
+    grams = sorted(trigrams(query))
+    if not grams or not is_supported():
+        return queryset.none().annotate(
+            search_rank=Value(0.0, output_field=FloatField())
+        )
+
+    if connection.vendor == "sqlite":
+        placeholders = ", ".join(["%s"] * len(grams))
+        min_shared = max(1, math.ceil(len(grams) * SIMILARITY_THRESHOLD))
+        return queryset.filter(
+            id__in=RawSQL(
+                f"SELECT product_id FROM {TRIGRAM_TABLE} "
+                f"WHERE trigram IN ({placeholders}) GROUP BY product_id "
+                f"HAVING COUNT(*) >= %s ORDER BY COUNT(*) DESC LIMIT {MAX_CANDIDATES}",
+                [*grams, min_shared],
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT CAST(COUNT(*) AS REAL) / %s FROM {TRIGRAM_TABLE} "
+                f'WHERE product_id = "shop_product"."id" '
+                f"AND trigram IN ({placeholders})",
+                [len(grams), *grams],
+                output_field=FloatField(),
+            )
+        )
+
+    return queryset.filter(
+        id__in=RawSQL(
+            f"SELECT product_id FROM {PG_TABLE} WHERE %s <%% document "
+            f"ORDER BY word_similarity(%s, document) DESC LIMIT {MAX_CANDIDATES}",
+            [query, query],
+        )
+    ).annotate(
+        search_rank=RawSQL(
+            f"SELECT word_similarity(%s, document) FROM {PG_TABLE} "
+            'WHERE product_id = "shop_product"."id"',
+            [query],
+            output_field=FloatField(),
+        )
+    )
+
+
+def correct_word(word):
+    """The closest indexed word to ``word``, or ``word`` itself."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT 1 FROM {WORD_TABLE} WHERE word = %s", [word])
+        if cursor.fetchone():
+            return word
+        if connection.vendor == "sqlite":
+            grams = sorted(word_trigrams(word))
+            placeholders = ", ".join(["%s"] * len(grams))
+            # Similarity as pg_trgm computes it: shared / (union of both sets);
+            # an indexed word of length n has at most n + 1 trigrams.
+            cursor.execute(
+                f"SELECT word, CAST(COUNT(*) AS REAL) / "
+                f"(%s + LENGTH(word) + 1 - COUNT(*)) AS similarity "
+                f"FROM {WORD_TRIGRAM_TABLE} WHERE trigram IN ({placeholders}) "
+                "GROUP BY word ORDER BY similarity DESC, word LIMIT 1",
+                [len(grams), *grams],
+            )
+        else:
+            cursor.execute(
+                f"SELECT word, similarity(word, %s) AS similarity FROM {WORD_TABLE} "
+                "WHERE word %% %s ORDER BY similarity DESC, word LIMIT 1",
+                [word, word],
+            )
+        row = cursor.fetchone()
+    if row and row[1] >= WORD_SIMILARITY_THRESHOLD:
+        return row[0]
+    return word
+
+
+def suggest(query):
+    """
+    Return ``query`` with misspelled words replaced by the closest indexed
+    words ("did you mean"), or None when there is nothing to correct.
+    """
+    if not is_supported():
+        return None
+    original = words(query)
+    corrected = [
+        correct_word(word) if len(word) >= MIN_WORD_LENGTH else word
+        for word in original
+    ]
+    if corrected == original:
+        return None
+    return " ".join(corrected)
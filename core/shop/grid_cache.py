@@ -0,0 +1,129 @@
+"""
+Rendered product grid fragments in the Django cache.
+
+Entries are keyed by the normalized catalog query string and the catalog
+version, a counter bumped by the Product/Category/Brand signals, so a
+change to the catalog makes every older fragment unreachable at once.
+Hit/miss counts and the render time saved by hits are kept in the cache
+too and reported by the ``grid_cache_stats`` command.
+
+The version and the counters are only shared by all workers, and by
+management commands such as the importer, when the cache is: use the Redis
+or database backend configured in settings, not a per-process LocMemCache.
+The database backend's ``incr`` is not atomic, so concurrent hits can be
+undercounted there; the version still changes on every bump.
+"""
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import QueryDict
+
+from .facets import FACETS
+
+# Query parameters that change the grid; anything else (utm_*, ...) is ignored.
+SINGLE_PARAMS = ("search", "sort", "page", "cursor", "min_price", "max_price")
+GRID_PARAMS = SINGLE_PARAMS + FACETS
+
+VERSION_KEY = "shop:grid:version"
+HITS_KEY = "shop:grid:hits"
+MISSES_KEY = "shop:grid:misses"
+SAVED_KEY = "shop:grid:saved_ms"
+
+
+def get_timeout():
+    return getattr(settings, "SHOP_GRID_CACHE_TIMEOUT", 600)
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Start from the clock so an evicted counter never reuses an old
+        # version whose fragments might still be cached.
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+
+
+def grid_query(query):
+    """
+    The grid parameters of a QueryDict in canonical form, as a QueryDict.
+    The grid is rendered from it, so a cached fragment only links to what
+    its key holds (never to another visitor's utm_* and the like).
+    """
+    grid = QueryDict(mutable=True)
+    for param in GRID_PARAMS:
+        values = sorted(value for value in query.getlist(param) if value)
+        if param in SINGLE_PARAMS:
+            values = values[-1:]
+        if param == "search":
+            values = [" ".join(value.lower().split()) for value in values]
+        if values:
+            grid.setlist(param, values)
+    grid._mutable = False
+    return grid
+
+
+def normalize_query(query):
+    """Canonical form of the grid parameters of a QueryDict."""
+    return grid_query(query).urlencode()
+
+
+def make_key(query):
+    digest = hashlib.md5(normalize_query(query).encode()).hexdigest()
+    return f"shop:grid:{get_version()}:{digest}"
+
+
+def _incr(key, delta=1):
+    try:
+        cache.incr(key, delta)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key, delta)
+
+
+def get_or_render(query, render):
+    """
+    Return ``(html, hit)`` for the grid of ``query``; on a miss the
+    fragment is produced by calling ``render()`` and cached.
+    """
+    key = make_key(query)
+    entry = cache.get(key)
+    if entry is not None:
+        html, render_ms = entry
+        _incr(HITS_KEY)
+        _incr(SAVED_KEY, render_ms)
+        return html, True
+
+    started = time.perf_counter()
+    html = render()
+    render_ms = int((time.perf_counter() - started) * 1000)
+    cache.set(key, (html, render_ms), get_timeout())
+    _incr(MISSES_KEY)
+    return html, False
+
+
+def get_stats():
+    hits = cache.get(HITS_KEY, 0)
+    misses = cache.get(MISSES_KEY, 0)
+    lookups = hits + misses
+    return {
+        "version": get_version(),
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / lookups if lookups else 0.0,
+        "saved_seconds": cache.get(SAVED_KEY, 0) / 1000,
+    }
+
+
+def reset_stats():
+    cache.delete_many([HITS_KEY, MISSES_KEY, SAVED_KEY])
@@ -0,0 +1,273 @@
+"""
+Streaming product import from supplier CSV/JSONL files.
+
+Rows are read lazily and processed in batches, so memory stays flat however
+large the file is. For every batch:
+
+* rows are validated; categories and brands are resolved by slug through
+  maps loaded once, and invalid rows are rejected with a reason;
+* slugs are generated in memory: a product that already exists (by name)
+  keeps its slug, new products get ``slugify(name)`` made unique against the
+  slugs taken in the database (one query per batch) and in the batch;
+* the batch is upserted on ``slug`` with one
+  ``bulk_create(update_conflicts=True)``, then its search index rows and
+  product cards are refreshed.
+
+``bulk_create`` sends no signals, so the catalog counters, price
+histograms and related products are recomputed once at the end by
+``finish``.
+"""
+
+import csv
+import json
+from decimal import Decimal, InvalidOperation
+from itertools import islice
+
+from django.db import transaction
+from django.utils.text import slugify
+
+from . import cards, counters, fuzzy, grid_cache, price_histogram, related, search
+from .models import Brand, Category, Product
+
+FORMATS = ("csv", "jsonl")
+UPDATE_FIELDS = (
+    "name",
+    "category",
+    "brand",
+    "description",
+    "price",
+    "stock",
+    "is_active",
+    "updated_at",
+)
+TRUE_VALUES = {"1", "true", "yes", "y", "on"}
+FALSE_VALUES = {"0", "false", "no", "n", "off"}
+SLUG_MAX_LENGTH = Product._meta.get_field("slug").max_length
+MAX_PRICE = Decimal(10) ** 8
+
+
+def read_rows(file, format):
+    """
+    Yield (line number, row) from an open text file: dicts for CSV, the raw
+    lines (parsed by ``ProductImporter.clean``) for JSONL.
+    """
+    if format == "csv":
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_number, line in enumerate(file, 1):
+        if line.strip():
+            yield line_number, line.strip()
+
+
+def _text(row, field):
+    value = row.get(field)
+    return "" if value is None else str(value).strip()
+
+
+def parse_price(value):
+    try:
+        price = Decimal(str(value).strip())
+    except InvalidOperation:
+        raise ValueError(f"invalid price {value!r}")
+    if not price.is_finite() or price < 0 or price >= MAX_PRICE:
+        raise ValueError(f"price out of range: {value!r}")
+    if price != price.quantize(Decimal("0.01")):
+        raise ValueError(f"price has more than two decimals: {value!r}")
+    return price.quantize(Decimal("0.01"))
+
+
+def parse_stock(value):
+    if value in (None, ""):
+        return 0
+    try:
+        stock = int(str(value).strip())
+    except ValueError:
+        raise ValueError(f"invalid stock {value!r}")
+    if stock < 0:
+        raise ValueError(f"negative stock {value!r}")
+    return stock
+
+
+def parse_bool(value):
+    if value in (None, ""):
+        return True
+    if isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in TRUE_VALUES:
+        return True
+    if text in FALSE_VALUES:
+        return False
+    raise ValueError(f"invalid is_active {value!r}")
+
+
+class ProductImporter:
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.categories = dict(Category.objects.values_list("slug", "id"))
+        self.brands = dict(Brand.objects.values_list("slug", "id"))
+        self.created = 0
+        self.updated = 0
+        self.rejected = 0
+
+    def clean(self, row):
+        """Return an unsaved Product for ``row``, raising ValueError if invalid."""
+        if isinstance(row, str):
+            try:
+                row = json.loads(row)
+            except json.JSONDecodeError as error:
+                raise ValueError(f"invalid JSON: {error.msg}")
+        if not isinstance(row, dict):
+            raise ValueError("row is not an object")
+        name = _text(row, "name")
+        if not name:
+            raise ValueError("name is required")
+        if len(name) > 255:
+            raise ValueError("name is longer than 255 characters")
+        category_id = self.categories.get(_text(row, "category"))
+        if category_id is None:
+            raise ValueError(f"unknown category {_text(row, 'category')!r}")
+        brand_slug = _text(row, "brand")
+        brand_id = None
+        if brand_slug:
+            brand_id = self.brands.get(brand_slug)
+            if brand_id is None:
+                raise ValueError(f"unknown brand {brand_slug!r}")
+        slug = _text(row, "slug")
+        if slug and (slugify(slug) != slug or len(slug) > SLUG_MAX_LENGTH):
+            raise ValueError(f"invalid slug {slug!r}")
+        return Product(
+            name=name,
+            slug=slug,
+            category_id=category_id,
+            brand_id=brand_id,
+            description=_text(row, "description"),
+            price=parse_price(row.get("price")),
+            stock=parse_stock(row.get("stock")),
+            is_active=parse_bool(row.get("is_active")),
+        )
+
+    def run(self, rows):
+        """
+        Import ``rows`` ((line number, row) pairs). Yields
+        (line number, row, reason) for every rejected row.
+        """
+        rows = iter(rows)
+        while batch := list(islice(rows, self.batch_size)):
+            products = []
+            for line_number, row in batch:
+                try:
+                    products.append((line_number, row, self.clean(row)))
+                except ValueError as error:
+                    self.rejected += 1
+                    yield line_number, row, str(error)
+            for line_number, row, reason in self.import_batch(products):
+                self.rejected += 1
+                yield line_number, row, reason
+
+    def import_batch(self, products):
+        """Upsert one batch of cleaned products; returns the rejected rows."""
+        rejected = []
+        names = {product.name for _, _, product in products}
+        existing = dict(
+            Product.objects.filter(name__in=names).values_list("name", "slug")
+        )
+        by_name = {}
+        for line_number, row, product in products:
+            current_slug = existing.get(product.name)
+            if product.slug and current_slug and product.slug != current_slug:
+                rejected.append(
+                    (line_number, row, f"name already used by {current_slug!r}")
+                )
+                continue
+            product.slug = product.slug or current_slug or ""
+            # Later rows for the same product win.
+            by_name[product.name] = (line_number, row, product)
+
+        self.assign_slugs(
+            [product for _, _, product in by_name.values() if not product.slug],
+            reserved={product.slug for _, _, product in by_name.values()},
+        )
+        by_slug = {}
+        for line_number, row, product in by_name.values():
+            if product.slug in by_slug:
+                previous = by_slug[product.slug]
+                rejected.append(
+                    (
+                        previous[0],
+                        previous[1],
+                        f"slug {product.slug!r} is used again on line {line_number}",
+                    )
+                )
+            by_slug[product.slug] = (line_number, row, product)
+        batch = [product for _, _, product in by_slug.values()]
+        if not batch:
+            return rejected
+
+        existing_slugs = set(
+            Product.objects.filter(
+                slug__in=[product.slug for product in batch]
+            ).values_list("slug", flat=True)
+        )
+        with transaction.atomic():
+            Product.objects.bulk_create(
+                batch,
+                update_conflicts=True,
+                unique_fields=["slug"],
+                update_fields=UPDATE_FIELDS,
+            )
+            ids = list(
+                Product.objects.filter(
+                    slug__in=[product.slug for product in batch]
+                ).values_list("id", flat=True)
+            )
+            imported = Product.objects.filter(pk__in=ids)
+            search.reindex_queryset(imported)
+            fuzzy.reindex_queryset(imported)
+            cards.refresh_cards(ids)
+        updated = sum(1 for product in batch if product.slug in existing_slugs)
+        self.updated += updated
+        self.created += len(batch) - updated
+        return rejected
+
+    def assign_slugs(self, products, reserved=()):
+        """
+        Give ``products`` unique slugs based on their names, avoiding the
+        ``reserved`` slugs and those already in the database.
+        """
+        if not products:
+            return
+        bases = [
+            (slugify(product.name) or "product")[:SLUG_MAX_LENGTH]
+            for product in products
+        ]
+        taken = set(reserved)
+        taken.update(
+            Product.objects.filter(slug__in=set(bases)).values_list("slug", flat=True)
+        )
+        for product, base in zip(products, bases):
+            slug = base
+            if slug in taken:
+                # Rare: load the numbered variants of this base once.
+                taken.update(
+                    Product.objects.filter(slug__startswith=f"{base}-").values_list(
+                        "slug", flat=True
+                    )
+                )
+                number = 2
+                while slug in taken:
+                    suffix = f"-{number}"
+                    slug = base[: SLUG_MAX_LENGTH - len(suffix)] + suffix
+                    number += 1
+            taken.add(slug)
+            product.slug = slug
+
+    def finish(self):
+        """Recompute the data kept up to date by Product signals."""
+        for model in (Category, Brand):
+            counters.rebuild(model)
+        price_histogram.rebuild()
+        related.rebuild()
+        grid_cache.bump_version()
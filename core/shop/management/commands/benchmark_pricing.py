@@ -0,0 +1,118 @@
+import gc
+import random
+import time
+from array import array
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop import pricing
+from shop.models import Product
+
+
+def timed(function):
+    """(result, seconds) of ``function()``, without garbage collection pauses."""
+    gc.collect()
+    gc.disable()
+    try:
+        started = time.perf_counter()
+        result = function()
+        return result, time.perf_counter() - started
+    finally:
+        gc.enable()
+
+
+class Command(BaseCommand):
+    help = "⏱️ Compare batch pricing with the per-product Decimal path"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--count", type=int, default=100000, help="Number of products"
+        )
+        parser.add_argument("--seed", type=int, default=0, help="Random seed")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        count = options["count"]
+        # Unsaved products: the benchmark measures pricing, not queries.
+        products = [
+            Product(
+                price=Decimal(rng.randint(1, 500000)).scaleb(-2),
+                category_id=rng.randint(1, 50),
+                brand_id=rng.choice([None] + list(range(1, 200))),
+            )
+            for _ in range(count)
+        ]
+        rules = pricing.PricingRules(
+            category_tax_rates={
+                category_id: rng.choice(["0", "0.05", "0.09", "0.2"])
+                for category_id in range(1, 50, 3)
+            },
+            discount="0.05",
+            brand_discounts={
+                brand_id: rng.choice(["0.15", "0.333", "2.50", "10"])
+                for brand_id in range(1, 200, 4)
+            },
+        )
+
+        scenarios = (
+            ("list prices", pricing.PricingRules(), False),
+            ("tax and discounts", rules, True),
+        )
+        for name, scenario_rules, include_tax in scenarios:
+            self.stdout.write(f"📦 {count} products, {name}")
+            self.run(products, scenario_rules, include_tax)
+
+    def run(self, products, rules, include_tax):
+        count = len(products)
+        expected, per_object = timed(
+            lambda: [
+                pricing.price_one(
+                    product.price,
+                    product.category_id,
+                    product.brand_id,
+                    rules,
+                    include_tax,
+                )
+                for product in products
+            ]
+        )
+        prices, batch = timed(
+            lambda: pricing.price_products(products, rules, include_tax)
+        )
+
+        cents = array("q", (pricing.to_cents(product.price) for product in products))
+        category_ids = [product.category_id for product in products]
+        brand_ids = [product.brand_id for product in products]
+        final_cents, arrays = timed(
+            lambda: pricing.price_cents(
+                cents, category_ids, brand_ids, rules, include_tax
+            )
+        )
+        prices_from_cents = list(map(pricing.from_cents, final_cents))
+
+        # Compare the strings too: "10.00" and "10.0" are equal Decimals.
+        mismatches = sum(
+            1
+            for a, b, c in zip(expected, prices, prices_from_cents)
+            if not (str(a) == str(b) == str(c))
+        )
+        if mismatches:
+            raise CommandError(f"❌ {mismatches} prices differ from the Decimal path")
+
+        for label, seconds in (
+            ("Per product (Decimal)", per_object),
+            ("Batch (products)", batch),
+            ("Batch (cent arrays)", arrays),
+        ):
+            self.stdout.write(
+                f"{label:<22} {seconds * 1000:8.1f} ms "
+                f"{count / seconds:12,.0f} prices/s"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ {count} identical prices; speed-up over per product: "
+                f"{per_object / batch:.1f}x (products), "
+                f"{per_object / arrays:.1f}x (cent arrays)"
+            )
+        )
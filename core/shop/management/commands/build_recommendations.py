@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import recommendations
+
+
+class Command(BaseCommand):
+    help = "🛒 Update the products-bought-together recommendations"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--full",
+            action="store_true",
+            help="Recount every cart and order instead of only the new ones",
+        )
+        parser.add_argument("--top-k", type=int, default=recommendations.TOP_K)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        baskets, pairs, products = recommendations.build(
+            full=options["full"], top_k=options["top_k"]
+        )
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Read {baskets} baskets, updated {pairs} pair counts and "
+                f"{products} neighbour lists in {elapsed:.2f}s"
+            )
+        )
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+
+from shop import grid_cache
+
+
+class Command(BaseCommand):
+    help = (
+        "📊 Show product grid cache hit ratio and render time saved "
+        "(for all workers sharing the cache backend)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--reset", action="store_true", help="Reset the counters afterwards"
+        )
+
+    def handle(self, *args, **options):
+        stats = grid_cache.get_stats()
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Catalog version {stats['version']}: "
+                f"{stats['hits']} hits, {stats['misses']} misses "
+                f"({stats['hit_ratio']:.1%} hit ratio), "
+                f"{stats['saved_seconds']:.2f}s of rendering saved"
+            )
+        )
+        if options["reset"]:
+            grid_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS("🧹 Counters reset"))
@@ -0,0 +1,77 @@
+import csv
+import json
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from shop.importer import FORMATS, ProductImporter, read_rows
+
+# Rejected rows printed to the console; the rest only go to --rejects.
+SHOWN_REJECTS = 20
+
+
+class Command(BaseCommand):
+    help = "📥 Import products from a supplier CSV/JSONL file"
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="CSV or JSONL file")
+        parser.add_argument(
+            "--format",
+            choices=FORMATS,
+            help="File format (default: from the file extension)",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="Rows per upsert"
+        )
+        parser.add_argument(
+            "--rejects", help="Write the rejected rows and reasons to this JSONL file"
+        )
+
+    def handle(self, *args, **options):
+        path = options["path"]
+        format = options["format"] or os.path.splitext(path)[1].lstrip(".").lower()
+        if format not in FORMATS:
+            raise CommandError(f"Unknown format {format!r}, use --format")
+        if options["batch_size"] < 1:
+            raise CommandError("--batch-size must be positive")
+
+        importer = ProductImporter(batch_size=options["batch_size"])
+        rejects_file = open(options["rejects"], "w") if options["rejects"] else None
+        started = time.perf_counter()
+        try:
+            with open(path, newline="" if format == "csv" else None) as file:
+                for line_number, row, reason in importer.run(read_rows(file, format)):
+                    if importer.rejected <= SHOWN_REJECTS:
+                        self.stdout.write(
+                            self.style.WARNING(f"⚠️ Line {line_number}: {reason}")
+                        )
+                    if rejects_file:
+                        rejects_file.write(
+                            json.dumps(
+                                {"line": line_number, "reason": reason, "row": row}
+                            )
+                            + "\n"
+                        )
+        except (OSError, UnicodeDecodeError, csv.Error) as error:
+            raise CommandError(f"Could not read {path}: {error}")
+        finally:
+            if rejects_file:
+                rejects_file.close()
+        imported = time.perf_counter() - started
+
+        self.stdout.write("Rebuilding counters, histograms and related products...")
+        importer.finish()
+
+        rows = importer.created + importer.updated + importer.rejected
+        rate = rows / imported if imported else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ {importer.created} created, {importer.updated} updated "
+                f"in {imported:.1f}s ({rate:,.0f} rows/s)"
+            )
+        )
+        if importer.rejected:
+            self.stdout.write(
+                self.style.WARNING(f"⚠️ {importer.rejected} rows rejected")
+            )
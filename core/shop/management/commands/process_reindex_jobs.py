@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop.catalog_sync import process_reindex_jobs
+
+
+class Command(BaseCommand):
+    help = "🔁 Reindex the products of renamed brands and categories"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=100,
+            help="Number of queued brands/categories processed per batch.",
+        )
+        parser.add_argument(
+            "--loop",
+            type=float,
+            default=0,
+            help="Keep running as a worker, sleeping this many seconds between runs.",
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        interval = options["loop"]
+
+        while True:
+            processed = 0
+            while True:
+                count = process_reindex_jobs(batch_size=batch_size)
+                processed += count
+                if count < batch_size:
+                    break
+
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ Processed {processed} reindex jobs.")
+            )
+            if not interval:
+                return
+            time.sleep(interval)
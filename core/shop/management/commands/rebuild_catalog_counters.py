@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand
+
+from shop import counters
+from shop.models import Brand, Category
+
+
+class Command(BaseCommand):
+    help = "🔢 Recompute the product counters on categories and brands"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drift, don't fix it",
+        )
+
+    def handle(self, *args, **options):
+        fix = not options["dry_run"]
+        total = 0
+        for model in (Category, Brand):
+            drifted = counters.rebuild(model, fix=fix)
+            total += len(drifted)
+            for obj, stored, actual in drifted:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f"⚠️ {model.__name__} '{obj.name}': "
+                        f"active {stored[0]} → {actual[0]}, "
+                        f"in stock {stored[1]} → {actual[1]}"
+                    )
+                )
+
+        if not total:
+            self.stdout.write(self.style.SUCCESS("✅ All counters are up to date"))
+        elif fix:
+            self.stdout.write(self.style.SUCCESS(f"✅ Fixed {total} drifted counters"))
+        else:
+            self.stdout.write(
+                self.style.WARNING(f"⚠️ {total} drifted counters (dry run)")
+            )
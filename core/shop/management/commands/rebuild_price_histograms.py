@@ -0,0 +1,37 @@
+from django.core.management.base import BaseCommand
+
+from shop import price_histogram
+
+
+class Command(BaseCommand):
+    help = "📊 Recompute the per-category price histograms"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drift, don't fix it",
+        )
+
+    def handle(self, *args, **options):
+        fix = not options["dry_run"]
+        drifted = price_histogram.rebuild(fix=fix)
+        for category_id, bucket, stored, actual in drifted:
+            low, high = price_histogram.bucket_bounds(bucket)
+            bounds = f"${low}–${high}" if high is not None else f"${low}+"
+            self.stdout.write(
+                self.style.WARNING(
+                    f"⚠️ Category #{category_id} {bounds}: {stored} → {actual}"
+                )
+            )
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS("✅ All histograms are up to date"))
+        elif fix:
+            self.stdout.write(
+                self.style.SUCCESS(f"✅ Fixed {len(drifted)} drifted bins")
+            )
+        else:
+            self.stdout.write(
+                self.style.WARNING(f"⚠️ {len(drifted)} drifted bins (dry run)")
+            )
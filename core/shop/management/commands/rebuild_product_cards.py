@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import cards
+
+
+class Command(BaseCommand):
+    help = "🃏 Rebuild the product card read model used by listing pages"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = cards.rebuild_cards(batch_size=options["batch_size"])
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ Rebuilt {count} product cards in {elapsed:.2f}s")
+        )
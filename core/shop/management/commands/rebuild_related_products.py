@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import related
+
+
+class Command(BaseCommand):
+    help = "🔗 Recompute the related products shown on product pages"
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        count = related.rebuild()
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"✅ Refreshed related products of {count} categories in {elapsed:.2f}s"
+            )
+        )
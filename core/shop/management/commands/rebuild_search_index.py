@@ -0,0 +1,34 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from shop import fuzzy, search
+from shop.models import Product
+
+
+class Command(BaseCommand):
+    help = "🔍 Rebuild the product full-text and trigram search indexes"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(
+                self.style.WARNING(
+                    "⚠️ Full-text search is not supported on this database."
+                )
+            )
+            return
+
+        started = time.monotonic()
+        search.create_index()
+        count = search.rebuild_index(
+            Product.objects.all(), batch_size=options["batch_size"]
+        )
+        fuzzy.create_index()
+        fuzzy.rebuild_index(Product.objects.all(), batch_size=options["batch_size"])
+        elapsed = time.monotonic() - started
+        self.stdout.write(
+            self.style.SUCCESS(f"✅ Indexed {count} products in {elapsed:.2f}s")
+        )
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0003_alter_product_image"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="product",
+            name="reserved",
+            field=models.PositiveIntegerField(
+                default=0, help_text="Units currently held by cart reservations."
+            ),
+        ),
+    ]
@@ -0,0 +1,67 @@
+from django.db import migrations
+
+# The DDL is frozen here rather than imported from shop.search, so later
+# changes to that module can't alter what this migration does.
+PRODUCT_ROWS = (
+    "SELECT p.id, p.name, p.description, COALESCE(b.name, ''), "
+    "COALESCE(c.name, '') FROM shop_product p "
+    "LEFT JOIN shop_brand b ON b.id = p.brand_id "
+    "LEFT JOIN shop_category c ON c.id = p.category_id"
+)
+
+
+def create_search_index(apps, schema_editor):
+    conn = schema_editor.connection
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            cursor.execute(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_fts "
+                "USING fts5(name, description, brand, category, "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+            cursor.execute("DELETE FROM shop_product_fts")
+            cursor.execute(
+                "INSERT INTO shop_product_fts(rowid, name, description, brand, category) "
+                + PRODUCT_ROWS
+            )
+        elif conn.vendor == "postgresql":
+            cursor.execute(
+                "CREATE TABLE IF NOT EXISTS shop_product_search ("
+                "product_id bigint PRIMARY KEY "
+                "REFERENCES shop_product(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                "document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                "CREATE INDEX IF NOT EXISTS shop_product_search_document_idx "
+                "ON shop_product_search USING GIN (document)"
+            )
+            cursor.execute("DELETE FROM shop_product_search")
+            cursor.execute(
+                "INSERT INTO shop_product_search(product_id, document) "
+                "SELECT id, "
+                "setweight(to_tsvector('english', name), 'A') || "
+                "setweight(to_tsvector('english', description), 'D') || "
+                "setweight(to_tsvector('english', brand), 'B') || "
+                "setweight(to_tsvector('english', category), 'C') "
+                f"FROM ({PRODUCT_ROWS}) AS rows(id, name, description, brand, category)"
+            )
+
+
+def drop_search_index(apps, schema_editor):
+    conn = schema_editor.connection
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            cursor.execute("DROP TABLE IF EXISTS shop_product_fts")
+        elif conn.vendor == "postgresql":
+            cursor.execute("DROP TABLE IF EXISTS shop_product_search")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0004_product_reserved"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
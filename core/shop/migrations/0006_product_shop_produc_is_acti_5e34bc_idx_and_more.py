@@ -0,0 +1,34 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0005_product_search_index"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["is_active", "price", "id"],
+                name="shop_produc_is_acti_5e34bc_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["is_active", "name", "id"],
+                name="shop_produc_is_acti_f2de54_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="product",
+            index=models.Index(
+                fields=["is_active", "created_at", "id"],
+                name="shop_produc_is_acti_4a6f9d_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:38
+
+from django.db import migrations, models
+
+
+def build_category_paths(apps, schema_editor):
+    Category = apps.get_model("shop", "Category")
+    categories = {category.pk: category for category in Category.objects.all()}
+
+    def fill(category):
+        if category.path:
+            return
+        if category.parent_id:
+            parent = categories[category.parent_id]
+            fill(parent)
+            category.path = f"{parent.path}{category.pk}/"
+            category.depth = parent.depth + 1
+            category.full_name = f"{parent.full_name} > {category.name}"
+        else:
+            category.path = f"{category.pk}/"
+            category.depth = 0
+            category.full_name = category.name
+
+    for category in categories.values():
+        fill(category)
+    Category.objects.bulk_update(
+        categories.values(), ["path", "depth", "full_name"], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0006_product_shop_produc_is_acti_5e34bc_idx_and_more"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="depth",
+            field=models.PositiveSmallIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="full_name",
+            field=models.CharField(blank=True, editable=False, max_length=1024),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="path",
+            field=models.CharField(blank=True, editable=False, max_length=255),
+        ),
+        migrations.AddIndex(
+            model_name="category",
+            index=models.Index(fields=["path"], name="shop_catego_path_1440f7_idx"),
+        ),
+        migrations.RunPython(build_category_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,55 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:41
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def count_products(apps, schema_editor):
+    active = Q(products__is_active=True)
+    for model_name in ("Category", "Brand"):
+        model = apps.get_model("shop", model_name)
+        rows = list(
+            model.objects.annotate(
+                actual_active=Count("products", filter=active),
+                actual_in_stock=Count(
+                    "products", filter=active & Q(products__stock__gt=0)
+                ),
+            )
+        )
+        for row in rows:
+            row.active_product_count = row.actual_active
+            row.in_stock_product_count = row.actual_in_stock
+        model.objects.bulk_update(
+            rows, ["active_product_count", "in_stock_product_count"], batch_size=500
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0007_category_tree"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="brand",
+            name="active_product_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="brand",
+            name="in_stock_product_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="active_product_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name="category",
+            name="in_stock_product_count",
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
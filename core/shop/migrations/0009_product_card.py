@@ -0,0 +1,77 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.urls import reverse
+
+
+def build_cards(apps, schema_editor):
+    Product = apps.get_model("shop", "Product")
+    ProductCard = apps.get_model("shop", "ProductCard")
+    products = (
+        Product.objects.filter(is_active=True)
+        .select_related("brand", "category")
+        .defer("description")
+    )
+    ProductCard.objects.bulk_create(
+        (
+            ProductCard(
+                product_id=product.pk,
+                name=product.name,
+                url=reverse("shop:product-single", args=[product.slug]),
+                thumbnail_url=product.image.url if product.image else "",
+                display_price=product.price,
+                brand_name=product.brand.name if product.brand_id else "",
+                category_slug=product.category.slug,
+                in_stock=product.stock > 0,
+                created_at=product.created_at,
+            )
+            for product in products.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0008_catalog_counters"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductCard",
+            fields=[
+                (
+                    "product",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="card",
+                        serialize=False,
+                        to="shop.product",
+                    ),
+                ),
+                ("name", models.CharField(max_length=255)),
+                ("url", models.CharField(max_length=512)),
+                ("thumbnail_url", models.CharField(blank=True, max_length=512)),
+                ("display_price", models.DecimalField(decimal_places=2, max_digits=10)),
+                ("brand_name", models.CharField(blank=True, max_length=255)),
+                ("category_slug", models.SlugField(max_length=255)),
+                ("in_stock", models.BooleanField(default=False)),
+                ("created_at", models.DateTimeField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["created_at"], name="shop_produc_created_3cdc3c_idx"
+                    ),
+                    models.Index(
+                        fields=["category_slug", "created_at"],
+                        name="shop_produc_categor_a50aa0_idx",
+                    ),
+                ],
+            },
+        ),
+        migrations.RunPython(build_cards, migrations.RunPython.noop),
+    ]
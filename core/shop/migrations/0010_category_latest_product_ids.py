@@ -0,0 +1,31 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:46
+
+from django.db import migrations, models
+
+
+def compute_latest_products(apps, schema_editor):
+    Category = apps.get_model("shop", "Category")
+    Product = apps.get_model("shop", "Product")
+    for category in Category.objects.all():
+        category.latest_product_ids = list(
+            Product.objects.filter(category=category, is_active=True)
+            .order_by("-created_at", "-id")
+            .values_list("pk", flat=True)[:5]
+        )
+        category.save(update_fields=["latest_product_ids"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0009_product_card"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="category",
+            name="latest_product_ids",
+            field=models.JSONField(default=list, editable=False),
+        ),
+        migrations.RunPython(compute_latest_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,107 @@
+# Generated by Django 4.2.30 on 2026-10-18 01:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0010_category_latest_product_ids"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ProductPairCount",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("product_a", models.PositiveIntegerField()),
+                ("product_b", models.PositiveIntegerField()),
+                ("count", models.IntegerField(default=0)),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["product_b"], name="shop_produc_product_5087c5_idx"
+                    )
+                ],
+                "unique_together": {("product_a", "product_b")},
+            },
+        ),
+        migrations.CreateModel(
+            name="CoCartBasket",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "source",
+                    models.CharField(
+                        choices=[("cart", "Cart"), ("order", "Order")], max_length=10
+                    ),
+                ),
+                ("source_id", models.PositiveIntegerField()),
+                ("product_ids", models.JSONField(default=list)),
+                ("source_updated_at", models.DateTimeField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["source", "source_updated_at"],
+                        name="shop_cocart_source_ddd7d3_idx",
+                    )
+                ],
+                "unique_together": {("source", "source_id")},
+            },
+        ),
+        migrations.CreateModel(
+            name="ProductNeighbor",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("score", models.FloatField()),
+                ("rank", models.PositiveSmallIntegerField()),
+                (
+                    "neighbor",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="shop.product",
+                    ),
+                ),
+                (
+                    "product",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="neighbors",
+                        to="shop.product",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["product", "rank"],
+                "unique_together": {("product", "rank")},
+            },
+        ),
+    ]
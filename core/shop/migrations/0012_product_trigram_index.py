@@ -0,0 +1,154 @@
+import re
+
+from django.db import migrations
+
+# The DDL and trigram helpers are frozen here rather than imported from
+# shop.fuzzy, so later changes to that module can't alter this migration.
+MIN_WORD_LENGTH = 3
+BATCH_SIZE = 2000
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def words(text):
+    return WORD_RE.findall(text.lower())
+
+
+def word_trigrams(word):
+    padded = f"  {word} "
+    return {padded[i : i + 3] for i in range(len(padded) - 2)}
+
+
+def trigrams(text):
+    grams = set()
+    for word in words(text):
+        grams |= word_trigrams(word)
+    return grams
+
+
+def create_tables(cursor, vendor):
+    if vendor == "sqlite":
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS shop_product_trigram ("
+            "trigram TEXT NOT NULL, product_id INTEGER NOT NULL, "
+            "PRIMARY KEY (trigram, product_id)) WITHOUT ROWID"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS shop_product_trigram_product_idx "
+            "ON shop_product_trigram (product_id)"
+        )
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS shop_search_word ("
+            "word TEXT PRIMARY KEY) WITHOUT ROWID"
+        )
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS shop_search_word_trigram ("
+            "trigram TEXT NOT NULL, word TEXT NOT NULL, "
+            "PRIMARY KEY (trigram, word)) WITHOUT ROWID"
+        )
+    else:
+        cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS shop_product_fuzzy ("
+            "product_id bigint PRIMARY KEY "
+            "REFERENCES shop_product(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+            "document text NOT NULL)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS shop_product_fuzzy_document_idx "
+            "ON shop_product_fuzzy USING GIN (document gin_trgm_ops)"
+        )
+        cursor.execute(
+            "CREATE TABLE IF NOT EXISTS shop_search_word (word text PRIMARY KEY)"
+        )
+        cursor.execute(
+            "CREATE INDEX IF NOT EXISTS shop_search_word_word_trgm_idx "
+            "ON shop_search_word USING GIN (word gin_trgm_ops)"
+        )
+
+
+def write_rows(cursor, vendor, rows):
+    vocabulary = {
+        word for _, text in rows for word in words(text) if len(word) >= MIN_WORD_LENGTH
+    }
+    if vendor == "sqlite":
+        cursor.executemany(
+            "INSERT OR IGNORE INTO shop_product_trigram (trigram, product_id) "
+            "VALUES (%s, %s)",
+            sorted(
+                (trigram, product_id)
+                for product_id, text in rows
+                for trigram in trigrams(text)
+            ),
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO shop_search_word (word) VALUES (%s)",
+            [(word,) for word in vocabulary],
+        )
+        cursor.executemany(
+            "INSERT OR IGNORE INTO shop_search_word_trigram (trigram, word) "
+            "VALUES (%s, %s)",
+            sorted(
+                (trigram, word)
+                for word in vocabulary
+                for trigram in word_trigrams(word)
+            ),
+        )
+    else:
+        cursor.executemany(
+            "INSERT INTO shop_product_fuzzy (product_id, document) VALUES (%s, %s) "
+            "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+            rows,
+        )
+        cursor.executemany(
+            "INSERT INTO shop_search_word (word) VALUES (%s) ON CONFLICT DO NOTHING",
+            [(word,) for word in vocabulary],
+        )
+
+
+def create_trigram_index(apps, schema_editor):
+    conn = schema_editor.connection
+    if conn.vendor not in ("sqlite", "postgresql"):
+        return
+    Product = apps.get_model("shop", "Product")
+    products = Product.objects.values_list("pk", "name", "brand__name").iterator(
+        chunk_size=BATCH_SIZE
+    )
+    with conn.cursor() as cursor:
+        create_tables(cursor, conn.vendor)
+        batch = []
+        for pk, name, brand in products:
+            batch.append((pk, f"{name} {brand or ''}".strip()))
+            if len(batch) >= BATCH_SIZE:
+                write_rows(cursor, conn.vendor, batch)
+                batch = []
+        if batch:
+            write_rows(cursor, conn.vendor, batch)
+
+
+def drop_trigram_index(apps, schema_editor):
+    conn = schema_editor.connection
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            tables = (
+                "shop_product_trigram",
+                "shop_search_word",
+                "shop_search_word_trigram",
+            )
+        elif conn.vendor == "postgresql":
+            tables = ("shop_product_fuzzy", "shop_search_word")
+        else:
+            tables = ()
+        for table in tables:
+            cursor.execute(f"DROP TABLE IF EXISTS {table}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0011_co_cart_recommendations"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+    ]
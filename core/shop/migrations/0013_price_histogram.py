@@ -0,0 +1,85 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:01
+
+from decimal import Decimal
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Case, Count, Value, When
+
+# The bucket edges as of this migration, frozen rather than imported from
+# shop.price_histogram; 0017 recounts with the later edges.
+BUCKET_EDGES = tuple(
+    Decimal(edge)
+    for edge in (
+        "0", "10", "20", "30", "40", "50", "75", "100", "150", "200",
+        "250", "300", "400", "500", "750", "1000", "1500", "2000", "5000",
+    )
+)  # fmt: skip
+
+
+def bucket_expression():
+    return Case(
+        *(
+            When(price__lt=high, then=Value(bucket))
+            for bucket, high in enumerate(BUCKET_EDGES[1:])
+        ),
+        default=Value(len(BUCKET_EDGES) - 1),
+    )
+
+
+def count_products(apps, schema_editor):
+    Product = apps.get_model("shop", "Product")
+    PriceHistogramBin = apps.get_model("shop", "PriceHistogramBin")
+    rows = (
+        Product.objects.filter(is_active=True)
+        .annotate(bucket=bucket_expression())
+        .values("category_id", "bucket")
+        .annotate(count=Count("id"))
+        .order_by()
+        .values_list("category_id", "bucket", "count")
+    )
+    PriceHistogramBin.objects.bulk_create(
+        (
+            PriceHistogramBin(category_id=category_id, bucket=bucket, count=count)
+            for category_id, bucket, count in rows
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0012_product_trigram_index"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PriceHistogramBin",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("bucket", models.PositiveSmallIntegerField()),
+                ("count", models.PositiveIntegerField(default=0)),
+                (
+                    "category",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="price_bins",
+                        to="shop.category",
+                    ),
+                ),
+            ],
+            options={
+                "unique_together": {("category", "bucket")},
+            },
+        ),
+        migrations.RunPython(count_products, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 4.2.30 on 2026-10-18 02:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("shop", "0014_promotions"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="category",
+            name="shop_catego_path_1440f7_idx",
+        ),
+        migrations.AddIndex(
+            model_name="category",
+            index=models.Index(
+                fields=["path"],
+                name="shop_category_path_pattern_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
+        ),
+    ]
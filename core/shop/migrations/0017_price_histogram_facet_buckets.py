@@ -0,0 +1,56 @@
+from decimal import Decimal
+
+from django.db import migrations
+from django.db.models import Case, Count, Value, When
+
+# The price facet's bucket edges as of this migration, frozen rather than
+# imported from shop.price_histogram.
+BUCKET_EDGES = tuple(
+    Decimal(edge)
+    for edge in (
+        "0", "25", "50", "75", "100", "150", "250", "500", "1000",
+    )
+)  # fmt: skip
+
+
+def bucket_expression():
+    return Case(
+        *(
+            When(price__lt=high, then=Value(bucket))
+            for bucket, high in enumerate(BUCKET_EDGES[1:])
+        ),
+        default=Value(len(BUCKET_EDGES) - 1),
+    )
+
+
+def recount_products(apps, schema_editor):
+    Product = apps.get_model("shop", "Product")
+    PriceHistogramBin = apps.get_model("shop", "PriceHistogramBin")
+    PriceHistogramBin.objects.all().delete()
+    rows = (
+        Product.objects.filter(is_active=True)
+        .annotate(bucket=bucket_expression())
+        .values("category_id", "bucket")
+        .annotate(count=Count("id"))
+        .order_by()
+        .values_list("category_id", "bucket", "count")
+    )
+    PriceHistogramBin.objects.bulk_create(
+        (
+            PriceHistogramBin(category_id=category_id, bucket=bucket, count=count)
+            for category_id, bucket, count in rows
+        ),
+        batch_size=500,
+    )
+
+
+class Migration(migrations.Migration):
+    """The histogram buckets are now the price facet's buckets."""
+
+    dependencies = [
+        ("shop", "0016_taxonomy_reindex"),
+    ]
+
+    operations = [
+        migrations.RunPython(recount_products, migrations.RunPython.noop),
+    ]
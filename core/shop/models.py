@@ -1,10 +1,37 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models import F, Q, Value
+from django.db.models.functions import Concat, Substr
 from django.utils.text import slugify
 from django.urls import reverse
-from decimal import Decimal
 from imagekit.models import ProcessedImageField
 from imagekit.processors import ResizeToFill
 
+from . import pricing
+
+# Maintained with queryset updates (shop.counters, shop.related); never
+# written by save().
+DERIVED_FIELDS = (
+    "active_product_count",
+    "in_stock_product_count",
+    "latest_product_ids",
+)
+
+
+def _exclude_derived(instance, kwargs):
+    """
+    Saving a loaded Brand/Category must not write back its (possibly stale)
+    in-memory derived fields over the ones maintained in the database.
+    """
+    if instance._state.adding or kwargs.get("force_insert"):
+        return
+    if kwargs.get("update_fields") is None:
+        kwargs["update_fields"] = [
+            field.name
+            for field in instance._meta.concrete_fields
+            if not field.primary_key and field.name not in DERIVED_FIELDS
+        ]
+
 
 class Brand(models.Model):
     """
@@ -17,6 +44,8 @@ class Brand(models.Model):
     description = models.TextField(blank=True)
     website = models.URLField(blank=True)
     is_active = models.BooleanField(default=True)
+    active_product_count = models.PositiveIntegerField(default=0, editable=False)
+    in_stock_product_count = models.PositiveIntegerField(default=0, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -33,6 +62,7 @@ class Brand(models.Model):
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        _exclude_derived(self, kwargs)
         super().save(*args, **kwargs)
 
     def get_absolute_url(self):
@@ -43,8 +73,16 @@ class Category(models.Model):
     """
     Category model for organizing products.
     Supports slug URLs and optional parent category for hierarchy.
+
+    The hierarchy is also stored as a materialized path (``path``, e.g.
+    "1/5/12/") with ``depth`` and the joined ancestor names (``full_name``),
+    maintained on save, so subtree and ancestor lookups are single indexed
+    queries.
     """
 
+    PATH_SEPARATOR = "/"
+    NAME_SEPARATOR = " > "
+
     name = models.CharField(max_length=255, unique=True)
     slug = models.SlugField(max_length=255, unique=True, blank=True)
     description = models.TextField(blank=True)
@@ -55,7 +93,15 @@ class Category(models.Model):
         blank=True,
         null=True,
     )
+    path = models.CharField(max_length=255, blank=True, editable=False)
+    depth = models.PositiveSmallIntegerField(default=0, editable=False)
+    full_name = models.CharField(max_length=1024, blank=True, editable=False)
     is_active = models.BooleanField(default=True)
+    active_product_count = models.PositiveIntegerField(default=0, editable=False)
+    in_stock_product_count = models.PositiveIntegerField(default=0, editable=False)
+    # Newest active products, precomputed for the related products of the
+    # detail page (see shop.related).
+    latest_product_ids = models.JSONField(default=list, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -64,16 +110,93 @@ class Category(models.Model):
         indexes = [
             models.Index(fields=["slug"]),
             models.Index(fields=["name"]),
+            # Pattern ops let PostgreSQL use the index for prefix LIKEs
+            # whatever the database collation; ignored by other backends.
+            models.Index(
+                fields=["path"],
+                name="shop_category_path_pattern_idx",
+                opclasses=["varchar_pattern_ops"],
+            ),
         ]
         verbose_name_plural = "Categories"
 
     def __str__(self):
         return self.name
 
+    def clean(self):
+        super().clean()
+        if self.pk and self.parent_id:
+            if self.parent_id == self.pk or self.parent.path.startswith(self.path):
+                raise ValidationError(
+                    {"parent": "A category cannot be moved under itself."}
+                )
+
     def save(self, *args, **kwargs):
         if not self.slug:
             self.slug = slugify(self.name)
+        _exclude_derived(self, kwargs)
         super().save(*args, **kwargs)
+        self._update_tree()
+
+    def _update_tree(self):
+        """Refresh this category's path fields and rewrite its subtree's."""
+        old_path, old_full_name, old_depth = self.path, self.full_name, self.depth
+        if self.parent_id:
+            parent = Category.objects.only("path", "depth", "full_name").get(
+                pk=self.parent_id
+            )
+            self.path = f"{parent.path}{self.pk}{self.PATH_SEPARATOR}"
+            self.depth = parent.depth + 1
+            self.full_name = f"{parent.full_name}{self.NAME_SEPARATOR}{self.name}"
+        else:
+            self.path = f"{self.pk}{self.PATH_SEPARATOR}"
+            self.depth = 0
+            self.full_name = self.name
+
+        if (self.path, self.full_name, self.depth) == (
+            old_path,
+            old_full_name,
+            old_depth,
+        ):
+            return
+        Category.objects.filter(pk=self.pk).update(
+            path=self.path, depth=self.depth, full_name=self.full_name
+        )
+        if old_path:
+            # Moved or renamed: swap the prefix of every descendant in one UPDATE.
+            Category.objects.filter(Category.subtree_filter(old_path)).exclude(
+                pk=self.pk
+            ).update(
+                path=Concat(Value(self.path), Substr("path", len(old_path) + 1)),
+                full_name=Concat(
+                    Value(self.full_name), Substr("full_name", len(old_full_name) + 1)
+                ),
+                depth=F("depth") + (self.depth - old_depth),
+            )
+
+    @classmethod
+    def subtree_filter(cls, path, prefix=""):
+        """
+        Q matching categories whose path starts with ``path``.
+        ``prefix`` targets a related model's category, e.g. "category__".
+        """
+        # A prefix match rather than a >=/< range: locale collations (e.g.
+        # en_US on PostgreSQL) order "/" among digits differently from
+        # byte order, so a range could gain or lose nodes.
+        return Q(**{f"{prefix}path__startswith": path})
+
+    def get_descendants(self, include_self=True):
+        descendants = Category.objects.filter(self.subtree_filter(self.path))
+        if not include_self:
+            descendants = descendants.exclude(pk=self.pk)
+        return descendants
+
+    def get_ancestors(self, include_self=False):
+        """Ancestors from the root down, in one query."""
+        ids = [int(pk) for pk in self.path.split(self.PATH_SEPARATOR) if pk]
+        if not include_self:
+            ids = ids[:-1]
+        return Category.objects.filter(pk__in=ids).order_by("depth")
 
     def get_absolute_url(self):
         return reverse("category_detail", args=[self.slug])
@@ -81,12 +204,7 @@ class Category(models.Model):
     @property
     def full_path(self):
         """Return full category hierarchy name."""
-        names = [self.name]
-        parent = self.parent
-        while parent:
-            names.append(parent.name)
-            parent = parent.parent
-        return " > ".join(reversed(names))
+        return self.full_name or self.name
 
 
 class Product(models.Model):
@@ -111,6 +229,9 @@ class Product(models.Model):
     description = models.TextField(blank=True)
     price = models.DecimalField(max_digits=10, decimal_places=2)
     stock = models.PositiveIntegerField(default=0)
+    reserved = models.PositiveIntegerField(
+        default=0, help_text="Units currently held by cart reservations."
+    )
     image = models.ImageField(
         upload_to="products/%Y/%m/%d",
         default="products/default.jpg",
@@ -126,6 +247,10 @@ class Product(models.Model):
         indexes = [
             models.Index(fields=["slug"]),
             models.Index(fields=["name"]),
+            # Keyset pagination: one index per catalog sort, ending in id.
+            models.Index(fields=["is_active", "price", "id"]),
+            models.Index(fields=["is_active", "name", "id"]),
+            models.Index(fields=["is_active", "created_at", "id"]),
         ]
 
     def __str__(self):
@@ -142,27 +267,58 @@ class Product(models.Model):
     def get_price(self, include_tax=False, discount=None):
         """
         Returns the final price of the product.
-        :param include_tax: If True, add tax (example: 10%).
-        :param discount: A Decimal or percentage (e.g., 0.1 for 10%).
+        :param include_tax: If True, add tax (SHOP_TAX_RATE or the
+            category's rate).
+        :param discount: A Decimal or percentage (e.g., 0.1 for 10%), on top
+            of the configured brand discount.
+        Use ``shop.pricing.price_products`` to price many products at once.
         """
-        final_price = Decimal(self.price)
-
-        if discount:
-            if discount < 1:
-                final_price = final_price * (1 - Decimal(discount))
-            else:
-                final_price = final_price - Decimal(discount)
-
-        if include_tax:
-            tax_rate = Decimal("0.10")
-            final_price = final_price * (1 + tax_rate)
-
-        return final_price.quantize(Decimal("0.01"))
+        return pricing.price_one(
+            self.price,
+            self.category_id,
+            self.brand_id,
+            pricing.configured_rules(discount),
+            include_tax,
+        )
 
     @property
     def in_stock(self):
         return self.stock > 0
 
+    @property
+    def available_stock(self):
+        """Stock not held by cart reservations."""
+        return max(self.stock - self.reserved, 0)
+
+
+class ProductCard(models.Model):
+    """
+    Denormalized read model with exactly what a product card renders.
+    Only active products have a card; rows are kept in sync by the
+    signals in ``shop.signals`` (see ``shop.cards``).
+    """
+
+    product = models.OneToOneField(
+        "Product", on_delete=models.CASCADE, primary_key=True, related_name="card"
+    )
+    name = models.CharField(max_length=255)
+    url = models.CharField(max_length=512)
+    thumbnail_url = models.CharField(max_length=512, blank=True)
+    display_price = models.DecimalField(max_digits=10, decimal_places=2)
+    brand_name = models.CharField(max_length=255, blank=True)
+    category_slug = models.SlugField(max_length=255)
+    in_stock = models.BooleanField(default=False)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["category_slug", "created_at"]),
+        ]
+
+    def __str__(self):
+        return self.name
+
 
 class ProductImage(models.Model):
     """
@@ -188,3 +344,184 @@ class ProductImage(models.Model):
 
     def __str__(self):
         return f"Image for {self.product.name}" if self.product else "No Product"
+
+
+class CoCartBasket(models.Model):
+    """
+    Product set of a cart or order as last counted into ProductPairCount,
+    so the recommendation job can apply only the difference when it changes.
+    """
+
+    SOURCE_CART = "cart"
+    SOURCE_ORDER = "order"
+    SOURCE_CHOICES = [(SOURCE_CART, "Cart"), (SOURCE_ORDER, "Order")]
+
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES)
+    source_id = models.PositiveIntegerField()
+    product_ids = models.JSONField(default=list)
+    source_updated_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ("source", "source_id")
+        indexes = [models.Index(fields=["source", "source_updated_at"])]
+
+    def __str__(self):
+        return f"{self.source} #{self.source_id}"
+
+
+class ProductPairCount(models.Model):
+    """
+    Sparse product co-occurrence matrix: number of baskets containing both
+    products (product_a <= product_b). The diagonal (a == b) holds the number
+    of baskets containing the product. Plain ids keep rows small.
+    """
+
+    product_a = models.PositiveIntegerField()
+    product_b = models.PositiveIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        unique_together = ("product_a", "product_b")
+        indexes = [models.Index(fields=["product_b"])]
+
+    def __str__(self):
+        return f"({self.product_a}, {self.product_b}): {self.count}"
+
+
+class ProductNeighbor(models.Model):
+    """Top-k products most often carted together with a product."""
+
+    product = models.ForeignKey(
+        "Product", on_delete=models.CASCADE, related_name="neighbors"
+    )
+    neighbor = models.ForeignKey("Product", on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+
+    class Meta:
+        ordering = ["product", "rank"]
+        unique_together = ("product", "rank")
+
+    def __str__(self):
+        return f"{self.product_id} → {self.neighbor_id}"
+
+
+class PriceHistogramBin(models.Model):
+    """
+    Number of active products of a category in one price bucket
+    (``shop.facets.PRICE_EDGES``), for the price range filter.
+    """
+
+    category = models.ForeignKey(
+        "Category", on_delete=models.CASCADE, related_name="price_bins"
+    )
+    bucket = models.PositiveSmallIntegerField()
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        unique_together = ("category", "bucket")
+
+    def __str__(self):
+        return f"{self.category_id} #{self.bucket}: {self.count}"
+
+
+class Promotion(models.Model):
+    """
+    A cart promotion. Active promotions are compiled into the in-memory
+    plan of ``shop.promotions`` and applied to carts at checkout:
+
+    * brand percent: ``percent`` off every product of ``brand``;
+    * buy X get Y: for every ``buy_quantity`` units of ``product`` bought,
+      ``get_quantity`` more are free;
+    * cart threshold: ``percent`` or ``amount`` off carts of at least
+      ``min_subtotal``.
+    """
+
+    KIND_BRAND_PERCENT = "brand_percent"
+    KIND_BUY_X_GET_Y = "buy_x_get_y"
+    KIND_CART_THRESHOLD = "cart_threshold"
+    KIND_CHOICES = [
+        (KIND_BRAND_PERCENT, "Brand percentage"),
+        (KIND_BUY_X_GET_Y, "Buy X get Y"),
+        (KIND_CART_THRESHOLD, "Cart threshold"),
+    ]
+    REQUIRED_FIELDS = {
+        KIND_BRAND_PERCENT: ("brand", "percent"),
+        KIND_BUY_X_GET_Y: ("product", "buy_quantity", "get_quantity"),
+        KIND_CART_THRESHOLD: ("min_subtotal",),
+    }
+
+    name = models.CharField(max_length=100)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    is_active = models.BooleanField(default=True)
+    starts_at = models.DateTimeField(blank=True, null=True)
+    ends_at = models.DateTimeField(blank=True, null=True)
+    brand = models.ForeignKey(
+        "Brand",
+        on_delete=models.CASCADE,
+        related_name="promotions",
+        blank=True,
+        null=True,
+    )
+    product = models.ForeignKey(
+        "Product",
+        on_delete=models.CASCADE,
+        related_name="promotions",
+        blank=True,
+        null=True,
+    )
+    percent = models.DecimalField(max_digits=5, decimal_places=2, blank=True, null=True)
+    amount = models.DecimalField(max_digits=10, decimal_places=2, blank=True, null=True)
+    buy_quantity = models.PositiveIntegerField(blank=True, null=True)
+    get_quantity = models.PositiveIntegerField(blank=True, null=True)
+    min_subtotal = models.DecimalField(
+        max_digits=10, decimal_places=2, blank=True, null=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["name"]
+        indexes = [models.Index(fields=["is_active", "kind"])]
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        super().clean()
+        errors = {
+            field: "This field is required for this kind of promotion."
+            for field in self.REQUIRED_FIELDS.get(self.kind, ())
+            if getattr(self, field) in (None, "")
+        }
+        if self.kind == self.KIND_CART_THRESHOLD and not (self.percent or self.amount):
+            errors["percent"] = "Set a percentage or an amount off."
+        if self.percent is not None and not 0 < self.percent <= 100:
+            errors["percent"] = "Enter a percentage between 0 and 100."
+        if self.kind == self.KIND_BUY_X_GET_Y and not (
+            self.buy_quantity and self.get_quantity
+        ):
+            errors.setdefault("buy_quantity", "Quantities must be at least 1.")
+        if self.starts_at and self.ends_at and self.ends_at <= self.starts_at:
+            errors["ends_at"] = "The promotion must end after it starts."
+        if errors:
+            raise ValidationError(errors)
+
+
+class TaxonomyReindex(models.Model):
+    """
+    A renamed brand or category whose products' search rows and cards still
+    show the old name. Queued by the signals in ``shop.signals`` and
+    processed by ``process_reindex_jobs``.
+    """
+
+    brand = models.ForeignKey(
+        "Brand", on_delete=models.CASCADE, related_name="+", blank=True, null=True
+    )
+    category = models.ForeignKey(
+        "Category", on_delete=models.CASCADE, related_name="+", blank=True, null=True
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Reindex of {self.brand or self.category}"
@@ -0,0 +1,150 @@
+"""
+Keyset (cursor) pagination for the product catalog.
+
+Instead of OFFSET + COUNT(*), each page continues from the sort key of the
+last (or first) row of the previous page, so every page is a single index
+seek no matter how deep it is. Orderings must end with a unique column
+(``id``) so the position is unambiguous.
+
+When every key sorts the same way, the seek is a row-value comparison,
+``(price, id) > (%s, %s)``, which the database runs as one range scan of
+the matching composite index. Mixed directions, and backends without row
+values, fall back to the equivalent OR-expanded condition.
+"""
+
+import base64
+import json
+
+from django.db import connections
+from django.db.models import BooleanField, F, Func, Q, Value
+from django.http import Http404
+
+# Backends that support (and index) row-value comparisons.
+ROW_VALUE_VENDORS = ("postgresql", "sqlite", "mysql")
+
+
+class RowValue(Func):
+    """A row value, ``(a, b, ...)``."""
+
+    template = "(%(expressions)s)"
+
+
+class RowCompare(Func):
+    """``lhs <op> rhs`` for two RowValues, usable as a filter."""
+
+    template = "%(expressions)s"
+    output_field = BooleanField()
+
+    def __init__(self, lhs, operator, rhs):
+        super().__init__(lhs, rhs)
+        self.arg_joiner = f" {operator} "
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator:
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.model = queryset.model
+        # [(field name, descending)]
+        self.keys = [(field.lstrip("-"), field.startswith("-")) for field in ordering]
+
+    def page(self, cursor=None):
+        """Return the page after (or before) ``cursor``; the first page if None."""
+        backwards = False
+        queryset = self.queryset
+        if cursor:
+            backwards, values = self.decode(cursor)
+            queryset = queryset.filter(self.seek_filter(values, backwards))
+
+        ordering = [
+            f"{'-' if descending != backwards else ''}{name}"
+            for name, descending in self.keys
+        ]
+        rows = list(queryset.order_by(*ordering)[: self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        if backwards:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage(rows)
+        if backwards:
+            next_cursor = self.encode(rows[-1], backwards=False)
+            previous_cursor = self.encode(rows[0], backwards=True) if has_more else None
+        else:
+            next_cursor = self.encode(rows[-1], backwards=False) if has_more else None
+            previous_cursor = self.encode(rows[0], backwards=True) if cursor else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def seek_filter(self, values, backwards):
+        """
+        Rows strictly after ``values`` in sort order (before, if backwards):
+        (k1, k2, ...) > (v1, v2, ...), or where row values can't be used
+        (k1 > v1) OR (k1 = v1 AND k2 > v2) OR ...
+        """
+        directions = {descending for _, descending in self.keys}
+        vendor = connections[self.queryset.db].vendor
+        if len(directions) == 1 and vendor in ROW_VALUE_VENDORS:
+            operator = "<" if directions.pop() != backwards else ">"
+            return RowCompare(
+                RowValue(*(F(name) for name, _ in self.keys)),
+                operator,
+                RowValue(
+                    *(
+                        Value(value, output_field=self.model._meta.get_field(name))
+                        for (name, _), value in zip(self.keys, values)
+                    )
+                ),
+            )
+
+        condition = Q()
+        equal = Q()
+        for (name, descending), value in zip(self.keys, values):
+            lookup = "lt" if descending != backwards else "gt"
+            condition |= equal & Q(**{f"{name}__{lookup}": value})
+            equal &= Q(**{name: value})
+        return condition
+
+    def encode(self, obj, backwards):
+        values = [
+            self.model._meta.get_field(name).value_to_string(obj)
+            for name, _ in self.keys
+        ]
+        payload = json.dumps([int(backwards), values], separators=(",", ":"))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+    def decode(self, cursor):
+        try:
+            padded = cursor + "=" * (-len(cursor) % 4)
+            backwards, raw_values = json.loads(base64.urlsafe_b64decode(padded))
+            if len(raw_values) != len(self.keys):
+                raise ValueError
+            values = [
+                self.model._meta.get_field(name).to_python(value)
+                for (name, _), value in zip(self.keys, raw_values)
+            ]
+        except Exception:
+            raise Http404("Invalid cursor.")
+        return bool(backwards), values
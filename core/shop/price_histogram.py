@@ -0,0 +1,151 @@
+"""
+Per-category price histograms for the price range filter.
+
+PriceHistogramBin holds, for every category, the number of active products
+in each price bucket of BUCKET_EDGES. The Product signals in
+``shop.signals`` move a product between bins with ``F()`` updates when its
+price, category or active flag changes, so drawing the histogram sums a few
+small rows instead of grouping the product table on every request.
+``rebuild_price_histograms`` recomputes the bins from scratch.
+"""
+
+from bisect import bisect_right
+from collections import Counter
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import Greatest
+
+from .facets import PRICE_EDGES
+from .models import Category, PriceHistogramBin, Product
+
+# Lower edge of each bucket; the last bucket is open-ended. Bucket i is the
+# price facet's PRICE_BUCKETS[i].
+BUCKET_EDGES = PRICE_EDGES
+
+
+def bucket_for(price):
+    return max(bisect_right(BUCKET_EDGES, Decimal(str(price))) - 1, 0)
+
+
+def bucket_bounds(bucket):
+    """(low, high) of a bucket; ``high`` is None for the last one."""
+    high = BUCKET_EDGES[bucket + 1] if bucket + 1 < len(BUCKET_EDGES) else None
+    return BUCKET_EDGES[bucket], high
+
+
+def bucket_expression(field="price"):
+    """SQL expression computing ``bucket_for`` of ``field``."""
+    return Case(
+        *(
+            When(**{f"{field}__lt": high}, then=Value(bucket))
+            for bucket, high in enumerate(BUCKET_EDGES[1:])
+        ),
+        default=Value(len(BUCKET_EDGES) - 1),
+    )
+
+
+def product_state(product):
+    return (product.category_id, product.is_active, product.price)
+
+
+def apply_change(old_state, new_state):
+    """
+    Move a product between bins as it goes from ``old_state`` to
+    ``new_state`` ((category_id, is_active, price) or None).
+    """
+    deltas = Counter()
+    for state, sign in ((old_state, -1), (new_state, 1)):
+        if state is None:
+            continue
+        category_id, is_active, price = state
+        if is_active and category_id is not None and price is not None:
+            deltas[category_id, bucket_for(price)] += sign
+
+    increments = [key for key, delta in deltas.items() if delta > 0]
+    if increments:
+        PriceHistogramBin.objects.bulk_create(
+            [
+                PriceHistogramBin(category_id=category_id, bucket=bucket)
+                for category_id, bucket in increments
+            ],
+            ignore_conflicts=True,
+        )
+    for (category_id, bucket), delta in deltas.items():
+        bins = PriceHistogramBin.objects.filter(category_id=category_id, bucket=bucket)
+        if delta > 0:
+            bins.update(count=F("count") + delta)
+        elif delta < 0:
+            # Products written without signals may never have been counted.
+            bins.update(count=Greatest(F("count") + delta, 0))
+
+
+def actual_bins():
+    """{(category_id, bucket): count} computed from the Product table."""
+    return {
+        (category_id, bucket): count
+        for category_id, bucket, count in Product.objects.filter(is_active=True)
+        .annotate(bucket=bucket_expression())
+        .values("category_id", "bucket")
+        .annotate(count=Count("id"))
+        .order_by()
+        .values_list("category_id", "bucket", "count")
+    }
+
+
+def rebuild(fix=True):
+    """
+    Recompute every bin. Returns a list of
+    (category_id, bucket, stored count, actual count) for the bins that drifted.
+    """
+    actual = actual_bins()
+    stored = {
+        (category_id, bucket): count
+        for category_id, bucket, count in PriceHistogramBin.objects.values_list(
+            "category_id", "bucket", "count"
+        )
+    }
+    drifted = [
+        (*key, stored.get(key, 0), actual.get(key, 0))
+        for key in sorted(actual.keys() | stored.keys())
+        if stored.get(key, 0) != actual.get(key, 0)
+    ]
+    if fix and drifted:
+        with transaction.atomic():
+            PriceHistogramBin.objects.all().delete()
+            PriceHistogramBin.objects.bulk_create(
+                [
+                    PriceHistogramBin(
+                        category_id=category_id, bucket=bucket, count=count
+                    )
+                    for (category_id, bucket), count in actual.items()
+                ],
+                batch_size=500,
+            )
+    return drifted
+
+
+def histogram(category_slugs=()):
+    """
+    Return [(low, high, count)] for every bucket, summed over the subtrees of
+    ``category_slugs`` (all categories when empty).
+    """
+    bins = PriceHistogramBin.objects.filter(count__gt=0)
+    if category_slugs:
+        category_q = Q(pk__in=[])
+        for path in Category.objects.filter(slug__in=category_slugs).values_list(
+            "path", flat=True
+        ):
+            category_q |= Category.subtree_filter(path, prefix="category__")
+        bins = bins.filter(category_q)
+    totals = dict(
+        bins.values("bucket")
+        .annotate(total=Sum("count"))
+        .order_by()
+        .values_list("bucket", "total")
+    )
+    return [
+        (*bucket_bounds(bucket), totals.get(bucket, 0))
+        for bucket in range(len(BUCKET_EDGES))
+    ]
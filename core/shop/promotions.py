@@ -0,0 +1,212 @@
+"""
+Promotion rules engine for carts.
+
+The active promotions are compiled into a PromotionPlan:
+
+* brand percentages into a {brand_id: (percent, name)} map holding the best
+  one per brand;
+* buy-X-get-Y offers into a {product_id: [(buy, get, name)]} map;
+* cart thresholds into a table sorted by minimum subtotal, with the best
+  percentage and amount among all thresholds up to each row.
+
+Applying a plan to a cart is then one dictionary lookup per line and one
+bisect into the threshold table, O(items + promotions on those items),
+however many promotions are active. Each line gets its single best offer;
+the best threshold the discounted subtotal reaches is taken off the cart.
+
+Plans are cached per process, compiled by one thread at a time. Saving or
+deleting a Promotion bumps a version number in the Django cache, and a plan
+expires by itself when a promotion starts or ends. Other processes only see
+the bump through a shared cache backend (Redis or the database cache, see
+CACHES in settings); with a per-process LocMemCache they would keep serving
+their old plan.
+"""
+
+import threading
+import time
+from bisect import bisect_right
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Q
+from django.utils import timezone
+
+from .pricing import CENT
+
+VERSION_KEY = "shop:promotions:version"
+ZERO = Decimal("0.00")
+
+
+def get_version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, int(time.time() * 1000), None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        get_version()
+
+
+class PromotionResult:
+    """Discounts of a cart: one per line, in order, and one for the cart."""
+
+    def __init__(self, line_discounts, cart_discount, applied):
+        self.line_discounts = line_discounts
+        self.cart_discount = cart_discount
+        # Names of the promotions that took effect.
+        self.applied = applied
+
+    @property
+    def total_discount(self):
+        return sum(self.line_discounts, ZERO) + self.cart_discount
+
+
+class PromotionPlan:
+    def __init__(self, promotions, now):
+        from shop.models import Promotion
+
+        self.brand_percents = {}
+        self.buy_x_get_y = {}
+        thresholds = []
+        boundaries = []
+        for promotion in promotions:
+            boundaries.extend(
+                moment
+                for moment in (promotion.starts_at, promotion.ends_at)
+                if moment is not None and moment > now
+            )
+            if not self._is_live(promotion, now):
+                continue
+            if promotion.kind == Promotion.KIND_BRAND_PERCENT:
+                best = self.brand_percents.get(promotion.brand_id)
+                if best is None or promotion.percent > best[0]:
+                    self.brand_percents[promotion.brand_id] = (
+                        promotion.percent,
+                        promotion.name,
+                    )
+            elif promotion.kind == Promotion.KIND_BUY_X_GET_Y:
+                self.buy_x_get_y.setdefault(promotion.product_id, []).append(
+                    (promotion.buy_quantity, promotion.get_quantity, promotion.name)
+                )
+            elif promotion.kind == Promotion.KIND_CART_THRESHOLD:
+                thresholds.append(
+                    (
+                        promotion.min_subtotal,
+                        promotion.percent or ZERO,
+                        promotion.amount or ZERO,
+                        promotion.name,
+                    )
+                )
+        # The plan must be recompiled when the next promotion starts or ends.
+        self.expires_at = min(boundaries, default=None)
+
+        thresholds.sort(key=lambda threshold: threshold[0])
+        self.threshold_minimums = [threshold[0] for threshold in thresholds]
+        self.best_percents = []
+        self.best_amounts = []
+        best_percent = best_amount = (ZERO, None)
+        for _, percent, amount, name in thresholds:
+            if percent > best_percent[0]:
+                best_percent = (percent, name)
+            if amount > best_amount[0]:
+                best_amount = (amount, name)
+            self.best_percents.append(best_percent)
+            self.best_amounts.append(best_amount)
+
+    @staticmethod
+    def _is_live(promotion, now):
+        return (promotion.starts_at is None or promotion.starts_at <= now) and (
+            promotion.ends_at is None or now < promotion.ends_at
+        )
+
+    def apply(self, lines):
+        """
+        Discount ``lines``, an iterable of
+        (product_id, brand_id, unit_price, quantity).
+        """
+        line_discounts = []
+        applied = []
+        subtotal = ZERO
+        for product_id, brand_id, unit_price, quantity in lines:
+            line_total = unit_price * quantity
+            discount, name = ZERO, None
+            brand_offer = self.brand_percents.get(brand_id)
+            if brand_offer is not None:
+                percent, name = brand_offer
+                discount = (line_total * percent / 100).quantize(CENT)
+            for buy, get, offer_name in self.buy_x_get_y.get(product_id, ()):
+                free = quantity // (buy + get) * get
+                if unit_price * free > discount:
+                    discount, name = unit_price * free, offer_name
+            if name is not None and discount:
+                applied.append(name)
+            line_discounts.append(discount)
+            subtotal += line_total - discount
+
+        cart_discount = ZERO
+        reached = bisect_right(self.threshold_minimums, subtotal)
+        if reached:
+            percent, percent_name = self.best_percents[reached - 1]
+            amount, amount_name = self.best_amounts[reached - 1]
+            by_percent = (subtotal * percent / 100).quantize(CENT)
+            if by_percent >= amount:
+                cart_discount, name = by_percent, percent_name
+            else:
+                cart_discount, name = amount, amount_name
+            cart_discount = min(cart_discount, subtotal)
+            if cart_discount:
+                applied.append(name)
+        return PromotionResult(line_discounts, cart_discount, applied)
+
+
+class PromotionEngine:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._plan = None
+        self._version = None
+
+    def get_plan(self):
+        """The compiled plan of the active promotions, rebuilt when stale."""
+        version = get_version()
+        now = timezone.now()
+        plan = self._plan
+        if self._is_stale(plan, self._version, version, now):
+            with self._lock:
+                # Another thread may have compiled it while we waited.
+                plan = self._plan
+                if self._is_stale(plan, self._version, version, now):
+                    plan = self._compile(version, now)
+        return plan
+
+    @staticmethod
+    def _is_stale(plan, plan_version, version, now):
+        return (
+            plan is None
+            or plan_version != version
+            or (plan.expires_at is not None and now >= plan.expires_at)
+        )
+
+    def _compile(self, version, now):
+        from shop.models import Promotion
+
+        promotions = Promotion.objects.filter(
+            Q(ends_at__isnull=True) | Q(ends_at__gt=now), is_active=True
+        )
+        plan = PromotionPlan(promotions, now)
+        self._plan, self._version = plan, version
+        return plan
+
+    def invalidate(self):
+        self._plan = None
+        bump_version()
+
+    def apply(self, lines):
+        return self.get_plan().apply(lines)
+
+
+promotion_engine = PromotionEngine()
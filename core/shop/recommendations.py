@@ -0,0 +1,295 @@
+"""
+Item-to-item "bought together" recommendations from cart and order history.
+
+Every cart (``cart.CartItem``) and order (``orders.OrderItem``, when the app
+is installed) is a basket. The job counts how many baskets contain each pair
+of products into the sparse ProductPairCount table and keeps the TOP_K
+neighbours of every product in ProductNeighbor, scored by cosine similarity
+
+    count(a, b) / sqrt(count(a, a) * count(b, b))
+
+The first run (and ``full=True``) counts every basket in the database with
+one self-join and GROUP BY (``count_all_pairs``). Later runs are
+incremental: only carts updated and orders placed since the last run are
+read. Each basket's counted product set is kept in CoCartBasket, so a
+changed cart contributes just the pairs it gained or lost. Those deltas are
+accumulated in memory and written with one upsert per batch. Neighbour lists
+are recomputed only for products whose counts changed.
+
+The job runs offline, from the ``build_recommendations`` command (cron);
+requests and signals only read ProductNeighbor.
+"""
+
+import heapq
+import math
+from collections import Counter, defaultdict
+from itertools import islice
+
+from django.apps import apps
+from django.db import connection, transaction
+from django.db.models import F, Max, Q
+
+from .models import CoCartBasket, Product, ProductNeighbor, ProductPairCount
+
+TOP_K = 10
+# Larger baskets are truncated: pairs grow quadratically with basket size.
+MAX_BASKET_SIZE = 50
+CHUNK_SIZE = 1000
+
+
+def _chunks(items, size=CHUNK_SIZE):
+    iterator = iter(items)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def count_pairs(product_ids, sign, deltas):
+    """Add ``sign`` to every pair (and the diagonal) of a basket."""
+    ids = sorted(product_ids)[:MAX_BASKET_SIZE]
+    for i, a in enumerate(ids):
+        deltas[a, a] += sign
+        for b in ids[i + 1 :]:
+            deltas[a, b] += sign
+
+
+def _changed_carts():
+    """Yield (cart_id, updated_at, product_ids) for carts changed since last run."""
+    Cart = apps.get_model("cart", "Cart")
+    CartItem = apps.get_model("cart", "CartItem")
+    watermark = CoCartBasket.objects.filter(source=CoCartBasket.SOURCE_CART).aggregate(
+        last=Max("source_updated_at")
+    )["last"]
+    carts = Cart.objects.order_by("updated_at", "pk")
+    if watermark is not None:
+        # >= so carts sharing the watermark timestamp are not missed; an
+        # unchanged cart diffs to nothing.
+        carts = carts.filter(updated_at__gte=watermark)
+
+    for chunk in _chunks(carts.values_list("pk", "updated_at").iterator()):
+        items = defaultdict(set)
+        for cart_id, product_id in CartItem.objects.filter(
+            cart_id__in=[pk for pk, _ in chunk]
+        ).values_list("cart_id", "product_id"):
+            items[cart_id].add(product_id)
+        for cart_id, updated_at in chunk:
+            yield cart_id, updated_at, items[cart_id]
+
+
+def _new_orders():
+    """Yield (order_id, created_at, product_ids) for orders placed since last run."""
+    if not apps.is_installed("orders"):
+        return
+    Order = apps.get_model("orders", "Order")
+    OrderItem = apps.get_model("orders", "OrderItem")
+    watermark = CoCartBasket.objects.filter(source=CoCartBasket.SOURCE_ORDER).aggregate(
+        last=Max("source_id")
+    )["last"]
+    orders = Order.objects.order_by("pk")
+    if watermark is not None:
+        orders = orders.filter(pk__gt=watermark)
+
+    for chunk in _chunks(orders.values_list("pk", "created_at").iterator()):
+        items = defaultdict(set)
+        for order_id, product_id in OrderItem.objects.filter(
+            order_id__in=[pk for pk, _ in chunk], product__isnull=False
+        ).values_list("order_id", "product_id"):
+            items[order_id].add(product_id)
+        for order_id, created_at in chunk:
+            yield order_id, created_at, items[order_id]
+
+
+def _collect(source, baskets, deltas):
+    """
+    Diff ``baskets`` against their snapshots into ``deltas``; with
+    ``deltas=None`` only the snapshots are written.
+    """
+    processed = 0
+    for chunk in _chunks(baskets):
+        snapshots = {
+            basket.source_id: basket
+            for basket in CoCartBasket.objects.filter(
+                source=source, source_id__in=[source_id for source_id, _, _ in chunk]
+            )
+        }
+        to_create = []
+        to_update = []
+        for source_id, updated_at, product_ids in chunk:
+            new_ids = sorted(product_ids)
+            basket = snapshots.get(source_id)
+            if basket is None:
+                if deltas is not None:
+                    count_pairs(new_ids, 1, deltas)
+                to_create.append(
+                    CoCartBasket(
+                        source=source,
+                        source_id=source_id,
+                        product_ids=new_ids,
+                        source_updated_at=updated_at,
+                    )
+                )
+                continue
+            if basket.product_ids != new_ids and deltas is not None:
+                count_pairs(basket.product_ids, -1, deltas)
+                count_pairs(new_ids, 1, deltas)
+            basket.product_ids = new_ids
+            basket.source_updated_at = updated_at
+            to_update.append(basket)
+        CoCartBasket.objects.bulk_create(to_create)
+        CoCartBasket.objects.bulk_update(
+            to_update, ["product_ids", "source_updated_at"]
+        )
+        processed += len(chunk)
+    return processed
+
+
+def apply_deltas(deltas):
+    """Add ``deltas`` ({(a, b): delta}) to ProductPairCount with upserts."""
+    rows = [(a, b, delta) for (a, b), delta in deltas.items() if delta]
+    table = connection.ops.quote_name(ProductPairCount._meta.db_table)
+    with connection.cursor() as cursor:
+        for chunk in _chunks(rows):
+            cursor.executemany(
+                f"INSERT INTO {table} (product_a, product_b, count) "
+                "VALUES (%s, %s, %s) "
+                "ON CONFLICT (product_a, product_b) "
+                f"DO UPDATE SET count = {table}.count + excluded.count",
+                chunk,
+            )
+    # Only rows that went down can have reached zero.
+    decreased = {a for a, _, delta in rows if delta < 0}
+    for ids in _chunks(decreased):
+        ProductPairCount.objects.filter(product_a__in=ids, count__lte=0).delete()
+    return len(rows)
+
+
+def count_all_pairs():
+    """
+    Replace ProductPairCount with the pair counts of every cart and order,
+    computed in the database; returns the number of pairs.
+
+    Baskets are truncated to their MAX_BASKET_SIZE lowest product ids, like
+    ``count_pairs``.
+    """
+    CartItem = apps.get_model("cart", "CartItem")
+    # Source 0 is carts, 1 is orders.
+    baskets = [
+        "SELECT 0 AS source, cart_id AS basket_id, product_id "
+        f"FROM {connection.ops.quote_name(CartItem._meta.db_table)}"
+    ]
+    if apps.is_installed("orders"):
+        OrderItem = apps.get_model("orders", "OrderItem")
+        baskets.append(
+            "SELECT 1, order_id, product_id "
+            f"FROM {connection.ops.quote_name(OrderItem._meta.db_table)} "
+            "WHERE product_id IS NOT NULL"
+        )
+    table = connection.ops.quote_name(ProductPairCount._meta.db_table)
+    ProductPairCount.objects.all().delete()
+    with connection.cursor() as cursor:
+        # UNION drops an order's repeated lines of the same product.
+        cursor.execute(
+            f"INSERT INTO {table} (product_a, product_b, count) "
+            "WITH items AS ("
+            "  SELECT source, basket_id, product_id, ROW_NUMBER() OVER ("
+            "    PARTITION BY source, basket_id ORDER BY product_id"
+            "  ) AS position"
+            f"  FROM ({' UNION '.join(baskets)}) baskets"
+            ") "
+            "SELECT a.product_id, b.product_id, COUNT(*) "
+            "FROM items a JOIN items b ON b.source = a.source "
+            "AND b.basket_id = a.basket_id AND b.product_id >= a.product_id "
+            "WHERE a.position <= %s AND b.position <= %s "
+            "GROUP BY a.product_id, b.product_id",
+            [MAX_BASKET_SIZE, MAX_BASKET_SIZE],
+        )
+        return cursor.rowcount
+
+
+def refresh_neighbors(product_ids, top_k=TOP_K):
+    """Recompute the top-k neighbour lists of ``product_ids``."""
+    for chunk in _chunks(product_ids, 500):
+        pairs = list(
+            ProductPairCount.objects.filter(
+                Q(product_a__in=chunk) | Q(product_b__in=chunk)
+            ).values_list("product_a", "product_b", "count")
+        )
+        others = {b for a, b, _ in pairs} | {a for a, _, _ in pairs}
+        totals = {a: count for a, b, count in pairs if a == b}
+        missing = others - totals.keys()
+        for ids in _chunks(missing):
+            totals.update(
+                ProductPairCount.objects.filter(
+                    product_a__in=ids, product_b=F("product_a")
+                ).values_list("product_a", "count")
+            )
+        active = set()
+        for ids in _chunks(others | set(chunk)):
+            active.update(
+                Product.objects.filter(pk__in=ids, is_active=True).values_list(
+                    "pk", flat=True
+                )
+            )
+
+        candidates = defaultdict(list)
+        for a, b, count in pairs:
+            if a == b:
+                continue
+            score = count / math.sqrt(totals.get(a, count) * totals.get(b, count))
+            candidates[a].append((score, -b, b))
+            candidates[b].append((score, -a, a))
+
+        neighbors = []
+        for product_id in chunk:
+            if product_id not in active:
+                continue
+            best = heapq.nlargest(
+                top_k,
+                (entry for entry in candidates[product_id] if entry[2] in active),
+            )
+            neighbors.extend(
+                ProductNeighbor(
+                    product_id=product_id,
+                    neighbor_id=neighbor_id,
+                    score=score,
+                    rank=rank,
+                )
+                for rank, (score, _, neighbor_id) in enumerate(best)
+            )
+        with transaction.atomic():
+            ProductNeighbor.objects.filter(product_id__in=chunk).delete()
+            ProductNeighbor.objects.bulk_create(neighbors)
+
+
+def build(full=False, top_k=TOP_K):
+    """
+    Update the co-occurrence counts and neighbour lists; returns
+    (baskets read, pair counts changed, products refreshed).
+    """
+    # Snapshots and counts must move together.
+    with transaction.atomic():
+        if full:
+            CoCartBasket.objects.all().delete()
+            ProductNeighbor.objects.all().delete()
+        if not CoCartBasket.objects.exists():
+            # Nothing counted yet: snapshot every basket and count them all
+            # in SQL rather than pair by pair.
+            baskets = _collect(CoCartBasket.SOURCE_CART, _changed_carts(), None)
+            baskets += _collect(CoCartBasket.SOURCE_ORDER, _new_orders(), None)
+            pairs = count_all_pairs()
+            touched = ProductPairCount.objects.filter(
+                product_b=F("product_a")
+            ).values_list("product_a", flat=True)
+            touched = sorted(touched)
+        else:
+            deltas = Counter()
+            baskets = _collect(CoCartBasket.SOURCE_CART, _changed_carts(), deltas)
+            baskets += _collect(CoCartBasket.SOURCE_ORDER, _new_orders(), deltas)
+            pairs = apply_deltas(deltas)
+            touched = set()
+            for (a, b), delta in deltas.items():
+                if delta:
+                    touched.update((a, b))
+            touched = sorted(touched)
+
+    refresh_neighbors(touched, top_k)
+    return baskets, pairs, len(touched)
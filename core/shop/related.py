@@ -0,0 +1,58 @@
+"""
+Precomputed related products for the product detail page.
+
+Related products are the product's co-cart neighbours (ProductNeighbor, see
+``shop.recommendations``), topped up with the newest active products of the
+same category. Each category stores its RELATED_PRODUCTS + 1 newest product ids in
+``Category.latest_product_ids`` (one spare in case the product being viewed
+is one of them). The Product signals refresh the affected categories and
+``rebuild_related_products`` recomputes all of them.
+"""
+
+from .models import Category, Product, ProductNeighbor
+
+RELATED_PRODUCTS = 4
+
+
+def latest_ids(category_id):
+    return list(
+        Product.objects.filter(category_id=category_id, is_active=True)
+        .order_by("-created_at", "-id")
+        .values_list("pk", flat=True)[: RELATED_PRODUCTS + 1]
+    )
+
+
+def refresh_categories(category_ids):
+    """Recompute the stored list of each category in ``category_ids``."""
+    for category_id in set(category_ids):
+        if category_id is not None:
+            Category.objects.filter(pk=category_id).update(
+                latest_product_ids=latest_ids(category_id)
+            )
+
+
+def rebuild():
+    """Recompute every category's list; returns the number of categories."""
+    category_ids = list(Category.objects.values_list("pk", flat=True))
+    refresh_categories(category_ids)
+    return len(category_ids)
+
+
+def neighbor_ids(product_id):
+    return list(
+        ProductNeighbor.objects.filter(product_id=product_id)
+        .order_by("rank")
+        .values_list("neighbor_id", flat=True)[:RELATED_PRODUCTS]
+    )
+
+
+def related_ids(product_id, latest_product_ids, neighbor_ids=()):
+    """
+    The related product ids of a product: its neighbours first, then its
+    category's newest products.
+    """
+    ids = []
+    for pk in [*neighbor_ids, *latest_product_ids]:
+        if pk != product_id and pk not in ids:
+            ids.append(pk)
+    return ids[:RELATED_PRODUCTS]
@@ -0,0 +1,202 @@
+"""
+Full-text product search.
+
+Products are indexed in a side table kept in sync by the signals in
+``shop.signals``: an FTS5 virtual table on SQLite, ranked with BM25, or a
+``tsvector`` table with a GIN index on PostgreSQL, ranked with ts_rank_cd.
+Other database backends fall back to ``name__icontains``.
+"""
+
+import re
+
+from django.db import connection
+from django.db.models import FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "shop_product_fts"
+PG_TABLE = "shop_product_search"
+
+# Relative weights of the indexed columns: name, description, brand, category.
+BM25_WEIGHTS = (10.0, 1.0, 4.0, 2.0)
+
+WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def is_supported(conn=None):
+    return (conn or connection).vendor in ("sqlite", "postgresql")
+
+
+def create_index(conn=None):
+    """Create the search side table for the current database backend."""
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+                "USING fts5(name, description, brand, category, "
+                "tokenize='unicode61 remove_diacritics 2')"
+            )
+        elif conn.vendor == "postgresql":
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {PG_TABLE} ("
+                "product_id bigint PRIMARY KEY "
+                "REFERENCES shop_product(id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED, "
+                "document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_TABLE}_document_idx "
+                f"ON {PG_TABLE} USING GIN (document)"
+            )
+
+
+def drop_index(conn=None):
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif conn.vendor == "postgresql":
+            cursor.execute(f"DROP TABLE IF EXISTS {PG_TABLE}")
+
+
+def product_row(product):
+    """Return the (id, name, description, brand, category) row to index."""
+    return (
+        product.pk,
+        product.name,
+        product.description,
+        product.brand.name if product.brand_id else "",
+        product.category.name if product.category_id else "",
+    )
+
+
+def write_rows(rows, conn=None):
+    """Insert or replace index rows built by ``product_row``."""
+    conn = conn or connection
+    rows = list(rows)
+    if not rows or not is_supported(conn):
+        return
+    with conn.cursor() as cursor:
+        if conn.vendor == "sqlite":
+            cursor.executemany(
+                f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in rows]
+            )
+            cursor.executemany(
+                f"INSERT INTO {FTS_TABLE}(rowid, name, description, brand, category) "
+                "VALUES (%s, %s, %s, %s, %s)",
+                rows,
+            )
+        else:
+            cursor.executemany(
+                f"INSERT INTO {PG_TABLE}(product_id, document) VALUES (%s, "
+                "setweight(to_tsvector('english', %s), 'A') || "
+                "setweight(to_tsvector('english', %s), 'D') || "
+                "setweight(to_tsvector('english', %s), 'B') || "
+                "setweight(to_tsvector('english', %s), 'C')) "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                rows,
+            )
+
+
+def index_products(products):
+    """(Re)index the given products; brand and category should be selected."""
+    write_rows(product_row(product) for product in products)
+
+
+def remove_products(product_ids):
+    product_ids = list(product_ids)
+    if not product_ids or not is_supported():
+        return
+    table, column = (
+        (FTS_TABLE, "rowid")
+        if connection.vendor == "sqlite"
+        else (PG_TABLE, "product_id")
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"DELETE FROM {table} WHERE {column} = %s",
+            [(product_id,) for product_id in product_ids],
+        )
+
+
+def reindex_queryset(queryset, batch_size=2000, conn=None):
+    """Index every product of ``queryset`` in batches. Returns the row count."""
+    count = 0
+    batch = []
+    for product in queryset.select_related("brand", "category").iterator(
+        chunk_size=batch_size
+    ):
+        batch.append(product_row(product))
+        if len(batch) >= batch_size:
+            write_rows(batch, conn)
+            count += len(batch)
+            batch = []
+    write_rows(batch, conn)
+    return count + len(batch)
+
+
+def rebuild_index(queryset, batch_size=2000, conn=None):
+    """Rebuild the whole index from ``queryset``. Returns the row count."""
+    conn = conn or connection
+    if not is_supported(conn):
+        return 0
+    table = FTS_TABLE if conn.vendor == "sqlite" else PG_TABLE
+    with conn.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table}")
+    return reindex_queryset(queryset, batch_size, conn)
+
+
+def build_match_query(query):
+    """
+    Turn free text into a safe FTS5 MATCH expression: every word must match,
+    the last one as a prefix so partially typed words still find results.
+    """
+    words = WORD_RE.findall(query.lower())
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def search(queryset, query):
+    """
+    Filter ``queryset`` to products matching ``query`` and annotate a
+    ``search_rank`` (higher is more relevant).
+    """
+    if connection.vendor == "sqlite":
+        match = build_match_query(query)
+        if match is None:
+            return queryset.none().annotate(
+                search_rank=Value(0.0, output_field=FloatField())
+            )
+        weights = ", ".join(str(weight) for weight in BM25_WEIGHTS)
+        return queryset.filter(
+            id__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match]
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT -bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+                f'WHERE {FTS_TABLE} MATCH %s AND rowid = "shop_product"."id"',
+                [match],
+                output_field=FloatField(),
+            )
+        )
+
+    if connection.vendor == "postgresql":
+        tsquery = "websearch_to_tsquery('english', %s)"
+        return queryset.filter(
+            id__in=RawSQL(
+                f"SELECT product_id FROM {PG_TABLE} WHERE document @@ {tsquery}",
+                [query],
+            )
+        ).annotate(
+            search_rank=RawSQL(
+                f"SELECT ts_rank_cd(document, {tsquery}) FROM {PG_TABLE} "
+                'WHERE product_id = "shop_product"."id"',
+                [query],
+                output_field=FloatField(),
+            )
+        )
+
+    return queryset.filter(Q(name__icontains=query) | Q(description__icontains=query))
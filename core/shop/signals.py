@@ -0,0 +1,128 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from . import catalog_sync, counters, price_histogram
+from .promotions import promotion_engine
+from .models import Brand, Category, Product, ProductCard, Promotion
+
+
+@receiver(pre_save, sender=Product)
+def remember_counter_state(sender, instance, raw=False, **kwargs):
+    """
+    Keep the stored category/brand/active/stock/price, and the indexed text,
+    to diff in post_save.
+    """
+    instance._counter_state = instance._histogram_state = None
+    instance._text_state = None
+    if raw or instance.pk is None:
+        return
+    row = (
+        Product.objects.filter(pk=instance.pk)
+        .values_list(
+            "category_id",
+            "brand_id",
+            "is_active",
+            "stock",
+            "price",
+            "name",
+            "slug",
+            "description",
+        )
+        .first()
+    )
+    if row is not None:
+        category_id, brand_id, is_active, stock, price, *text = row
+        instance._counter_state = (category_id, brand_id, is_active, stock)
+        instance._histogram_state = (category_id, is_active, price)
+        instance._text_state = (category_id, brand_id, is_active, *text)
+
+
+def text_state(product):
+    """What the search, trigram and typeahead indexes depend on."""
+    return (
+        product.category_id,
+        product.brand_id,
+        product.is_active,
+        product.name,
+        product.slug,
+        product.description,
+    )
+
+
+@receiver(post_save, sender=Product)
+def index_product(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    old_state = getattr(instance, "_counter_state", None)
+    counters.apply_change(old_state, counters.product_state(instance))
+    price_histogram.apply_change(
+        getattr(instance, "_histogram_state", None),
+        price_histogram.product_state(instance),
+    )
+    # The newest products of a category only change when products enter
+    # or leave it.
+    category_ids = ()
+    if old_state is None or old_state[0::2] != (
+        instance.category_id,
+        instance.is_active,
+    ):
+        category_ids = (instance.category_id, old_state[0] if old_state else None)
+    catalog_sync.product_saved(
+        instance.pk,
+        category_ids,
+        text_changed=getattr(instance, "_text_state", None) != text_state(instance),
+    )
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product(sender, instance, **kwargs):
+    counters.apply_change(counters.product_state(instance), None)
+    price_histogram.apply_change(price_histogram.product_state(instance), None)
+    catalog_sync.product_deleted(instance.pk, instance.category_id)
+
+
+@receiver(pre_save, sender=Brand)
+@receiver(pre_save, sender=Category)
+def remember_indexed_names(sender, instance, raw=False, **kwargs):
+    """Keep the stored name/slug, which products' index rows and cards show."""
+    instance._indexed_names = None
+    if not raw and instance.pk is not None:
+        instance._indexed_names = (
+            sender.objects.filter(pk=instance.pk).values_list("name", "slug").first()
+        )
+
+
+@receiver(post_save, sender=Brand)
+@receiver(post_save, sender=Category)
+def reindex_related_products(sender, instance, created, raw=False, **kwargs):
+    """
+    Brand and category names/slugs are indexed and shown on product cards;
+    queue the reindex of their products when they change.
+    """
+    if raw:
+        return
+    catalog_sync.taxonomy_changed()
+    old_names = getattr(instance, "_indexed_names", None)
+    if old_names is not None and old_names != (instance.name, instance.slug):
+        catalog_sync.queue_reindex(**{sender._meta.model_name: instance})
+
+
+@receiver(pre_delete, sender=Brand)
+def clear_card_brand(sender, instance, **kwargs):
+    """Products keep existing (brand is SET_NULL) without signals firing."""
+    ProductCard.objects.filter(product__brand=instance).update(brand_name="")
+
+
+@receiver(post_delete, sender=Brand)
+@receiver(post_delete, sender=Category)
+def invalidate_facets(sender, instance, **kwargs):
+    catalog_sync.taxonomy_changed()
+
+
+@receiver(post_save, sender=Promotion)
+@receiver(post_delete, sender=Promotion)
+def invalidate_promotions(sender, instance, **kwargs):
+    # After commit, or another request could compile the old rows under the
+    # new version and keep that plan.
+    transaction.on_commit(promotion_engine.invalidate)
@@ -1,6 +1,5 @@
-# shop/templatetags/shop_tags.py
 from django import template
-from shop.models import Product
+from shop.models import ProductCard
 
 register = template.Library()
 
@@ -12,8 +11,8 @@ def show_latest_products(limit=6, category=None):
     :param limit: number of products to show
     :param category: optional category slug to filter
     """
-    products = Product.objects.filter(is_active=True).order_by("-created_at")
+    products = ProductCard.objects.order_by("-created_at")
     if category:
-        products = products.filter(category__slug=category)
+        products = products.filter(category_slug=category)
 
     return {"products": products[:limit]}
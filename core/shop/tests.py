@@ -1,3 +1,794 @@
-from django.test import TestCase
+import io
+import threading
+from collections import Counter
+from decimal import Decimal
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from cart.models import Cart, CartItem
+from orders.models import Order, OrderItem
+
+from . import (
+    catalog_sync,
+    counters,
+    fuzzy,
+    pricing,
+    price_histogram,
+    recommendations,
+    search,
+)
+from .facets import (
+    FACETS,
+    PRICE_BUCKETS,
+    FacetIndex,
+    facet_index,
+    price_bucket,
+    selection_filter,
+)
+from .importer import ProductImporter, read_rows
+from .typeahead import TypeaheadIndex
+from .models import (
+    Brand,
+    Category,
+    Product,
+    ProductCard,
+    ProductPairCount,
+    Promotion,
+)
+from .pagination import KeysetPaginator
+from .promotions import PromotionEngine, get_version, promotion_engine
+
+
+class KeysetPaginatorTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Shoes")
+        # Many products share a price, so pages must split runs of equal keys.
+        self.products = [
+            Product.objects.create(
+                name=f"Product {index:02}",
+                category=category,
+                price=f"{10 + index % 3}.00",
+            )
+            for index in range(20)
+        ]
+
+    def walk(self, ordering, per_page):
+        """Follow next cursors to the end; returns the pages' ids and cursors."""
+        paginator = KeysetPaginator(Product.objects.all(), ordering, per_page)
+        pages = []
+        page = paginator.page()
+        while True:
+            pages.append(page)
+            if not page.has_next():
+                return paginator, pages
+            page = paginator.page(page.next_cursor)
+
+    def assert_pages_cover(self, ordering, per_page):
+        expected = list(
+            Product.objects.order_by(*ordering).values_list("id", flat=True)
+        )
+        paginator, pages = self.walk(ordering, per_page)
+        ids = [product.pk for page in pages for product in page]
+        self.assertEqual(ids, expected)
+        self.assertTrue(all(len(page) <= per_page for page in pages))
+
+        # Walking back from the last page gives the same pages in reverse.
+        page = pages[-1]
+        for previous in reversed(pages[:-1]):
+            page = paginator.page(page.previous_cursor)
+            self.assertEqual(
+                [product.pk for product in page], [product.pk for product in previous]
+            )
+        self.assertFalse(page.has_previous())
+
+    def test_ascending_with_duplicate_keys(self):
+        for per_page in (1, 3, 4, 7, 20):
+            with self.subTest(per_page=per_page):
+                self.assert_pages_cover(("price", "id"), per_page)
+
+    def test_descending_with_duplicate_keys(self):
+        for per_page in (1, 3, 4, 7, 20):
+            with self.subTest(per_page=per_page):
+                self.assert_pages_cover(("-price", "-id"), per_page)
+
+    def test_mixed_directions_fall_back_to_or_conditions(self):
+        self.assert_pages_cover(("price", "-id"), 3)
+
+    def test_seek_uses_a_row_value_comparison(self):
+        paginator, pages = self.walk(("price", "id"), 5)
+        with CaptureQueriesContext(connection) as queries:
+            paginator.page(pages[0].next_cursor)
+        self.assertIn(
+            '("shop_product"."price", "shop_product"."id") >',
+            queries.captured_queries[0]["sql"],
+        )
+
+
+class RecommendationCountTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Shoes")
+        self.products = [
+            Product.objects.create(
+                name=f"Product {index}", category=category, price="1.00"
+            )
+            for index in range(8)
+        ]
+        baskets = [[0, 1, 2], [1, 2], [2, 3, 4, 5], [6]]
+        for index, basket in enumerate(baskets):
+            user = get_user_model().objects.create_user(email=f"{index}@example.com")
+            cart = Cart.objects.create(user=user)
+            for position in basket:
+                CartItem.objects.create(cart=cart, product=self.products[position])
+        order = Order.objects.create(idempotency_key="order")
+        # Repeated lines and deleted products count once / not at all.
+        for position in (1, 2, 2, 7, None):
+            OrderItem.objects.create(
+                order=order,
+                product=None if position is None else self.products[position],
+                unit_price=1,
+                quantity=1,
+            )
+
+    def counts(self):
+        return dict(
+            ((a, b), count)
+            for a, b, count in ProductPairCount.objects.values_list(
+                "product_a", "product_b", "count"
+            )
+        )
+
+    def python_counts(self):
+        """The counts ``count_pairs`` gives for the baskets not yet counted."""
+        deltas = Counter()
+        for source in (recommendations._changed_carts, recommendations._new_orders):
+            for _, _, product_ids in source():
+                recommendations.count_pairs(product_ids, 1, deltas)
+        return {pair: count for pair, count in deltas.items() if count}
+
+    def test_first_build_counts_in_sql_like_count_pairs(self):
+        expected = self.python_counts()
+        with CaptureQueriesContext(connection) as queries:
+            recommendations.build()
+        self.assertEqual(self.counts(), expected)
+        self.assertEqual(
+            sum("GROUP BY" in query["sql"] for query in queries.captured_queries), 1
+        )
+
+    def test_incremental_build_matches_a_full_recount(self):
+        recommendations.build()
+        cart = Cart.objects.order_by("pk").first()
+        cart.items.filter(product=self.products[0]).delete()
+        CartItem.objects.create(cart=cart, product=self.products[5])
+        cart.save()
+
+        recommendations.build()
+        incremental = self.counts()
+        recommendations.build(full=True)
+        self.assertEqual(incremental, self.counts())
+
+
+class TypeaheadRebuildTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Shoes")
+        Product.objects.create(name="Trail Runner", category=category, price="1.00")
+        self.index = TypeaheadIndex()
+        self.index.rebuild()
+
+    def test_stale_index_is_served_while_another_thread_rebuilds(self):
+        self.index._loaded_at = float("-inf")
+        with self.index._rebuild_lock, self.assertNumQueries(0):
+            suggestions = self.index.suggest("trail")
+        self.assertEqual(suggestions, [("product", "Trail Runner", "trail-runner")])
+
+    def test_rebuild_reapplies_products_changed_while_reading(self):
+        product = Product.objects.get()
+        load_taxonomy = self.index._load_taxonomy
+
+        def rename_after_products_were_read():
+            Product.objects.filter(pk=product.pk).update(name="Road Runner")
+            self.index.update_products([product.pk])
+            return load_taxonomy()
+
+        self.index._load_taxonomy = rename_after_products_were_read
+        self.index.rebuild()
+        self.assertEqual(
+            self.index.suggest("road"), [("product", "Road Runner", product.slug)]
+        )
+
+
+class FacetIndexTests(TestCase):
+    def setUp(self):
+        shoes = Category.objects.create(name="Shoes")
+        boots = Category.objects.create(name="Boots", parent=shoes)
+        bags = Category.objects.create(name="Bags")
+        acme = Brand.objects.create(name="Acme")
+        zenith = Brand.objects.create(name="Zenith")
+        for name, category, brand, price, stock in (
+            ("Runner", shoes, acme, "20.00", 3),
+            ("Walker", shoes, zenith, "60.00", 0),
+            ("Hiker", boots, acme, "120.00", 1),
+            ("Ranger", boots, None, "80.00", 0),
+            ("Tote", bags, zenith, "30.00", 5),
+            ("Satchel", bags, acme, "300.00", 2),
+        ):
+            Product.objects.create(
+                name=name, category=category, brand=brand, price=price, stock=stock
+            )
+        self.index = FacetIndex()
+        self.index.rebuild()
+
+    def assertMatchesSql(self, selected):
+        result = self.index.query(selected)
+        products = Product.objects.filter(is_active=True)
+        self.assertEqual(
+            list(result.ids()),
+            sorted(
+                products.filter(selection_filter(selected)).values_list("id", flat=True)
+            ),
+        )
+        for facet in FACETS:
+            others = {key: values for key, values in selected.items() if key != facet}
+            expected = {}
+            for product in products.filter(selection_filter(others)):
+                for value in self.index._products[product.pk][FACETS.index(facet)]:
+                    expected[value] = expected.get(value, 0) + 1
+            counts = {value: n for value, n in result.counts[facet].items() if n}
+            self.assertEqual(counts, expected, facet)
+        return result
+
+    def test_values_of_one_facet_are_or_ed(self):
+        result = self.assertMatchesSql({"category": ["boots", "bags"]})
+        self.assertEqual(result.total, 4)
+        result = self.assertMatchesSql({"brand": ["acme", "zenith"]})
+        self.assertEqual(result.total, 5)
+
+    def test_facets_are_and_ed(self):
+        result = self.assertMatchesSql(
+            {"category": ["shoes"], "brand": ["acme"], "stock": ["in_stock"]}
+        )
+        self.assertEqual(result.total, 2)
+
+    def test_counts_ignore_their_own_facet(self):
+        result = self.assertMatchesSql({"brand": ["acme"], "price": ["0-25"]})
+        self.assertEqual(result.counts["brand"].get("zenith", 0), 0)
+        self.assertEqual(result.counts["price"]["100-150"], 1)
+
+    def test_updates_and_removals_reach_cached_counts(self):
+        selections = [
+            {"brand": ["acme"]},
+            {"category": ["boots"], "stock": ["in_stock"]},
+            {"category": ["shoes"], "price": ["50-75", "75-100"]},
+        ]
+        for selected in selections:
+            self.index.query(selected)
+
+        ranger = Product.objects.get(name="Ranger")
+        ranger.brand = Brand.objects.get(name="Acme")
+        ranger.stock = 4
+        ranger.price = "70.00"
+        ranger.save()
+        self.index.update_products([ranger.pk])
+        Product.objects.filter(name="Tote").update(category=ranger.category)
+        self.index.update_products(
+            Product.objects.filter(name="Tote").values_list("pk", flat=True)
+        )
+        runner = Product.objects.get(name="Runner")
+        self.index.remove_product(runner.pk)
+        runner.delete()
+
+        for selected in selections:
+            self.assertMatchesSql(selected)
+        self.assertMatchesSql({"category": ["boots"], "price": ["25-50"]})
+
+
+class PriceHistogramTests(TestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Shoes")
+        self.brand = Brand.objects.create(name="Acme")
+        for price, brand in (("10.00", self.brand), ("60.00", None), ("80.00", None)):
+            Product.objects.create(
+                name=f"Shoe {price}", category=self.category, brand=brand, price=price
+            )
+        facet_index.rebuild()
+        self.addCleanup(facet_index.invalidate)
+
+    def bars(self, **params):
+        response = self.client.get(reverse("shop:product-list"), params)
+        return [
+            (bar["low"], bar["count"]) for bar in response.context["price_histogram"]
+        ]
+
+    def test_histogram_buckets_are_the_price_facet_buckets(self):
+        for bucket, (value, _, low, high) in enumerate(PRICE_BUCKETS):
+            self.assertEqual(price_histogram.bucket_bounds(bucket), (low, high))
+            self.assertEqual(price_bucket(low), value)
+            self.assertEqual(price_histogram.bucket_for(low), bucket)
+
+    def test_brand_filter_narrows_the_histogram(self):
+        self.assertEqual(
+            self.bars(category=self.category.slug), [(0, 1), (50, 1), (75, 1)]
+        )
+        self.assertEqual(self.bars(brand=self.brand.slug), [(0, 1)])
+        # The price range never narrows its own histogram.
+        self.assertEqual(self.bars(brand=self.brand.slug, min_price="50"), [(0, 1)])
+
+    def test_price_range_is_applied_in_the_index(self):
+        for number, price in enumerate(("10.00", "60.00", "60.00", "75.50", "200.00")):
+            Product.objects.create(
+                name=f"Boot {number}", category=self.category, price=price
+            )
+        Product.objects.filter(price="80.00").update(price="55.00")
+        facet_index.update_products(Product.objects.values_list("id", flat=True))
+        for bounds in [("50", "60"), ("10", None), (None, "75.50"), ("60.01", "199")]:
+            min_price, max_price = (
+                None if bound is None else Decimal(bound) for bound in bounds
+            )
+            products = Product.objects.all()
+            if min_price is not None:
+                products = products.filter(price__gte=min_price)
+            if max_price is not None:
+                products = products.filter(price__lte=max_price)
+            result = facet_index.query({}, price_range=(min_price, max_price))
+            self.assertEqual(
+                list(result.ids()), sorted(products.values_list("id", flat=True))
+            )
+
+
+class GridCacheTests(TestCase):
+    def setUp(self):
+        Product.objects.create(
+            name="Shoe", category=Category.objects.create(name="Shoes"), price="1.00"
+        )
+
+    def test_cached_grid_links_hold_only_the_grid_parameters(self):
+        url = reverse("shop:product-list")
+        first = self.client.get(url, {"sort": "price_asc", "utm_source": "mail"})
+        second = self.client.get(url, {"sort": "price_asc"})
+        self.assertEqual(second["X-Grid-Cache"], "hit")
+        for response in (first, second):
+            self.assertContains(response, "sort=price_asc")
+            self.assertNotContains(response, "utm_source")
+
+    def test_header_search_box_keeps_the_query(self):
+        response = self.client.get(reverse("shop:product-list"), {"search": "shoe"})
+        self.assertContains(
+            response, 'name="search" placeholder="Search products" value="shoe"'
+        )
+
+
+@override_settings(
+    SHOP_TAX_RATE="0.10",
+    SHOP_CATEGORY_TAX_RATES={"1": "0.07", "2": "0.2"},
+    SHOP_BRAND_DISCOUNTS={"1": "0.15", "2": "2.50", "3": "0.333"},
+)
+class PricingTests(TestCase):
+    def products(self):
+        """Unsaved products covering half-cent ties and every rule."""
+        return [
+            Product(price=price, category_id=category_id, brand_id=brand_id)
+            for price in ("0.01", "0.05", "0.15", "0.25", "1.00", "2.50", "19.99")
+            for category_id in (1, 2, 3)
+            for brand_id in (None, 1, 2, 3)
+        ]
+
+    def test_batch_prices_match_get_price(self):
+        products = self.products()
+        for include_tax in (False, True):
+            for discount in (None, "0.1", "0.05", "1"):
+                with self.subTest(include_tax=include_tax, discount=discount):
+                    rules = pricing.configured_rules(discount)
+                    expected = [
+                        str(product.get_price(include_tax, discount))
+                        for product in products
+                    ]
+                    prices = pricing.price_products(products, rules, include_tax)
+                    cents = pricing.price_cents(
+                        [pricing.to_cents(product.price) for product in products],
+                        [product.category_id for product in products],
+                        [product.brand_id for product in products],
+                        rules,
+                        include_tax,
+                    )
+                    self.assertEqual([str(price) for price in prices], expected)
+                    self.assertEqual(
+                        [str(pricing.from_cents(cent)) for cent in cents], expected
+                    )
+
+    def test_ties_round_half_to_even(self):
+        # 0.05 * 0.9 = 0.045 and 0.15 * 0.9 = 0.135.
+        products = [
+            Product(price=price, category_id=3, brand_id=None)
+            for price in ("0.05", "0.15")
+        ]
+        prices = pricing.price_products(products, pricing.configured_rules("0.1"))
+        self.assertEqual([str(price) for price in prices], ["0.04", "0.14"])
+
+    def test_configured_rules_apply(self):
+        product = Product(price="10.00", category_id=2, brand_id=1)
+        self.assertEqual(str(product.get_price()), "8.50")
+        self.assertEqual(str(product.get_price(include_tax=True)), "10.20")
+
+
+class PromotionEngineTests(TestCase):
+    def test_plan_compiled_while_waiting_for_the_lock_is_reused(self):
+        engine = PromotionEngine()
+        compile_plan = engine._compile
+        compiled = []
+
+        def counting_compile(version, now):
+            compiled.append(version)
+            return compile_plan(version, now)
+
+        engine._compile = counting_compile
+        plans = []
+        with engine._lock:
+            waiter = threading.Thread(target=lambda: plans.append(engine.get_plan()))
+            waiter.start()
+            waiter.join(0.2)
+            plans.append(engine.get_plan())
+        waiter.join()
+        self.assertEqual(len(compiled), 1)
+        self.assertIs(plans[0], plans[1])
+
+    def test_saving_a_promotion_bumps_the_version_on_commit(self):
+        version = get_version()
+        with self.captureOnCommitCallbacks() as callbacks:
+            with transaction.atomic():
+                Promotion.objects.create(
+                    name="Big spender",
+                    kind=Promotion.KIND_CART_THRESHOLD,
+                    min_subtotal="100.00",
+                    amount="10.00",
+                )
+            self.assertEqual(get_version(), version)
+        self.assertEqual(callbacks, [promotion_engine.invalidate])
+        callbacks[0]()
+        self.assertNotEqual(get_version(), version)
+
+
+class CatalogSyncRollbackTests(TransactionTestCase):
+    def setUp(self):
+        self.category = Category.objects.create(name="Boots")
+        self.product = Product.objects.create(
+            name="Quokka boot", category=self.category, price="1.00"
+        )
+
+    def found(self, query):
+        return list(
+            search.search(Product.objects.all(), query).values_list("name", flat=True)
+        )
+
+    def create_other(self):
+        Product.objects.create(name="Other", category=self.category, price="1.00")
+
+    def test_rolled_back_delete_is_not_applied_by_the_next_commit(self):
+        with self.assertRaises(ZeroDivisionError):
+            with transaction.atomic():
+                Product.objects.get(pk=self.product.pk).delete()
+                1 / 0
+        self.create_other()
+        self.assertEqual(self.found("quokka"), ["Quokka boot"])
+
+    def test_rolled_back_savepoint_is_discarded(self):
+        with transaction.atomic():
+            self.create_other()
+            with self.assertRaises(ZeroDivisionError):
+                with transaction.atomic():
+                    Product.objects.get(pk=self.product.pk).delete()
+                    1 / 0
+            Product.objects.filter(pk=self.product.pk).first().save()
+        self.assertEqual(self.found("quokka"), ["Quokka boot"])
+
+    def test_committed_changes_are_applied(self):
+        with transaction.atomic():
+            self.product.name = "Wombat boot"
+            self.product.save()
+            with transaction.atomic():
+                self.create_other()
+        self.assertEqual(self.found("wombat"), ["Wombat boot"])
+        self.assertEqual(self.found("quokka"), [])
+
+
+class ProductImporterTests(TestCase):
+    HEADER = "name,category,brand,price,stock,description\n"
+
+    def setUp(self):
+        self.shoes = Category.objects.create(name="Shoes")
+        self.acme = Brand.objects.create(name="Acme")
+
+    def run_import(self, lines):
+        importer = ProductImporter(batch_size=2)
+        file = io.StringIO(self.HEADER + "".join(f"{line}\n" for line in lines))
+        rejected = list(importer.run(read_rows(file, "csv")))
+        importer.finish()
+        return importer, rejected
+
+    def test_creates_new_and_updates_existing_products(self):
+        self.run_import(["Trail Runner,shoes,acme,20.00,3,Light"])
+        importer, rejected = self.run_import(
+            ["Trail Runner,shoes,acme,25.00,0,Light", "Road Runner,shoes,,30.00,1,"]
+        )
+        self.assertEqual(rejected, [])
+        self.assertEqual((importer.created, importer.updated), (1, 1))
+        self.assertEqual(
+            dict(Product.objects.values_list("slug", "price")),
+            {"trail-runner": Decimal("25.00"), "road-runner": Decimal("30.00")},
+        )
+
+    def test_bad_rows_are_rejected_with_a_reason(self):
+        importer, rejected = self.run_import(
+            [
+                "Trail Runner,shoes,acme,20.00,3,",
+                "Boot,sandals,,20.00,1,",
+                "Sandal,shoes,,cheap,1,",
+                "Clog,shoes,nobody,5.00,1,",
+            ]
+        )
+        self.assertEqual(
+            [(line, reason) for line, _, reason in rejected],
+            [
+                (3, "unknown category 'sandals'"),
+                (4, "invalid price 'cheap'"),
+                (5, "unknown brand 'nobody'"),
+            ],
+        )
+        self.assertEqual((importer.created, importer.rejected), (1, 3))
+        self.assertEqual(
+            list(Product.objects.values_list("name", flat=True)), ["Trail Runner"]
+        )
+
+    def test_importing_the_same_file_again_changes_nothing(self):
+        lines = [f"Shoe {number},shoes,acme,{number}.00,1," for number in range(1, 6)]
+        self.run_import(lines)
+        before = list(Product.objects.order_by("pk").values_list("pk", "slug", "price"))
+        importer, rejected = self.run_import(lines)
+        self.assertEqual(rejected, [])
+        self.assertEqual((importer.created, importer.updated), (0, 5))
+        self.assertEqual(
+            list(Product.objects.order_by("pk").values_list("pk", "slug", "price")),
+            before,
+        )
+
+    def test_counters_cards_and_search_follow_the_import(self):
+        self.run_import(
+            ["Trail Runner,shoes,acme,20.00,3,Grippy sole", "Boot,shoes,acme,50.00,0,"]
+        )
+        self.run_import(["Trail Runner,shoes,acme,22.00,0,Grippy sole"])
+
+        for model in (Category, Brand):
+            self.assertEqual(counters.rebuild(model, fix=False), [])
+        self.shoes.refresh_from_db()
+        self.assertEqual(
+            (self.shoes.active_product_count, self.shoes.in_stock_product_count), (2, 0)
+        )
+        card = ProductCard.objects.get(product__slug="trail-runner")
+        self.assertEqual(
+            card.display_price, Product.objects.get(slug="trail-runner").get_price()
+        )
+        self.assertFalse(card.in_stock)
+        if search.is_supported():
+            matches = search.search(Product.objects.all(), "grippy")
+            self.assertEqual(
+                list(matches.values_list("slug", flat=True)), ["trail-runner"]
+            )
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            shoes = Category.objects.create(name="Shoes")
+            for name, description in (
+                ("Leather Boot", "Ready for the trail"),
+                ("Trail Runner", "Light and fast"),
+                ("Sandal", "For the beach"),
+            ):
+                Product.objects.create(
+                    name=name, category=shoes, price="1.00", description=description
+                )
+
+    def names(self, query):
+        results = search.search(Product.objects.all(), query)
+        if search.is_supported():
+            results = results.order_by("-search_rank")
+        return list(results.values_list("name", flat=True))
+
+    def test_name_matches_rank_above_description_matches(self):
+        self.assertEqual(self.names("trail"), ["Trail Runner", "Leather Boot"])
+
+    def test_last_word_matches_as_a_prefix(self):
+        self.assertEqual(self.names("leather bo"), ["Leather Boot"])
+        self.assertEqual(self.names("beach sandals"), [])
+
+    def test_other_databases_fall_back_to_icontains(self):
+        connection.vendor = "other"
+        self.addCleanup(delattr, connection, "vendor")
+        self.assertFalse(search.is_supported())
+        self.assertEqual(sorted(self.names("trail")), ["Leather Boot", "Trail Runner"])
+
+
+class FuzzySearchTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            shoes = Category.objects.create(name="Shoes")
+            acme = Brand.objects.create(name="Acme")
+            for name in ("Trail Runner", "Leather Boot"):
+                Product.objects.create(
+                    name=name, category=shoes, brand=acme, price="1.00"
+                )
+
+    def test_misspelled_search_falls_back_to_similar_names(self):
+        response = self.client.get(
+            reverse("shop:product-list"), {"search": "trail runer"}
+        )
+        self.assertTrue(response.context["fuzzy_search"])
+        self.assertEqual(response.context["search_suggestion"], "trail runner")
+        self.assertEqual(
+            [product.name for product in response.context["products"]],
+            ["Trail Runner"],
+        )
+
+    def test_words_are_corrected_from_the_index(self):
+        self.assertEqual(fuzzy.suggest("lether bot"), "leather boot")
+        self.assertIsNone(fuzzy.suggest("leather boot"))
+        self.assertEqual(
+            list(
+                fuzzy.search(Product.objects.all(), "acmme")
+                .values_list("name", flat=True)
+                .order_by("name")
+            ),
+            ["Leather Boot", "Trail Runner"],
+        )
+
+
+class CategoryTreeTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.clothing = Category.objects.create(name="Clothing")
+            self.shoes = Category.objects.create(name="Shoes", parent=self.clothing)
+            self.boots = Category.objects.create(name="Boots", parent=self.shoes)
+            self.outdoor = Category.objects.create(name="Outdoor")
+            Product.objects.create(name="Hiker", category=self.boots, price="1.00")
+            Product.objects.create(name="Scarf", category=self.clothing, price="1.00")
+        self.addCleanup(facet_index.invalidate)
+
+    def names(self, category):
+        response = self.client.get(reverse("shop:product-list"), {"category": category})
+        return sorted(product.name for product in response.context["products"])
+
+    def test_subtree_filter_follows_a_moved_category(self):
+        self.assertEqual(self.names("clothing"), ["Hiker", "Scarf"])
+        self.assertEqual(self.names("outdoor"), [])
+
+        with self.captureOnCommitCallbacks(execute=True), transaction.atomic():
+            self.shoes.parent = self.outdoor
+            self.shoes.save()
+
+        self.boots.refresh_from_db()
+        self.assertEqual(
+            self.boots.path, f"{self.outdoor.pk}/{self.shoes.pk}/{self.boots.pk}/"
+        )
+        self.assertEqual(self.boots.depth, 2)
+        self.assertEqual(
+            list(self.boots.get_ancestors().values_list("name", flat=True)),
+            ["Outdoor", "Shoes"],
+        )
+        self.assertEqual(self.names("clothing"), ["Scarf"])
+        self.assertEqual(self.names("outdoor"), ["Hiker"])
+
+
+class CatalogCounterTests(TestCase):
+    def setUp(self):
+        self.shoes = Category.objects.create(name="Shoes")
+        self.bags = Category.objects.create(name="Bags")
+        self.acme = Brand.objects.create(name="Acme")
+
+    def counts(self, obj):
+        obj.refresh_from_db()
+        return obj.active_product_count, obj.in_stock_product_count
+
+    def test_signals_keep_the_counters_current(self):
+        boot = Product.objects.create(
+            name="Boot", category=self.shoes, brand=self.acme, price="1.00", stock=2
+        )
+        Product.objects.create(name="Clog", category=self.shoes, price="1.00")
+        self.assertEqual(self.counts(self.shoes), (2, 1))
+        self.assertEqual(self.counts(self.acme), (1, 1))
+
+        boot.stock = 0
+        boot.save()
+        self.assertEqual(self.counts(self.shoes), (2, 0))
+        boot.category = self.bags
+        boot.stock = 1
+        boot.save()
+        self.assertEqual(self.counts(self.shoes), (1, 0))
+        self.assertEqual(self.counts(self.bags), (1, 1))
+        boot.is_active = False
+        boot.save()
+        self.assertEqual(self.counts(self.bags), (0, 0))
+        self.assertEqual(self.counts(self.acme), (0, 0))
+        Product.objects.get(name="Clog").delete()
+        self.assertEqual(self.counts(self.shoes), (0, 0))
+
+    def test_drift_from_queryset_updates_is_reported_and_fixed(self):
+        Product.objects.create(name="Boot", category=self.shoes, price="1.00", stock=2)
+        # Queryset updates send no signals.
+        Product.objects.update(category=self.bags)
+
+        out = io.StringIO()
+        call_command("rebuild_catalog_counters", dry_run=True, stdout=out)
+        self.assertIn("Category 'Shoes': active 1 → 0, in stock 1 → 0", out.getvalue())
+        self.assertIn("2 drifted counters (dry run)", out.getvalue())
+        self.assertEqual(self.counts(self.bags), (0, 0))
+
+        call_command("rebuild_catalog_counters", stdout=io.StringIO())
+        self.assertEqual(self.counts(self.shoes), (0, 0))
+        self.assertEqual(self.counts(self.bags), (1, 1))
+
+
+class ProductCardTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.shoes = Category.objects.create(name="Shoes")
+            self.acme = Brand.objects.create(name="Acme")
+            self.boot = Product.objects.create(
+                name="Boot", category=self.shoes, brand=self.acme, price="1.00"
+            )
+
+    def card(self):
+        return ProductCard.objects.get(product=self.boot)
+
+    def test_cards_follow_brand_and_category_renames(self):
+        self.assertEqual(
+            (self.card().brand_name, self.card().category_slug), ("Acme", "shoes")
+        )
+        self.acme.name = "Acme Outdoor"
+        self.acme.save()
+        self.shoes.slug = "footwear"
+        self.shoes.save()
+        # Renames are queued and applied by process_reindex_jobs.
+        self.assertEqual(self.card().brand_name, "Acme")
+
+        self.assertEqual(catalog_sync.process_reindex_jobs(), 2)
+        self.assertEqual(
+            (self.card().brand_name, self.card().category_slug),
+            ("Acme Outdoor", "footwear"),
+        )
+        if search.is_supported():
+            self.assertEqual(
+                list(search.search(Product.objects.all(), "outdoor")), [self.boot]
+            )
+
+
+class ProductDetailCacheTests(TestCase):
+    def setUp(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.boot = Product.objects.create(
+                name="Boot",
+                category=Category.objects.create(name="Shoes"),
+                price="1.00",
+                stock=5,
+                description="Original",
+            )
+        self.url = self.boot.get_absolute_url()
+
+    def test_body_is_cached_until_the_product_is_updated(self):
+        self.assertContains(self.client.get(self.url), "Original")
+        # Queryset updates keep updated_at, so the cached body is served.
+        Product.objects.filter(pk=self.boot.pk).update(description="Edited")
+        self.assertContains(self.client.get(self.url), "Original")
+
+        self.boot.refresh_from_db()
+        self.boot.save()
+        self.assertContains(self.client.get(self.url), "Edited")
+
+    def test_cart_quantity_is_added_to_the_cached_body(self):
+        self.client.get(self.url)
+        session = self.client.session
+        session["cart"] = {"items": [{"product_id": self.boot.pk, "quantity": 2}]}
+        session.save()
+        self.assertContains(self.client.get(self.url), "In your cart: 2")
@@ -0,0 +1,257 @@
+"""
+In-memory typeahead index for the header search box.
+
+Each PrefixIndex keeps the normalized text of its entries and one sorted
+``array`` of positions, one position per word start: ``slot << 16 | offset``,
+ordered by the entry's text from that offset on. A lookup is a bisect into
+that array followed by a short forward scan, so answering costs
+O(log n + results) and the index costs 8 bytes per word on top of the text
+itself, even with hundreds of thousands of product names.
+
+Like the facet index it lives in each process, is updated incrementally from
+Product signals and fully reloaded every SHOP_TYPEAHEAD_INDEX_TTL seconds,
+by one request at a time while the others keep using the old index.
+Brands and categories are few and are simply reloaded when they change.
+"""
+
+import bisect
+import re
+import threading
+import time
+from array import array
+
+from django.conf import settings
+
+OFFSET_BITS = 16
+OFFSET_MASK = (1 << OFFSET_BITS) - 1
+
+# Suggestions returned per kind, in display order.
+LIMITS = {"category": 3, "brand": 3, "product": 8}
+
+WORD_START_RE = re.compile(r"\b\w")
+
+
+def normalize(text):
+    return " ".join(text.casefold().split())
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._texts = []
+        self._payloads = []
+        self._slots = {}
+        self._positions = array("q")
+
+    @classmethod
+    def build(cls, entries):
+        """Build an index from (key, text, payload) tuples."""
+        index = cls()
+        positions = []
+        for key, text, payload in entries:
+            slot = index._append(key, text, payload)
+            positions.extend(index._word_positions(slot))
+        positions.sort(key=index._suffix)
+        index._positions = array("q", positions)
+        return index
+
+    def __len__(self):
+        return len(self._slots)
+
+    def _append(self, key, text, payload):
+        slot = len(self._texts)
+        self._texts.append(normalize(text))
+        self._payloads.append(payload)
+        self._slots[key] = slot
+        return slot
+
+    def _word_positions(self, slot):
+        return [
+            slot << OFFSET_BITS | match.start()
+            for match in WORD_START_RE.finditer(self._texts[slot])
+            if match.start() <= OFFSET_MASK
+        ]
+
+    def _suffix(self, position):
+        return self._texts[position >> OFFSET_BITS][position & OFFSET_MASK :]
+
+    def add(self, key, text, payload):
+        self.remove(key)
+        slot = self._append(key, text, payload)
+        for position in self._word_positions(slot):
+            at = bisect.bisect_left(
+                self._positions, self._suffix(position), key=self._suffix
+            )
+            self._positions.insert(at, position)
+
+    def remove(self, key):
+        slot = self._slots.pop(key, None)
+        if slot is None:
+            return
+        for position in self._word_positions(slot):
+            suffix = self._suffix(position)
+            at = bisect.bisect_left(self._positions, suffix, key=self._suffix)
+            while at < len(self._positions) and self._positions[at] != position:
+                at += 1
+            if at < len(self._positions):
+                del self._positions[at]
+        # The slot stays allocated until the next full rebuild.
+        self._texts[slot] = ""
+        self._payloads[slot] = None
+
+    def search(self, prefix, limit):
+        """Payloads of up to ``limit`` entries with a word starting with ``prefix``."""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        results = []
+        seen = set()
+        positions = self._positions
+        at = bisect.bisect_left(positions, prefix, key=self._suffix)
+        while at < len(positions) and len(results) < limit:
+            position = positions[at]
+            if not self._suffix(position).startswith(prefix):
+                break
+            slot = position >> OFFSET_BITS
+            if slot not in seen:
+                seen.add(slot)
+                results.append(self._payloads[slot])
+            at += 1
+        return results
+
+
+class TypeaheadIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._rebuild_lock = threading.Lock()
+        # Products changed while a rebuild was reading the table.
+        self._changed_during_rebuild = None
+        self._indexes = None
+        self._loaded_at = 0.0
+
+    @property
+    def ttl(self):
+        return getattr(settings, "SHOP_TYPEAHEAD_INDEX_TTL", 600)
+
+    def rebuild(self):
+        """
+        Load the names of all active products, brands and categories and
+        swap them in. Products changed while the table was being read are
+        re-applied.
+        """
+        from shop.models import Product
+
+        with self._lock:
+            self._changed_during_rebuild = set()
+        try:
+            products = PrefixIndex.build(
+                (product_id, name, ("product", name, slug))
+                for product_id, name, slug in Product.objects.filter(is_active=True)
+                .values_list("id", "name", "slug")
+                .iterator(chunk_size=5000)
+            )
+            brands, categories = self._load_taxonomy()
+            with self._lock:
+                self._indexes = {
+                    "category": categories,
+                    "brand": brands,
+                    "product": products,
+                }
+                self._loaded_at = time.monotonic()
+        finally:
+            with self._lock:
+                changed_ids = self._changed_during_rebuild
+                self._changed_during_rebuild = None
+        self.update_products(changed_ids)
+
+    def _load_taxonomy(self):
+        from shop.models import Brand, Category
+
+        brands = PrefixIndex.build(
+            (brand_id, name, ("brand", name, slug))
+            for brand_id, name, slug in Brand.objects.filter(
+                is_active=True
+            ).values_list("id", "name", "slug")
+        )
+        categories = PrefixIndex.build(
+            (category_id, name, ("category", full_name or name, slug))
+            for category_id, name, full_name, slug in Category.objects.filter(
+                is_active=True
+            ).values_list("id", "name", "full_name", "slug")
+        )
+        return brands, categories
+
+    def refresh_taxonomy(self):
+        """Reload brands and categories (no-op until loaded)."""
+        if self._indexes is None:
+            return
+        brands, categories = self._load_taxonomy()
+        with self._lock:
+            if self._indexes is not None:
+                self._indexes["brand"] = brands
+                self._indexes["category"] = categories
+
+    def _is_stale(self):
+        return self._indexes is None or time.monotonic() - self._loaded_at > self.ttl
+
+    def _ensure_loaded(self):
+        """
+        Rebuild the index when missing or stale, in one thread at a time.
+        Other threads wait only when there is no index to serve yet.
+        """
+        if not self._is_stale():
+            return
+        if not self._rebuild_lock.acquire(blocking=self._indexes is None):
+            return
+        try:
+            if self._is_stale():
+                self.rebuild()
+        finally:
+            self._rebuild_lock.release()
+
+    def update_products(self, product_ids):
+        """Re-read some products' names (no-op until loaded)."""
+        from shop.models import Product
+
+        product_ids = set(product_ids)
+        with self._lock:
+            if self._changed_during_rebuild is not None:
+                self._changed_during_rebuild.update(product_ids)
+            if self._indexes is None or not product_ids:
+                return
+        rows = {
+            product_id: (name, slug)
+            for product_id, name, slug in Product.objects.filter(
+                pk__in=product_ids, is_active=True
+            ).values_list("id", "name", "slug")
+        }
+        with self._lock:
+            if self._indexes is None:
+                return
+            for product_id in product_ids:
+                if product_id in rows:
+                    name, slug = rows[product_id]
+                    self._indexes["product"].add(
+                        product_id, name, ("product", name, slug)
+                    )
+                else:
+                    self._indexes["product"].remove(product_id)
+
+    def remove_product(self, product_id):
+        with self._lock:
+            if self._changed_during_rebuild is not None:
+                self._changed_during_rebuild.add(product_id)
+            if self._indexes is not None:
+                self._indexes["product"].remove(product_id)
+
+    def suggest(self, query):
+        """Return (kind, label, slug) suggestions for ``query``."""
+        self._ensure_loaded()
+        with self._lock:
+            return [
+                payload
+                for kind, limit in LIMITS.items()
+                for payload in self._indexes[kind].search(query, limit)
+            ]
+
+
+typeahead_index = TypeaheadIndex()
@@ -1,10 +1,11 @@
 from django.urls import path
 
-from .views import ProductListView, ProductDetailView
+from .views import ProductListView, ProductDetailView, TypeaheadView
 
 app_name = "shop"
 
 urlpatterns = [
     path("", ProductListView.as_view(), name="product-list"),
     path("products/<slug:slug>/", ProductDetailView.as_view(), name="product-single"),
+    path("search/suggest/", TypeaheadView.as_view(), name="typeahead"),
 ]
@@ -1,7 +1,42 @@
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import JsonResponse
+from django.shortcuts import get_object_or_404
+from django.urls import reverse
+from django.utils.http import urlencode
+from django.views import View
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
 from django.views.generic.list import ListView
 from django.views.generic.detail import DetailView
 
 from shop.models import Product, Category, Brand
+from cart.cart import CartSession
+from shop import fuzzy, grid_cache, price_histogram, related, search
+from shop.cards import cards_for
+from shop.pagination import KeysetPaginator
+from shop.typeahead import typeahead_index
+from shop.facets import (
+    FACETS,
+    PRICE_BUCKETS,
+    STOCK_VALUES,
+    bitmap_from_ids,
+    facet_index,
+    selection_filter,
+)
+
+# Sort options for the catalog; each ends with ``id`` so keyset pagination
+# has a unique, stable position.
+SORT_ORDERINGS = {
+    "price_asc": ("price", "id"),
+    "price_desc": ("-price", "-id"),
+    "name_asc": ("name", "id"),
+    "name_desc": ("-name", "-id"),
+    "newest": ("-created_at", "-id"),
+}
+DEFAULT_ORDERING = ("-created_at", "-id")
 
 
 class ProductListView(ListView):
@@ -9,49 +44,292 @@ class ProductListView(ListView):
     template_name = "shop/product_list.html"
     context_object_name = "products"
     paginate_by = 12
+    grid_template_name = "shop/product_grid.html"
+
+    def get(self, request, *args, **kwargs):
+        """
+        The sidebar, cards and pagination are rendered once per catalog
+        version and query, then served from the cache.
+        """
+        self.object_list = None
+        self.query = grid_cache.grid_query(request.GET)
+        grid, hit = grid_cache.get_or_render(self.query, self.render_grid)
+        response = self.render_to_response(
+            {
+                "view": self,
+                "grid": mark_safe(grid),
+                "sort_option": request.GET.get("sort", ""),
+                # For the header search box, outside the cached grid.
+                "search_query": request.GET.get("search", ""),
+            }
+        )
+        response["X-Grid-Cache"] = "hit" if hit else "miss"
+        return response
+
+    def render_grid(self):
+        self.object_list = self.get_queryset()
+        context = self.get_context_data()
+        return render_to_string(self.grid_template_name, context, self.request)
 
     def get_queryset(self):
-        queryset = Product.objects.filter(is_active=True)
-        search_query = self.request.GET.get("search", "")
+        # Only the sort keys are loaded; the page is rendered from cards.
+        queryset = Product.objects.filter(is_active=True).only(
+            "id", "name", "price", "created_at"
+        )
+        search_query = self.query.get("search", "")
+        self.fuzzy_search = False
+        self.search_suggestion = None
         if search_query:
-            queryset = queryset.filter(name__icontains=search_query)
-
-        category_slug = self.request.GET.get("category")
-        if category_slug:
-            queryset = queryset.filter(category__slug=category_slug)
-
-        brand_slug = self.request.GET.get("brand")
-        if brand_slug:
-            queryset = queryset.filter(brand__slug=brand_slug)
-
-        sort_option = self.request.GET.get("sort", "")
-        if sort_option == "price_asc":
-            queryset = queryset.order_by("price")
-        elif sort_option == "price_desc":
-            queryset = queryset.order_by("-price")
-        elif sort_option == "name_asc":
-            queryset = queryset.order_by("name")
-        elif sort_option == "name_desc":
-            queryset = queryset.order_by("-name")
-        elif sort_option == "newest":
-            queryset = queryset.order_by("-created_at")
-
-        return queryset
+            matches = search.search(queryset, search_query)
+            if fuzzy.is_supported() and not matches.exists():
+                # Nothing matched exactly: fall back to similar spellings.
+                self.fuzzy_search = True
+                self.search_suggestion = fuzzy.suggest(search_query)
+                matches = fuzzy.search(queryset, search_query)
+            queryset = matches
+        self.search_matches = queryset
+
+        # ?min_price=10&max_price=50, served by the (is_active, price) index.
+        self.price_range = self.get_price_range()
+        min_price, max_price = self.price_range
+        if min_price is not None:
+            queryset = queryset.filter(price__gte=min_price)
+        if max_price is not None:
+            queryset = queryset.filter(price__lte=max_price)
+
+        # Multi-select facets: ?category=a&category=b&brand=c&price=0-25
+        self.selected_facets = {
+            facet: [value for value in self.query.getlist(facet) if value]
+            for facet in FACETS
+        }
+        queryset = queryset.filter(selection_filter(self.selected_facets))
+
+        sort_option = self.query.get("sort", "")
+        if sort_option in SORT_ORDERINGS:
+            self.keyset_ordering = SORT_ORDERINGS[sort_option]
+        elif search_query and search.is_supported():
+            # Relevance is computed per query, so it can't be used as a key.
+            self.keyset_ordering = None
+            return queryset.order_by("-search_rank", "-created_at")
+        else:
+            self.keyset_ordering = DEFAULT_ORDERING
+
+        return queryset.order_by(*self.keyset_ordering)
+
+    def get_price_range(self):
+        """(min_price, max_price) from the query; invalid bounds are ignored."""
+        bounds = []
+        for param in ("min_price", "max_price"):
+            try:
+                value = Decimal(self.query.get(param, ""))
+            except InvalidOperation:
+                value = None
+            if value is not None and (not value.is_finite() or value < 0):
+                value = None
+            bounds.append(value)
+        return tuple(bounds)
+
+    def paginate_queryset(self, queryset, page_size):
+        """
+        Use keyset pagination (?cursor=...) unless ordering by relevance.
+        The products of the page are swapped for their ProductCard rows.
+        """
+        if self.keyset_ordering is None:
+            paginator, page, object_list, is_paginated = super().paginate_queryset(
+                queryset, page_size
+            )
+        else:
+            paginator = KeysetPaginator(queryset, self.keyset_ordering, page_size)
+            page = paginator.page(self.query.get("cursor"))
+            is_paginated = page.has_other_pages()
+        page.object_list = cards_for(page.object_list)
+        return (paginator, page, page.object_list, is_paginated)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["categories"] = Category.objects.filter(is_active=True)
-        context["brands"] = Brand.objects.filter(is_active=True)
-        context["search_query"] = self.request.GET.get("search", "")
-        context["selected_category"] = self.request.GET.get("category", "")
-        context["selected_brand"] = self.request.GET.get("brand", "")
-        context["sort_option"] = self.request.GET.get("sort", "")
+        context["categories"] = Category.objects.filter(is_active=True).order_by(
+            "full_name"
+        )
+        # Brands without active products can never match; the denormalized
+        # counter lets us skip them without touching the product table.
+        context["brands"] = Brand.objects.filter(
+            is_active=True, active_product_count__gt=0
+        )
+        context["facets"] = self.get_facets(context["categories"], context["brands"])
+        context["min_price"], context["max_price"] = self.price_range
+        context["price_histogram"] = self.get_price_histogram()
+        context["price_form_params"] = [
+            (param, value)
+            for param, values in self.query.lists()
+            if param not in ("min_price", "max_price", "page", "cursor")
+            for value in values
+        ]
+        context["search_query"] = self.query.get("search", "")
+        context["fuzzy_search"] = self.fuzzy_search
+        if self.search_suggestion:
+            context["search_suggestion"] = self.search_suggestion
+            context["search_suggestion_query"] = self.suggestion_querystring()
+        context["selected_category"] = self.query.get("category", "")
+        context["selected_brand"] = self.query.get("brand", "")
+        context["sort_option"] = self.query.get("sort", "")
+        page_query = self.query.copy()
+        page_query.pop("page", None)
+        page_query.pop("cursor", None)
+        context["page_query"] = page_query.urlencode()
+        page = context["page_obj"]
+        if self.keyset_ordering is not None and page is not None:
+            context["cursor_pagination"] = True
+            context["next_page_query"] = self.cursor_querystring(page.next_cursor)
+            context["previous_page_query"] = self.cursor_querystring(
+                page.previous_cursor
+            )
         return context
 
+    def suggestion_querystring(self):
+        query = self.query.copy()
+        query.pop("page", None)
+        query.pop("cursor", None)
+        query["search"] = self.search_suggestion
+        return query.urlencode()
+
+    def cursor_querystring(self, cursor):
+        if cursor is None:
+            return None
+        query = self.query.copy()
+        query.pop("page", None)
+        query["cursor"] = cursor
+        return query.urlencode()
+
+    def get_facets(self, categories, brands):
+        """
+        Build the sidebar facets with live counts from the in-memory facet
+        index. Options without matches are hidden unless selected.
+        """
+        # Search narrows the counts too; the index applies the price range.
+        self.search_bitmap = None
+        if self.query.get("search"):
+            self.search_bitmap = bitmap_from_ids(
+                self.search_matches.order_by().values_list("id", flat=True)
+            )
+        result = self.facet_result = facet_index.query(
+            self.selected_facets, self.search_bitmap, self.price_range
+        )
+
+        choices = {
+            "category": [
+                (category.slug, category.full_path) for category in categories
+            ],
+            "brand": [(brand.slug, brand.name) for brand in brands],
+            "price": [(value, label) for value, label, _, _ in PRICE_BUCKETS],
+            "stock": list(STOCK_VALUES),
+        }
+        labels = {
+            "category": "Category",
+            "brand": "Brand",
+            "price": "Price",
+            "stock": "Availability",
+        }
+
+        facets = []
+        for facet in FACETS:
+            selected = self.selected_facets[facet]
+            options = []
+            for value, label in choices[facet]:
+                count = result.counts[facet].get(value, 0)
+                is_selected = value in selected
+                if not count and not is_selected:
+                    continue
+                toggled = (
+                    [v for v in selected if v != value]
+                    if is_selected
+                    else selected + [value]
+                )
+                options.append(
+                    {
+                        "value": value,
+                        "label": label,
+                        "count": count,
+                        "selected": is_selected,
+                        "url": self.facet_querystring(facet, toggled),
+                    }
+                )
+            facets.append(
+                {
+                    "name": facet,
+                    "label": labels[facet],
+                    "options": options,
+                    "clear_url": self.facet_querystring(facet, []),
+                }
+            )
+        return facets
+
+    def get_price_histogram(self):
+        """
+        Bars for the price filter; each bar links to its price range. When
+        only categories are selected they come from the precomputed
+        histogram, otherwise from the facet index's price counts so brands,
+        availability and search narrow them too. The price range itself
+        never does.
+        """
+        selected = self.selected_facets
+        if self.query.get("search") or selected["brand"] or selected["stock"]:
+            buckets = self.filtered_price_buckets()
+        else:
+            buckets = price_histogram.histogram(selected["category"])
+        tallest = max((count for _, _, count in buckets), default=0)
+        min_price, max_price = self.price_range
+        bars = []
+        for low, high, count in buckets:
+            if not count:
+                continue
+            bars.append(
+                {
+                    "low": low,
+                    "high": high,
+                    "count": count,
+                    "height": max(round(100 * count / tallest), 5),
+                    "selected": (max_price is None or low <= max_price)
+                    and (min_price is None or high is None or high > min_price),
+                    "url": self.price_querystring(low, high),
+                }
+            )
+        return bars
+
+    def filtered_price_buckets(self):
+        """[(low, high, count)] of the price facet for the current filters."""
+        result = self.facet_result
+        if any(bound is not None for bound in self.price_range):
+            # The sidebar counts were restricted to the price range.
+            result = facet_index.query(self.selected_facets, self.search_bitmap)
+        counts = result.counts["price"]
+        return [
+            (low, high, counts.get(value, 0)) for value, _, low, high in PRICE_BUCKETS
+        ]
+
+    def price_querystring(self, low, high):
+        query = self.query.copy()
+        query.pop("page", None)
+        query.pop("cursor", None)
+        query["min_price"] = low
+        if high is None:
+            query.pop("max_price", None)
+        else:
+            # Bucket upper edges are exclusive; prices have two decimals.
+            query["max_price"] = high - Decimal("0.01")
+        return query.urlencode()
+
+    def facet_querystring(self, facet, values):
+        query = self.query.copy()
+        query.pop("page", None)
+        query.pop("cursor", None)
+        query.setlist(facet, values)
+        return query.urlencode()
+
 
 class ProductDetailView(DetailView):
     model = Product
     template_name = "shop/product_single.html"
+    body_template_name = "shop/product_single_body.html"
     context_object_name = "product"
 
     slug_field = "slug"
@@ -60,34 +338,65 @@ class ProductDetailView(DetailView):
     def get_queryset(self):
         return Product.objects.filter(is_active=True)
 
-    def get_context_data(self, **kwargs):
-        context = super().get_context_data(**kwargs)
-        product = self.object
-
-        # Get cart from session
-        cart = self.request.session.get("cart", {})
+    def get(self, request, *args, **kwargs):
+        """
+        The non-personalized body of the page is cached per product,
+        versioned by its ``updated_at`` and related products, so a hit costs
+        two indexed lookups. Only the cart quantity is added per request.
+        """
+        self.object = None
+        pk, updated_at, latest_product_ids = get_object_or_404(
+            self.get_queryset().values_list(
+                "pk", "updated_at", "category__latest_product_ids"
+            ),
+            slug=kwargs[self.slug_url_kwarg],
+        )
+        related_ids = related.related_ids(
+            pk, latest_product_ids or [], related.neighbor_ids(pk)
+        )
+        key = "shop:product:{}:{}:{}".format(
+            pk, updated_at.timestamp(), "-".join(map(str, related_ids))
+        )
+        body = cache.get(key)
+        if body is None:
+            body = self.render_body(pk, related_ids)
+            cache.set(key, body, getattr(settings, "SHOP_DETAIL_CACHE_TIMEOUT", 600))
 
-        # Cart may store product IDs as strings → make sure to check both str and int
-        product_id_str = str(product.id)
-        product_id_int = product.id
+        cart = CartSession(request.session)
+        return self.render_to_response(
+            {
+                "view": self,
+                "body": mark_safe(body),
+                "product_quantity": cart.get_product_quantity(pk),
+            }
+        )
 
-        product_quantity = 1  # default
-        if product_id_str in cart:
-            product_quantity = cart[product_id_str].get("quantity", 1)
-        elif product_id_int in cart:
-            product_quantity = cart[product_id_int].get("quantity", 1)
+    def render_body(self, pk, related_ids):
+        self.object = (
+            self.get_queryset()
+            .select_related("brand", "category")
+            .prefetch_related("images")
+            .get(pk=pk)
+        )
+        context = self.get_context_data(object=self.object)
+        context["related_products"] = cards_for(related_ids)
+        context["brand"] = self.object.brand
+        context["category"] = self.object.category
+        return render_to_string(self.body_template_name, context, self.request)
 
-        context["product_quantity"] = product_quantity
 
-        # Related products
-        context["related_products"] = (
-            Product.objects.filter(category=product.category, is_active=True)
-            .exclude(id=product.id)
-            .order_by("-created_at")[:4]
-        )
+class TypeaheadView(View):
+    """JSON suggestions for the header search box (?q=...)."""
 
-        # Extra info
-        context["brand"] = product.brand
-        context["category"] = product.category
+    max_query_length = 100
 
-        return context
+    def get(self, request, *args, **kwargs):
+        query = request.GET.get("q", "")[: self.max_query_length]
+        results = []
+        for kind, label, slug in typeahead_index.suggest(query):
+            if kind == "product":
+                url = reverse("shop:product-single", args=[slug])
+            else:
+                url = f"{reverse('shop:product-list')}?{urlencode({kind: slug})}"
+            results.append({"type": kind, "label": label, "url": url})
+        return JsonResponse({"query": query, "results": results})